@@ -0,0 +1,763 @@
+""":mod:`libearth.aiocrawler` --- Asynchronous crawler
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Crawl feeds on an :mod:`asyncio` event loop instead of threads.
+While :func:`libearth.crawler.crawl()` blocks a worker thread for each
+in-flight request, :func:`async_crawl()` can keep thousands of requests
+in flight on a single thread.  Only network I/O is asynchronous;
+the CPU-bound part (format detection and parsing) is shared with
+:mod:`libearth.crawler` through :func:`~libearth.crawler.parse_feed()`.
+
+It works on Python 3.4+ with :mod:`asyncio`, or on older Python versions
+with `Trollius`_ installed.  Since the module is written in callback style
+it doesn't require any coroutine syntax::
+
+    loop = asyncio.get_event_loop()
+    for future in async_crawl(feed_urls, concurrency=1000, loop=loop):
+        try:
+            result = loop.run_until_complete(future)
+        except CrawlError as e:
+            print(e.feed_uri, 'failed')
+        else:
+            print(result.feed.title)
+
+Or inside a coroutine::
+
+    for future in async_crawl(feed_urls, concurrency=1000):
+        try:
+            result = await future
+        except CrawlError:
+            continue
+
+.. _Trollius: https://pypi.python.org/pypi/trollius
+
+.. versionadded:: 0.4.0
+
+"""
+import collections
+import logging
+import socket
+import time
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+try:
+    import urllib.parse as urlparse
+except ImportError:
+    import urlparse
+
+from .crawler import (ACCEPT_ENCODING, CLIENT_FAILURE, DEFAULT_TIMEOUT,
+                      USER_AGENT, ContentDecoder, CrawlError, CrawlMetrics,
+                      CrawlPhase, CrawlResult, Validators, classify_error,
+                      find_icon_url, get_permanent_url, parse_feed,
+                      parse_feed_serialized)
+from .feed import Feed
+from .schema import read
+
+__all__ = ('DEFAULT_CONCURRENCY', 'MAX_REDIRECTS', 'HTTPClientProtocol',
+           'Response', 'async_crawl', 'fetch_feed', 'request')
+
+
+#: (:class:`numbers.Integral`) The default number of in-flight requests
+#: :func:`async_crawl()` makes.
+DEFAULT_CONCURRENCY = 256
+
+#: (:class:`numbers.Integral`) The maximum number of redirects to follow.
+MAX_REDIRECTS = 10
+
+#: (:class:`collections.Set`) HTTP status codes of redirects to follow.
+REDIRECT_CODES = frozenset([301, 302, 303, 307, 308])
+
+
+def ensure_future(coro_or_future, loop):
+    # asyncio.async() was renamed to asyncio.ensure_future() since 3.4.4,
+    # and async became a keyword since Python 3.7.
+    try:
+        function = asyncio.ensure_future
+    except AttributeError:
+        function = getattr(asyncio, 'async')
+    return function(coro_or_future, loop=loop)
+
+
+def chain(future, callback, loop):
+    """Make a new future which is resolved by ``callback`` when the given
+    ``future`` is done.  The ``callback`` takes the result of the ``future``
+    and returns a value or another future to wait.  Exceptions of
+    the ``future`` (or raised by the ``callback``) are propagated to
+    the new future.
+
+    .. note::
+
+       Internal function.
+
+    """
+    result = asyncio.Future(loop=loop)
+
+    def resolve(value_future):
+        if result.done():
+            return
+        elif value_future.cancelled():
+            result.cancel()
+        elif value_future.exception() is not None:
+            result.set_exception(value_future.exception())
+        else:
+            result.set_result(value_future.result())
+
+    def on_done(future):
+        if result.done():
+            return
+        elif future.cancelled():
+            result.cancel()
+            return
+        elif future.exception() is not None:
+            result.set_exception(future.exception())
+            return
+        try:
+            value = callback(future.result())
+        except Exception as e:
+            result.set_exception(e)
+            return
+        if isinstance(value, asyncio.Future):
+            value.add_done_callback(resolve)
+        else:
+            result.set_result(value)
+    future.add_done_callback(on_done)
+    return result
+
+
+class Response(object):
+    """The complete response of a request made by :func:`request()`.
+
+    :param url: the url of the response.  it's the last one if
+                the request was redirected
+    :type url: :class:`str`
+    :param status: the HTTP status code
+    :type status: :class:`numbers.Integral`
+    :param reason: the HTTP reason phrase
+    :type reason: :class:`str`
+    :param headers: the response headers.  keys are lowercased
+    :type headers: :class:`collections.Mapping`
+    :param body: the response body.  its ``Content-Encoding`` is
+                 already decoded
+    :type body: :class:`bytes`
+    :param wire_bytes: the number of bytes of the body transferred
+                       on the wire
+    :type wire_bytes: :class:`numbers.Integral`
+    :param redirects: the urls the request was redirected to, in order
+    :type redirects: :class:`collections.Sequence`
+    :param redirect_statuses: the status codes of the redirects to
+                              ``redirects``
+    :type redirect_statuses: :class:`collections.Sequence`
+
+    """
+
+    def __init__(self, url, status, reason, headers, body, wire_bytes=None,
+                 redirects=(), redirect_statuses=()):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.wire_bytes = len(body) if wire_bytes is None else wire_bytes
+        self.redirects = list(redirects)
+        self.redirect_statuses = list(redirect_statuses)
+
+    def __repr__(self):
+        return '<{0.__module__}.{0.__name__} {1} {2} {3!r}>'.format(
+            type(self), self.status, self.reason, self.url
+        )
+
+
+class HTTPClientProtocol(asyncio.Protocol if asyncio else object):
+    """Minimal HTTP/1.1 client protocol which sends a request and then
+    resolves the ``future`` with the :class:`Response`.  It understands
+    ``Content-Length`` and ``chunked`` transfer coding, and otherwise reads
+    the body until the server closes the connection.  Compressed bodies
+    are decoded chunk by chunk as they arrive.
+
+    :param url: the requested url
+    :type url: :class:`str`
+    :param request: the raw request message to send
+    :type request: :class:`bytes`
+    :param method: the request method
+    :type method: :class:`str`
+    :param future: the future to resolve with the :class:`Response`
+    :type future: :class:`asyncio.Future`
+
+    .. note::
+
+       This class is intended to be internal.  Use :func:`request()` instead.
+
+    """
+
+    def __init__(self, url, request, method, future):
+        self.url = url
+        self.request = request
+        self.method = method
+        self.future = future
+        self.transport = None
+        self.buffer = b''
+        self.state = 'status'
+        self.status = None
+        self.reason = None
+        self.headers = {}
+        self.body = []
+        self.decoder = None
+        self.wire_bytes = 0
+        self.remaining = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.write(self.request)
+
+    def data_received(self, data):
+        self.buffer += data
+        try:
+            while self.buffer and self.state != 'done':
+                if not getattr(self, 'read_' + self.state)():
+                    break
+        except Exception as e:
+            self.fail(e)
+
+    def eof_received(self):
+        if self.state == 'body_until_close':
+            self.read_body_until_close()
+            self.finish()
+
+    def connection_lost(self, exc):
+        if self.future.done():
+            return
+        elif self.state == 'body_until_close':
+            self.read_body_until_close()
+            self.finish()
+        else:
+            self.future.set_exception(
+                exc or IOError('connection closed before the response of {0} '
+                               'is completed'.format(self.url))
+            )
+
+    def read_line(self):
+        line, sep, rest = self.buffer.partition(b'\r\n')
+        if not sep:
+            return
+        self.buffer = rest
+        return line.decode('latin-1')
+
+    def read_status(self):
+        line = self.read_line()
+        if line is None:
+            return False
+        parts = line.split(' ', 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise IOError('invalid status line: ' + repr(line))
+        self.status = int(parts[1])
+        self.reason = parts[2] if len(parts) > 2 else ''
+        self.state = 'headers'
+        return True
+
+    def read_headers(self):
+        line = self.read_line()
+        if line is None:
+            return False
+        elif line:
+            name, _, value = line.partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            if name in self.headers:
+                value = self.headers[name] + ', ' + value
+            self.headers[name] = value
+            return True
+        self.decoder = ContentDecoder(self.headers.get('content-encoding'))
+        if self.status == 100:
+            self.status = self.reason = None
+            self.headers = {}
+            self.state = 'status'
+        elif (self.method == 'HEAD' or self.status in (204, 304) or
+              100 <= self.status < 200):
+            self.finish()
+        elif 'chunked' in self.headers.get('transfer-encoding', '').lower():
+            self.state = 'chunk_size'
+        elif 'content-length' in self.headers:
+            self.remaining = int(self.headers['content-length'])
+            self.state = 'body'
+            if not self.remaining:
+                self.finish()
+        else:
+            self.state = 'body_until_close'
+        return True
+
+    def feed_body(self, chunk):
+        self.wire_bytes += len(chunk)
+        self.body.append(self.decoder.decode(chunk))
+
+    def read_body(self):
+        chunk = self.buffer[:self.remaining]
+        self.buffer = self.buffer[self.remaining:]
+        self.feed_body(chunk)
+        self.remaining -= len(chunk)
+        if not self.remaining:
+            self.finish()
+        return True
+
+    def read_body_until_close(self):
+        self.feed_body(self.buffer)
+        self.buffer = b''
+        return True
+
+    def read_chunk_size(self):
+        line = self.read_line()
+        if line is None:
+            return False
+        size = int(line.split(';', 1)[0].strip(), 16)
+        if size:
+            self.remaining = size
+            self.state = 'chunk'
+        else:
+            self.finish()
+        return True
+
+    def read_chunk(self):
+        if len(self.buffer) < self.remaining + 2:
+            return False
+        self.feed_body(self.buffer[:self.remaining])
+        self.buffer = self.buffer[self.remaining + 2:]
+        self.state = 'chunk_size'
+        return True
+
+    def finish(self):
+        self.state = 'done'
+        if self.transport is not None:
+            self.transport.close()
+        if self.future.done():
+            return
+        try:
+            if self.decoder is not None:
+                self.body.append(self.decoder.flush())
+        except Exception as e:
+            self.future.set_exception(e)
+            return
+        self.future.set_result(
+            Response(self.url, self.status, self.reason, self.headers,
+                     b''.join(self.body), self.wire_bytes)
+        )
+
+    def fail(self, exception):
+        self.state = 'done'
+        if self.transport is not None:
+            self.transport.close()
+        if not self.future.done():
+            self.future.set_exception(exception)
+
+
+def request(url, method='GET', headers=None, timeout=DEFAULT_TIMEOUT,
+            loop=None, redirects=MAX_REDIRECTS):
+    """Make a non-blocking HTTP request.  Redirects are followed.
+
+    :param url: the url to request
+    :type url: :class:`str`
+    :param method: the request method.  ``'GET'`` by default
+    :type method: :class:`str`
+    :param headers: optional extra request headers
+    :type headers: :class:`collections.Mapping`
+    :param timeout: the timeout in seconds for the whole request.
+                    :const:`~libearth.crawler.DEFAULT_TIMEOUT` by default
+    :type timeout: :class:`numbers.Real`
+    :param loop: an optional event loop to use
+    :type loop: :class:`asyncio.AbstractEventLoop`
+    :param redirects: the maximum number of redirects to follow.
+                      :const:`MAX_REDIRECTS` by default
+    :type redirects: :class:`numbers.Integral`
+    :returns: a future of the :class:`Response`
+    :rtype: :class:`asyncio.Future`
+
+    """
+    if asyncio is None:
+        raise RuntimeError('asyncio (or trollius) is required')
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    parsed = urlparse.urlsplit(url)
+    if parsed.scheme not in ('http', 'https'):
+        raise ValueError('unsupported url scheme: ' + repr(url))
+    host = parsed.hostname
+    port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+    path = parsed.path or '/'
+    if parsed.query:
+        path += '?' + parsed.query
+    request_headers = [
+        ('Host', parsed.netloc.rpartition('@')[2]),
+        ('User-Agent', USER_AGENT),
+        ('Accept-Encoding', ACCEPT_ENCODING),
+        ('Connection', 'close')
+    ]
+    if headers:
+        overridden = frozenset(name.lower() for name in headers)
+        request_headers = [pair for pair in request_headers
+                           if pair[0].lower() not in overridden]
+        request_headers.extend(headers.items())
+    message = ['{0} {1} HTTP/1.1\r\n'.format(method, path)]
+    message.extend('{0}: {1}\r\n'.format(*pair) for pair in request_headers)
+    message.append('\r\n')
+    message = ''.join(message).encode('latin-1')
+    future = asyncio.Future(loop=loop)
+    connection = ensure_future(
+        loop.create_connection(
+            lambda: HTTPClientProtocol(url, message, method, future),
+            host, port, ssl=parsed.scheme == 'https'
+        ),
+        loop=loop
+    )
+
+    def on_connected(connection):
+        if connection.cancelled():
+            future.cancel()
+        elif connection.exception() is not None and not future.done():
+            future.set_exception(connection.exception())
+
+    def on_timeout():
+        if future.done():
+            return
+        connection.cancel()
+        future.set_exception(
+            socket.timeout('{0} timed out'.format(url))
+        )
+
+    def on_done(_):
+        timer.cancel()
+        if not connection.done():
+            connection.cancel()
+        elif (not connection.cancelled() and
+              connection.exception() is None):
+            transport, _ = connection.result()
+            transport.close()
+
+    connection.add_done_callback(on_connected)
+    timer = loop.call_later(timeout, on_timeout)
+    future.add_done_callback(on_done)
+
+    def follow(response):
+        location = response.headers.get('location')
+        if response.status not in REDIRECT_CODES or not location:
+            return response
+        elif redirects < 1:
+            raise IOError('too many redirects: ' + url)
+        next_method = 'GET' if response.status == 303 else method
+        next_url = urlparse.urljoin(url, location)
+        redirected = request(next_url, next_method,
+                             headers=headers, timeout=timeout, loop=loop,
+                             redirects=redirects - 1)
+
+        def prepend(redirected_response):
+            redirected_response.redirects.insert(0, next_url)
+            redirected_response.redirect_statuses.insert(0, response.status)
+            return redirected_response
+        return chain(redirected, prepend, loop)
+    return chain(future, follow, loop)
+
+
+def fetch_feed(feed_url, timeout=DEFAULT_TIMEOUT, validator_store=None,
+               icon_cache=None, resolve_icon=True, scheduler=None,
+               parse_pool=None, loop=None):
+    """Asynchronous version of :func:`libearth.crawler.get_feed()`.
+
+    :param feed_url: the url of the feed to crawl
+    :type feed_url: :class:`str`
+    :param timeout: optional timeout for each request.
+                    :const:`~libearth.crawler.DEFAULT_TIMEOUT` by default
+    :type timeout: :class:`numbers.Real`
+    :param validator_store: an optional store of cache validators
+    :type validator_store: :class:`~libearth.crawler.ValidatorStore`
+    :param icon_cache: an optional cache of favicon urls
+    :type icon_cache: :class:`~libearth.crawler.IconCache`
+    :param resolve_icon: whether to discover the favicon over the network
+                         if it isn't cached.  :const:`True` by default
+    :type resolve_icon: :class:`bool`
+    :param scheduler: an optional scheduler to update
+    :type scheduler: :class:`~libearth.scheduler.Scheduler`
+    :param parse_pool: an optional process pool to parse the feed in.
+                       the event loop isn't blocked by parsing then.
+                       see also :func:`libearth.crawler.get_feed()`
+    :type parse_pool: :class:`multiprocessing.pool.Pool`
+    :param loop: an optional event loop to use
+    :type loop: :class:`asyncio.AbstractEventLoop`
+    :returns: a future of the :class:`~libearth.crawler.CrawlResult`.
+              it raises :exc:`~libearth.crawler.CrawlError` when
+              crawling goes wrong
+    :rtype: :class:`asyncio.Future`
+
+    """
+    logger = logging.getLogger(__name__ + '.fetch_feed')
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    headers = {}
+    validators = None
+    if validator_store is not None:
+        validators = validator_store.get(feed_url)
+        if validators is not None:
+            if validators.etag:
+                headers['If-None-Match'] = validators.etag
+            if validators.last_modified:
+                headers['If-Modified-Since'] = validators.last_modified
+    state = {}
+    metrics = CrawlMetrics(feed_url)
+    started_at = time.time()
+
+    def on_feed(response):
+        metrics.phases.append(
+            CrawlPhase('request', time.time() - started_at,
+                       response.wire_bytes)
+        )
+        metrics.status = response.status
+        metrics.redirects = response.redirects
+        permanent_url = get_permanent_url(response.redirects,
+                                          response.redirect_statuses)
+        if response.status == 304:
+            logger.debug('%s: not modified', feed_url)
+            return CrawlResult(feed_url, None, None, not_modified=True,
+                               headers=response.headers, metrics=metrics,
+                               final_url=response.url,
+                               permanent_url=permanent_url)
+        elif response.status >= 400:
+            raise IOError('HTTP Error {0}: {1}'.format(response.status,
+                                                       response.reason))
+        state['response'] = response
+        if validator_store is not None:
+            state['validators'] = Validators.from_headers(
+                feed_url, response.headers, response.body
+            )
+            if (validators is not None and
+                    validators.digest == state['validators'].digest):
+                logger.debug('%s: unchanged', feed_url)
+                return CrawlResult(feed_url, None, None, unchanged=True,
+                                   wire_bytes=response.wire_bytes,
+                                   decoded_bytes=len(response.body),
+                                   headers=response.headers,
+                                   metrics=metrics, final_url=response.url,
+                                   permanent_url=permanent_url)
+        mimetype = response.headers.get('content-type')
+        if parse_pool is None:
+            return on_parsed(parse_feed(feed_url, response.body, mimetype,
+                                        metrics=metrics))
+        state['dispatched_at'] = time.time()
+        parsed = loop.run_in_executor(
+            None, parse_pool.apply, parse_feed_serialized,
+            (feed_url, response.body, mimetype)
+        )
+        return chain(parsed, on_parsed, loop)
+
+    def on_parsed(parsed):
+        if parse_pool is None:
+            feed, hints = parsed
+        else:
+            serialized, hints, phases = parsed
+            metrics.phases.append(
+                CrawlPhase('dispatch', time.time() - state['dispatched_at'],
+                           len(serialized))
+            )
+            metrics.phases.extend(phases)
+            feed = read(Feed, [serialized])
+        state.update(feed=feed, hints=hints)
+        favicon = feed.links.favicon
+        if favicon is not None:
+            return favicon.uri
+        permalink = feed.links.permalink
+        if not permalink:
+            return
+        if icon_cache is not None:
+            try:
+                return icon_cache.get(permalink.uri)
+            except KeyError:
+                pass
+        if not resolve_icon:
+            return
+        state['permalink'] = permalink.uri
+        state['favicon_started_at'] = time.time()
+        page = request(permalink.uri, timeout=timeout, loop=loop)
+        return chain(page, on_page, loop)
+
+    def on_page(response):
+        if response.status == 200:
+            icon_url = find_icon_url(state['permalink'], response.body,
+                                     response.headers.get('content-type'))
+            if icon_url:
+                return icon_url
+        icon_url = urlparse.urljoin(state['permalink'], '/favicon.ico')
+        head = request(icon_url, 'HEAD', timeout=timeout, loop=loop)
+        return chain(head, lambda r: icon_url if r.status == 200 else None,
+                     loop)
+
+    def on_icon(icon_url):
+        if isinstance(icon_url, CrawlResult):  # unchanged
+            if 'validators' in state:
+                validator_store.set(feed_url, state['validators'])
+            if scheduler is not None:
+                scheduler.update(icon_url)
+            return icon_url
+        elif 'favicon_started_at' in state:
+            metrics.phases.append(
+                CrawlPhase('favicon', time.time() - state['favicon_started_at'])
+            )
+            if icon_cache is not None:
+                icon_cache.set(state['permalink'], icon_url)
+        if 'validators' in state:
+            validator_store.set(feed_url, state['validators'])
+        response = state['response']
+        crawl_result = CrawlResult(
+            feed_url, state['feed'], state['hints'], icon_url,
+            wire_bytes=response.wire_bytes,
+            decoded_bytes=len(response.body),
+            headers=response.headers,
+            metrics=metrics,
+            final_url=response.url,
+            permanent_url=get_permanent_url(response.redirects,
+                                            response.redirect_statuses)
+        )
+        if scheduler is not None:
+            scheduler.update(crawl_result)
+        return crawl_result
+
+    def on_result(future):
+        if future.cancelled():
+            result.cancel()
+            return
+        error = future.exception()
+        if error is None:
+            result.set_result(future.result())
+            return
+        elif 'permalink' in state:
+            # The feed is parsed, but favicon discovery failed.  It must not
+            # fail the whole crawl.
+            logger.debug('%s: failed to discover favicon: %s', feed_url, error)
+            result.set_result(on_icon(None))
+            return
+        logger.error('%s: %s', feed_url, error)
+        if not isinstance(error, CrawlError):
+            error = CrawlError(feed_url,
+                               '{0} failed: {1}'.format(feed_url, error),
+                               kind=classify_error(error, metrics.status))
+        error.metrics = metrics
+        result.set_exception(error)
+
+    result = asyncio.Future(loop=loop)
+    try:
+        response = request(feed_url, headers=headers, timeout=timeout,
+                           loop=loop)
+    except Exception as e:
+        # The url itself is invalid e.g. unsupported scheme
+        result.set_exception(
+            CrawlError(feed_url, '{0} failed: {1}'.format(feed_url, e),
+                       kind=CLIENT_FAILURE)
+        )
+        return result
+    chain(chain(response, on_feed, loop), on_icon, loop).add_done_callback(
+        on_result
+    )
+    return result
+
+
+class async_crawl(collections.Iterable):
+    """Crawl feeds on the event loop, keeping at most ``concurrency``
+    requests in flight.  It's an asynchronous version of
+    :func:`libearth.crawler.crawl()`.
+
+    It returns an iterable of futures *in completion order*, like
+    :func:`asyncio.as_completed()`: the first future is resolved by
+    the first finished crawl, the second by the second finished, and so on.
+    Each future results in a :class:`~libearth.crawler.CrawlResult`, or
+    raises :exc:`~libearth.crawler.CrawlError`.
+
+    :param feed_urls: feed urls to crawl
+    :type feed_urls: :class:`collections.Iterable`
+    :param concurrency: the maximum number of in-flight crawls.
+                        :const:`DEFAULT_CONCURRENCY` by default
+    :type concurrency: :class:`numbers.Integral`
+    :param timeout: optional timeout for each request.
+                    :const:`~libearth.crawler.DEFAULT_TIMEOUT` by default
+    :type timeout: :class:`numbers.Real`
+    :param validator_store: an optional store of cache validators to make
+                            conditional requests
+    :type validator_store: :class:`~libearth.crawler.ValidatorStore`
+    :param icon_cache: an optional cache of favicon urls
+    :type icon_cache: :class:`~libearth.crawler.IconCache`
+    :param resolve_icon: whether to discover favicons over the network
+                         if they aren't cached.  :const:`True` by default
+    :type resolve_icon: :class:`bool`
+    :param scheduler: an optional scheduler.  if it's present only feeds
+                      that are due are crawled, and then their next due
+                      times are updated
+    :type scheduler: :class:`~libearth.scheduler.Scheduler`
+    :param parse_pool: an optional process pool to parse feeds in
+    :type parse_pool: :class:`multiprocessing.pool.Pool`
+    :param loop: an optional event loop to use
+    :type loop: :class:`asyncio.AbstractEventLoop`
+    :returns: futures of :class:`~libearth.crawler.CrawlResult` objects
+    :rtype: :class:`collections.Iterable`
+
+    """
+
+    def __init__(self, feed_urls, concurrency=DEFAULT_CONCURRENCY,
+                 timeout=DEFAULT_TIMEOUT, validator_store=None,
+                 icon_cache=None, resolve_icon=True, scheduler=None,
+                 parse_pool=None, loop=None):
+        if asyncio is None:
+            raise RuntimeError('asyncio (or trollius) is required')
+        elif concurrency < 1:
+            raise ValueError('concurrency must be greater than zero')
+        self.loop = loop or asyncio.get_event_loop()
+        self.concurrency = concurrency
+        self.options = {
+            'timeout': timeout,
+            'validator_store': validator_store,
+            'icon_cache': icon_cache,
+            'resolve_icon': resolve_icon,
+            'scheduler': scheduler,
+            'parse_pool': parse_pool
+        }
+        if scheduler is not None:
+            feed_urls = scheduler.due(feed_urls)
+        self.queue = collections.deque(feed_urls)
+        self.futures = [asyncio.Future(loop=self.loop)
+                        for _ in self.queue]
+        self.completed = 0
+        self.in_flight = 0
+        for _ in range(min(concurrency, len(self.queue))):
+            self.start_next()
+
+    def start_next(self):
+        while self.queue:
+            url = self.queue.popleft()
+            try:
+                future = fetch_feed(url, loop=self.loop, **self.options)
+            except Exception as e:
+                # e.g. the validator store failed.  Fail only its output
+                # future, and move on to the next feed; otherwise the rest
+                # of futures would never be done.
+                if not isinstance(e, CrawlError):
+                    e = CrawlError(url, '{0} failed: {1}'.format(url, e),
+                                   kind=classify_error(e))
+                output = self.futures[self.completed]
+                self.completed += 1
+                output.set_exception(e)
+                continue
+            self.in_flight += 1
+            future.add_done_callback(self.on_done)
+            break
+
+    def on_done(self, future):
+        self.in_flight -= 1
+        output = self.futures[self.completed]
+        self.completed += 1
+        if future.cancelled():
+            output.cancel()
+        elif future.exception() is not None:
+            output.set_exception(future.exception())
+        else:
+            output.set_result(future.result())
+        self.start_next()
+
+    def __iter__(self):
+        return iter(self.futures)
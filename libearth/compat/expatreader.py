@@ -0,0 +1,205 @@
+""":mod:`libearth.compat.expatreader` --- Direct expat driver for pulling parser
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+:class:`~libearth.compat.xmlpullreader.PullReader` implementation which
+drives :mod:`pyexpat <xml.parsers.expat>` directly.  The stock
+:mod:`xml.sax.expatreader` driver routes every event through several
+Python adapter layers; this driver instead lets expat split namespaces
+natively, buffers character data, and interns tag and attribute names
+so that each distinct name is split into a (namespace, name) pair
+only once per document.
+
+It's the default entry of :data:`libearth.schema.PARSER_LIST` on
+CPython and PyPy.
+
+.. versionadded:: 0.4.0
+
+"""
+import xml.sax
+import xml.sax.handler
+import xml.sax.xmlreader
+
+try:
+    from xml.parsers import expat
+except ImportError:
+    raise xml.sax.SAXReaderNotAvailable('expat is not available', None)
+
+from .xmlpullreader import PullReader
+
+__all__ = 'BUFFER_SIZE', 'ExpatReader', 'create_parser'
+
+
+#: (:class:`numbers.Integral`) The size of the character data buffer
+#: in bytes.
+BUFFER_SIZE = 64 * 1024
+
+#: The empty attributes shared by all elements without attributes.
+EMPTY_ATTRIBUTES = xml.sax.xmlreader.AttributesNSImpl({}, {})
+
+
+def create_parser():
+    """Create a new :class:`ExpatReader()` parser instance.
+
+    :returns: a new parser instance
+    :rtype: :class:`ExpatReader`
+
+    """
+    return ExpatReader()
+
+
+class ExpatReader(PullReader, xml.sax.xmlreader.Locator):
+    """SAX :class:`~libearth.compat.xmlpullreader.PullReader`
+    implementation using :mod:`pyexpat <xml.parsers.expat>` directly.
+    Each :meth:`feed()` call parses the next chunk of the iterable.
+
+    Namespace processing is always turned on, and only
+    :meth:`~xml.sax.handler.ContentHandler.startElementNS()`,
+    :meth:`~xml.sax.handler.ContentHandler.endElementNS()`, and
+    :meth:`~xml.sax.handler.ContentHandler.characters()` events are
+    emitted besides the start and end of the document.
+
+    """
+
+    def __init__(self):
+        PullReader.__init__(self)
+        self.parser = None
+        self.iterator = None
+        self.names = {}
+
+    def prepareParser(self, iterable):
+        self.reset()
+        self.iterator = iter(iterable)
+
+    def reset(self):
+        parser = expat.ParserCreate(namespace_separator=' ', intern={})
+        parser.buffer_text = True
+        parser.buffer_size = BUFFER_SIZE
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        self.parser = parser
+        self.names = {}
+        self.started = False
+        self.bind(self.getContentHandler())
+
+    def bind(self, handler):
+        # Look up bound methods of the handler once instead of every event
+        self.start_element_ns = handler.startElementNS
+        self.end_element_ns = handler.endElementNS
+        if self.parser is not None:
+            self.parser.CharacterDataHandler = handler.characters
+
+    def split_name(self, name):
+        try:
+            return self.names[name]
+        except KeyError:
+            pair = name.split(' ')
+            pair = tuple(pair) if len(pair) > 1 else (None, name)
+            self.names[name] = pair
+            return pair
+
+    def start_element(self, name, attrs):
+        names = self.names
+        try:
+            tag = names[name]
+        except KeyError:
+            tag = self.split_name(name)
+        if attrs:
+            pairs = {}
+            for attr_name, value in attrs.items():
+                try:
+                    pairs[names[attr_name]] = value
+                except KeyError:
+                    pairs[self.split_name(attr_name)] = value
+            attrs = xml.sax.xmlreader.AttributesNSImpl(pairs, {})
+        else:
+            attrs = EMPTY_ATTRIBUTES
+        self.start_element_ns(tag, None, attrs)
+
+    def end_element(self, name):
+        try:
+            tag = self.names[name]
+        except KeyError:
+            tag = self.split_name(name)
+        self.end_element_ns(tag, None)
+
+    def parse(self, data, is_final=False):
+        if not self.started:
+            self.started = True
+            handler = self.getContentHandler()
+            handler.setDocumentLocator(self)
+            handler.startDocument()
+        try:
+            self.parser.Parse(data, is_final)
+        except expat.ExpatError as e:
+            error = xml.sax.SAXParseException(expat.ErrorString(e.code),
+                                              e, self)
+            self.getErrorHandler().fatalError(error)
+
+    def feed(self):
+        try:
+            chunk = next(self.iterator)
+        except StopIteration:
+            return False
+        self.parse(chunk)
+        return True
+
+    def close(self):
+        if self.parser is None:
+            return
+        try:
+            self.parse(b'', True)
+            self.getContentHandler().endDocument()
+        finally:
+            parser = self.parser
+            parser.StartElementHandler = None
+            parser.EndElementHandler = None
+            parser.CharacterDataHandler = None
+            self.parser = None
+            self.iterator = None
+
+    def setContentHandler(self, handler):
+        PullReader.setContentHandler(self, handler)
+        self.bind(handler)
+
+    def getFeature(self, name):
+        if name == xml.sax.handler.feature_namespaces:
+            return True
+        return PullReader.getFeature(self, name)
+
+    def setFeature(self, name, state):
+        if name == xml.sax.handler.feature_namespaces:
+            if not state:
+                raise xml.sax.SAXNotSupportedException(
+                    'namespace processing cannot be turned off'
+                )
+            return
+        PullReader.setFeature(self, name, state)
+
+    def getColumnNumber(self):
+        if self.parser is None:
+            return
+        return self.parser.ErrorColumnNumber
+
+    def getLineNumber(self):
+        if self.parser is None:
+            return 1
+        return self.parser.ErrorLineNumber
+
+    def getByteIndex(self):
+        """Get the byte offset of the current event from the start of
+        the whole input.  It's an extension to the standard
+        :class:`~xml.sax.xmlreader.Locator` interface.
+
+        :returns: the byte offset, or :const:`None` if it's not parsing
+        :rtype: :class:`numbers.Integral`
+
+        """
+        if self.parser is None:
+            return
+        return self.parser.CurrentByteIndex
+
+    def getPublicId(self):
+        return
+
+    def getSystemId(self):
+        return
@@ -8,38 +8,123 @@
    :returns: the number of cpu cores
    :rtype: :class:`numbers.Integral`
 
-.. function:: parallel_map(pool_size, function, iterable, *iterables)
+.. function:: parallel_map(pool_size, function, iterable, *iterables, \
+                          ordered=False, max_in_flight=None, timeout=None)
 
    Parallel vesion of builtin :func:`map()` except of some differences:
 
    - It takes a more argument at first: ``pool_size``.
    - The function applications will be done in parallel.
-   - The order of arguments to results are not maintained.
-     You should treat these as a set.
+   - The order of arguments to results are not maintained unless
+     ``ordered`` is :const:`True`.  You should treat these as a set.
    - The result is a lazy iterable.  Although the function immediately returns
      an iterable, it might block if some results are not completely ready
      when it's iterated.
 
+   By default all arguments are submitted to workers at once.  If
+   ``max_in_flight`` is present, no more than that many applications are
+   submitted at a time, and the next arguments are taken from
+   ``iterable`` as results are iterated, so that huge (or infinite)
+   generators aren't materialized.
+
+   If ``timeout`` is present, an application which doesn't finish in that
+   many seconds since it started is given up, and counted as an error of
+   :exc:`multiprocessing.TimeoutError`.  Note that its worker thread can't
+   be interrupted, so it keeps running in the background.
+
+   The returned iterable has :meth:`cancel()` method, which stops
+   the iteration and prevents applications that aren't started yet from
+   being started.  Applications already running are not interrupted.
+
    :param pool_size: the number of workers
    :type pool_size: :class:`numbers.Integral`
    :param function: the function to apply iterables as its arguments
    :type function: :class:`collections.Callable`
    :param iterable: function argument values
    :type iterable: :class:`collections.Iterable`
+   :param ordered: whether to yield results in the order of arguments.
+                   :const:`False` by default
+   :type ordered: :class:`bool`
+   :param max_in_flight: the maximum number of applications submitted
+                         at a time.  unbounded by default
+   :type max_in_flight: :class:`numbers.Integral`
+   :param timeout: the number of seconds to give up an application
+   :type timeout: :class:`numbers.Real`
+   :param executor: an optional long-lived executor to run applications
+                    on instead of a new pool of ``pool_size`` workers.
+                    no more than ``pool_size`` applications are submitted
+                    to it at a time
+   :type executor: :class:`SharedExecutor`
    :returns: a promise iterable to future results
    :rtype: :class:`collections.Iterable`
 
    .. versionchanged:: 0.1.1
       Errored values are raised at the lastest.
 
+   .. versionadded:: 0.4.0
+      Optional ``ordered``, ``max_in_flight``, ``timeout`` and ``executor``
+      parameters, and :meth:`cancel()` method.  They aren't available on
+      IronPython.
+
+.. function:: process_map(pool_size, function, iterable, *iterables, \
+                          ordered=False, chunksize=1)
+
+   Process-based version of :func:`parallel_map()` for CPU-bound jobs
+   e.g. parsing or merging many stored feeds, which threads can't
+   run in parallel due to the GIL.  Errors are collected in the same way:
+   results of successful applications are yielded first, and then
+   the first error is raised at the lastest.
+
+   Since applications are run by other processes, the ``function``,
+   arguments, return values and raised exceptions have to be picklable.
+   So the ``function`` has to be defined at the top level of a module;
+   lambdas and nested functions can't be used.  Tracebacks of errors
+   don't survive the process boundary.
+
+   Every shipment to a worker process has its overhead, so for many
+   small applications pass larger ``chunksize`` to ship that many
+   arguments at a time.
+
+   :param pool_size: the number of worker processes
+   :type pool_size: :class:`numbers.Integral`
+   :param function: the picklable function to apply iterables as its
+                    arguments
+   :type function: :class:`collections.Callable`
+   :param iterable: function argument values
+   :type iterable: :class:`collections.Iterable`
+   :param ordered: whether to yield results in the order of arguments.
+                   :const:`False` by default
+   :type ordered: :class:`bool`
+   :param chunksize: the number of arguments to ship to a worker process
+                     at a time.  1 by default
+   :type chunksize: :class:`numbers.Integral`
+   :returns: a promise iterable to future results
+   :rtype: :class:`collections.Iterable`
+   :raises TypeError: when the ``function`` isn't picklable
+   :raises NotImplementedError: on IronPython
+
+   .. versionadded:: 0.4.0
+
 """
 import collections
+import itertools
 import numbers
+import pickle
 import sys
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 from . import IRON_PYTHON, PY3, xrange
 
-__all__ = 'cpu_count', 'parallel_map'
+__all__ = 'SharedExecutor', 'cpu_count', 'parallel_map', 'process_map'
+
+
+izip = zip if PY3 else itertools.izip
 
 
 if IRON_PYTHON:
@@ -60,100 +145,125 @@ else:
 try:
     from concurrent.futures import ThreadPoolExecutor
 except ImportError:
-    if IRON_PYTHON:
-        from System import Action
-        from System.Collections.Concurrent import BlockingCollection
-        from System.Collections.Generic import IEnumerable
-        from System.Threading import Thread, ThreadStart
-        from System.Threading.Tasks import Parallel, ParallelOptions
-
-        class parallel_map(collections.Iterable):
-
-            ForEach = Parallel.ForEach[object].Overloads[
-                IEnumerable[object],
-                ParallelOptions,
-                Action[object]
-            ]
-
-            def __init__(self, pool_size, function, *iterables):
-                if not isinstance(pool_size, numbers.Integral):
-                    raise TypeError('pool_size must be an integer, not ' +
-                                    repr(pool_size))
-                elif not callable(function):
-                    raise TypeError('function must be callable, not ' +
-                                    repr(function))
-                elif not iterables:
-                    raise TypeError('missing iterable')
-                self.function = function
-                self.results = BlockingCollection[tuple]()
-                args = zip(*iterables)
-                self.length = len(args)
-                options = ParallelOptions()
-                options.MaxDegreeOfParallelism = pool_size
-                Thread.__new__.Overloads[ThreadStart](
-                    Thread,
-                    lambda: self.ForEach(args, options, self.store_result)
-                ).Start()
-
-            def store_result(self, args):
-                try:
-                    value = self.function(*args)
-                except Exception as e:
-                    result = None, e
+    ThreadPoolExecutor = None
+if not IRON_PYTHON:
+    from multiprocessing.pool import ThreadPool
+
+
+class SharedExecutor(object):
+    """Long-lived pool of worker threads which many :func:`parallel_map()`
+    calls can share, so that every call doesn't spawn and join its own
+    threads::
+
+        executor = SharedExecutor(32)
+        while True:
+            for result in crawl(feed_urls, 16, executor=executor):
+                ...
+            time.sleep(60)
+
+    Threads are started on the first submission, and kept until
+    :meth:`shutdown()` is called.  It can be used as a context manager
+    as well, which shuts it down on exit.
+
+    :param max_workers: the number of worker threads
+    :type max_workers: :class:`numbers.Integral`
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    #: (:class:`numbers.Integral`) The number of worker threads.
+    max_workers = None
+
+    def __init__(self, max_workers):
+        if not isinstance(max_workers, numbers.Integral):
+            raise TypeError('max_workers must be an integer, not ' +
+                            repr(max_workers))
+        elif max_workers < 1:
+            raise ValueError('max_workers must be greater than zero')
+        elif ThreadPoolExecutor is None and IRON_PYTHON:
+            raise NotImplementedError('SharedExecutor is unavailable on '
+                                      'IronPython')
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.pool = None
+        self.closed = False
+
+    @property
+    def started(self):
+        """(:class:`bool`) Whether its worker threads are started."""
+        return self.pool is not None
+
+    def submit(self, function, *args):
+        """Schedule the ``function`` to be called with ``args`` by one of
+        worker threads.  Its return value is discarded.
+
+        :param function: the function to call
+        :type function: :class:`collections.Callable`
+        :raises RuntimeError: if it's already shut down
+
+        """
+        with self.lock:
+            if self.closed:
+                raise RuntimeError('cannot submit after shutdown')
+            elif self.pool is None:
+                if ThreadPoolExecutor is None:
+                    self.pool = ThreadPool(self.max_workers)
                 else:
-                    result = value, None
-                self.results.Add(result)
-
-            def __iter__(self):
-                errors = []
-                for _ in xrange(self.length):
-                    value, error = self.results.Take()
-                    if error is None:
-                        yield value
-                    else:
-                        errors.append(error)
-                for error in errors:
-                    raise error
-    else:
-        from multiprocessing.pool import ThreadPool
-
-        class parallel_map(collections.Iterable):
-
-            def __init__(self, pool_size, function, *iterables):
-                if not isinstance(pool_size, numbers.Integral):
-                    raise TypeError('pool_size must be an integer, not ' +
-                                    repr(pool_size))
-                elif not callable(function):
-                    raise TypeError('function must be callable, not ' +
-                                    repr(function))
-                elif not iterables:
-                    raise TypeError('missing iterable')
-                self.pool = ThreadPool(pool_size)
-                self.function = function
-                self.results = self.pool.imap_unordered(self.map_function,
-                                                        zip(*iterables))
-
-            def map_function(self, args):
-                try:
-                    value = self.function(*args)
-                except Exception:
-                    return False, sys.exc_info()
-                return True, value
-
-            def __iter__(self):
-                errors = []
-                for success, value in self.results:
-                    if success:
-                        yield value
-                    else:
-                        errors.append(value)
-                self.pool.close()
-                self.pool.join()
-                for error in errors:
-                    exec('raise error[1], None, error[2]')
-else:
+                    self.pool = ThreadPoolExecutor(self.max_workers)
+            pool = self.pool
+        if hasattr(pool, 'apply_async'):
+            pool.apply_async(function, args)
+        else:
+            pool.submit(function, *args)
+
+    def shutdown(self, wait=True):
+        """Stop worker threads after already submitted calls are done.
+        No more calls can be submitted.
+
+        :param wait: whether to block until worker threads exit.
+                     :const:`True` by default
+        :type wait: :class:`bool`
+
+        """
+        with self.lock:
+            self.closed = True
+            pool = self.pool
+        if pool is None:
+            return
+        elif hasattr(pool, 'apply_async'):
+            pool.close()
+            if wait:
+                pool.join()
+        else:
+            pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def __repr__(self):
+        return '{0.__module__}.{0.__name__}({1!r})'.format(type(self),
+                                                           self.max_workers)
+
+
+if ThreadPoolExecutor is None and IRON_PYTHON:
+    from System import Action
+    from System.Collections.Concurrent import BlockingCollection
+    from System.Collections.Generic import IEnumerable
+    from System.Threading import Thread, ThreadStart
+    from System.Threading.Tasks import Parallel, ParallelOptions
+
     class parallel_map(collections.Iterable):
 
+        ForEach = Parallel.ForEach[object].Overloads[
+            IEnumerable[object],
+            ParallelOptions,
+            Action[object]
+        ]
+
         def __init__(self, pool_size, function, *iterables):
             if not isinstance(pool_size, numbers.Integral):
                 raise TypeError('pool_size must be an integer, not ' +
@@ -163,28 +273,253 @@ else:
                                 repr(function))
             elif not iterables:
                 raise TypeError('missing iterable')
-            self.pool = ThreadPoolExecutor(pool_size)
             self.function = function
-            self.results = self.pool.map(self.map_function, *iterables)
+            self.results = BlockingCollection[tuple]()
+            args = zip(*iterables)
+            self.length = len(args)
+            options = ParallelOptions()
+            options.MaxDegreeOfParallelism = pool_size
+            Thread.__new__.Overloads[ThreadStart](
+                Thread,
+                lambda: self.ForEach(args, options, self.store_result)
+            ).Start()
 
-        def map_function(self, *args):
+        def store_result(self, args):
             try:
                 value = self.function(*args)
-            except Exception:
-                return False, sys.exc_info()
-            return True, value
+            except Exception as e:
+                result = None, e
+            else:
+                result = value, None
+            self.results.Add(result)
 
         def __iter__(self):
             errors = []
-            for success, value in self.results:
-                if success:
+            for _ in xrange(self.length):
+                value, error = self.results.Take()
+                if error is None:
                     yield value
                 else:
+                    errors.append(error)
+            for error in errors:
+                raise error
+else:
+    class parallel_map(collections.Iterable):
+
+        def __init__(self, pool_size, function, *iterables, **options):
+            ordered = options.pop('ordered', False)
+            max_in_flight = options.pop('max_in_flight', None)
+            timeout = options.pop('timeout', None)
+            executor = options.pop('executor', None)
+            if options:
+                raise TypeError('unexpected keyword arguments: ' +
+                                ', '.join(sorted(options)))
+            elif not isinstance(pool_size, numbers.Integral):
+                raise TypeError('pool_size must be an integer, not ' +
+                                repr(pool_size))
+            elif not callable(function):
+                raise TypeError('function must be callable, not ' +
+                                repr(function))
+            elif not iterables:
+                raise TypeError('missing iterable')
+            elif max_in_flight is not None and max_in_flight < 1:
+                raise ValueError('max_in_flight must be greater than zero')
+            elif not (executor is None or
+                      isinstance(executor, SharedExecutor)):
+                raise TypeError(
+                    'executor must be an instance of {0.__module__}.'
+                    '{0.__name__}, not {1!r}'.format(SharedExecutor, executor)
+                )
+            self.shared = executor is not None
+            if self.shared:
+                # Keep the share of this call within pool_size
+                max_in_flight = min(max_in_flight or pool_size, pool_size)
+                self.executor = executor
+            else:
+                self.executor = SharedExecutor(pool_size)
+            self.function = function
+            self.ordered = ordered
+            self.max_in_flight = max_in_flight
+            self.timeout = timeout
+            self.arguments = enumerate(izip(*iterables))
+            self.completed = queue.Queue()
+            self.pending = set()
+            self.started = {}
+            self.cancelled = False
+            self.timed_out = False
+            self.submit()
+
+        def submit(self):
+            if self.max_in_flight is None:
+                arguments = self.arguments
+            else:
+                arguments = itertools.islice(
+                    self.arguments,
+                    max(0, self.max_in_flight - len(self.pending))
+                )
+            for index, args in arguments:
+                self.pending.add(index)
+                self.executor.submit(self.map_function, index, args)
+
+        def map_function(self, index, args):
+            if self.cancelled:
+                return
+            self.started[index] = time.time()
+            try:
+                value = self.function(*args)
+            except Exception:
+                self.completed.put((index, False, sys.exc_info()))
+            else:
+                self.completed.put((index, True, value))
+
+        def cancel(self):
+            """Stop the iteration, and prevent applications that aren't
+            started yet from being started.
+
+            """
+            self.cancelled = True
+            self.completed.put(None)  # wake up the iteration
+
+        def get_wait(self):
+            if self.timeout is None:
+                return
+            deadlines = [self.started[i] + self.timeout
+                         for i in self.pending if i in self.started]
+            if not deadlines:
+                return self.timeout
+            return max(0, min(deadlines) - time.time())
+
+        def complete(self):
+            """Wait for the next completed application, and yield triples
+            of (index, success, value).  Timed out applications are
+            completed as failures.
+
+            """
+            while self.pending and not self.cancelled:
+                try:
+                    completion = self.completed.get(timeout=self.get_wait())
+                except queue.Empty:
+                    now = time.time()
+                    completions = []
+                    for index in self.pending:
+                        started = self.started.get(index)
+                        if started is not None and \
+                           now - started >= self.timeout:
+                            error = multiprocessing.TimeoutError(
+                                'timed out after {0} seconds'.format(
+                                    self.timeout
+                                )
+                            )
+                            completions.append(
+                                (index, False, (type(error), error, None))
+                            )
+                            self.timed_out = True
+                else:
+                    if completion is None:  # cancelled
+                        break
+                    completions = [completion]
+                for completion in completions:
+                    index = completion[0]
+                    if index not in self.pending:  # already timed out
+                        continue
+                    self.pending.discard(index)
+                    self.started.pop(index, None)
+                    yield completion
+                self.submit()
+
+        def __iter__(self):
+            errors = []
+            buffer_ = {}
+            next_index = 0
+            for index, success, value in self.complete():
+                if not success:
                     errors.append(value)
-            self.pool.shutdown()
+                if not self.ordered:
+                    if success:
+                        yield value
+                    continue
+                buffer_[index] = success, value
+                while next_index in buffer_:
+                    success, value = buffer_.pop(next_index)
+                    next_index += 1
+                    if success:
+                        yield value
+            if not self.shared:
+                # Don't wait for applications given up or never started
+                self.executor.shutdown(
+                    wait=not (self.timed_out or self.cancelled)
+                )
+            if self.cancelled:
+                return
             if PY3:
                 for _, exc, tb in errors:
                     raise exc.with_traceback(tb)
             else:
                 for _, exc, tb in errors:
                     exec('raise exc, None, tb')
+
+
+def call_safely(task):
+    """Apply the pair of (function, args) in a worker process, and
+    return the pair of (success, value or exception) so that an error
+    doesn't stop the whole map.
+
+    .. note::
+
+       Internal function.
+
+    """
+    function, args = task
+    try:
+        return True, function(*args)
+    except Exception as e:
+        return False, e
+
+
+class process_map(collections.Iterable):
+
+    def __init__(self, pool_size, function, *iterables, **options):
+        ordered = options.pop('ordered', False)
+        chunksize = options.pop('chunksize', 1)
+        if options:
+            raise TypeError('unexpected keyword arguments: ' +
+                            ', '.join(sorted(options)))
+        elif IRON_PYTHON:
+            raise NotImplementedError('process_map is unavailable on '
+                                      'IronPython')
+        elif not isinstance(pool_size, numbers.Integral):
+            raise TypeError('pool_size must be an integer, not ' +
+                            repr(pool_size))
+        elif not callable(function):
+            raise TypeError('function must be callable, not ' +
+                            repr(function))
+        elif not iterables:
+            raise TypeError('missing iterable')
+        elif not isinstance(chunksize, numbers.Integral):
+            raise TypeError('chunksize must be an integer, not ' +
+                            repr(chunksize))
+        elif chunksize < 1:
+            raise ValueError('chunksize must be greater than zero')
+        try:
+            pickle.dumps(function, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            raise TypeError('function must be picklable, not ' +
+                            repr(function))
+        self.pool = multiprocessing.Pool(pool_size)
+        tasks = ((function, args) for args in izip(*iterables))
+        imap = self.pool.imap if ordered else self.pool.imap_unordered
+        self.results = imap(call_safely, tasks, chunksize)
+
+    def __iter__(self):
+        errors = []
+        try:
+            for success, value in self.results:
+                if success:
+                    yield value
+                else:
+                    errors.append(value)
+        finally:
+            self.pool.terminate()
+            self.pool.join()
+        for error in errors:
+            raise error
@@ -0,0 +1,455 @@
+""":mod:`libearth.connection` --- Persistent HTTP connections
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+By default every :func:`~libearth.crawler.open_url()` call opens a fresh
+TCP (and TLS) connection.  :class:`ConnectionPool` keeps connections alive
+after their responses are read, and reuses them for later requests to
+the same scheme, host and port.  Many feeds share the same hosts, and
+the crawler also requests their permalink pages and favicons, so reused
+connections save a lot of handshakes::
+
+    pool = ConnectionPool(max_idle=100, max_per_host=4)
+    results = crawl(feed_urls, pool_size=16, connection_pool=pool)
+    print(pool.stats())
+
+The pool is thread-safe, so a single pool can be shared by all workers
+of :func:`~libearth.crawler.crawl()`.
+
+.. versionadded:: 0.4.0
+
+"""
+import collections
+import logging
+import socket
+import threading
+import time
+
+try:
+    import httplib
+except ImportError:
+    from http import client as httplib
+try:
+    import urllib.request as urllib2
+except ImportError:
+    import urllib2
+
+__all__ = ('DEFAULT_MAX_IDLE', 'DEFAULT_MAX_PER_HOST', 'DEFAULT_IDLE_TIMEOUT',
+           'ConnectionPool', 'ConnectionPoolStats', 'PooledHTTPHandler',
+           'PooledHTTPSHandler', 'PooledResponse', 'RedirectHandler')
+
+
+#: (:class:`numbers.Integral`) The default maximum number of idle connections
+#: a :class:`ConnectionPool` keeps.
+DEFAULT_MAX_IDLE = 64
+
+#: (:class:`numbers.Integral`) The default maximum number of connections
+#: a :class:`ConnectionPool` opens for each host at a time.
+DEFAULT_MAX_PER_HOST = 4
+
+#: (:class:`numbers.Real`) The default number of seconds idle connections
+#: are kept alive.
+DEFAULT_IDLE_TIMEOUT = 30
+
+#: (:class:`numbers.Integral`) The maximum number of unread body bytes
+#: to drain when a response is closed early.  If more bytes are left
+#: the connection is discarded instead of being reused.
+DRAIN_LIMIT = 64 * 1024
+
+#: (:class:`type`) The snapshot of :class:`ConnectionPool` counters,
+#: which :meth:`ConnectionPool.stats()` returns.
+#:
+#: ``requests``
+#:    The number of requests made through the pool.
+#: ``created``
+#:    The number of newly opened connections, i.e. handshakes.
+#: ``reused``
+#:    The number of requests sent over kept-alive connections,
+#:    i.e. handshakes saved.
+#: ``discarded``
+#:    The number of connections closed instead of being kept alive.
+#: ``idle``
+#:    The number of currently idle connections.
+#: ``active``
+#:    The number of currently checked out connections.
+ConnectionPoolStats = collections.namedtuple(
+    'ConnectionPoolStats',
+    'requests created reused discarded idle active'
+)
+
+
+class ConnectionPool(object):
+    """Thread-safe pool of keep-alive HTTP connections, keyed by
+    scheme and host (including port).
+
+    :param max_idle: the maximum number of idle connections to keep in total.
+                     :const:`DEFAULT_MAX_IDLE` by default
+    :type max_idle: :class:`numbers.Integral`
+    :param max_per_host: the maximum number of connections to open for
+                         each host at a time.  requests to a busy host wait
+                         until one of its connections is released.
+                         :const:`DEFAULT_MAX_PER_HOST` by default
+    :type max_per_host: :class:`numbers.Integral`
+    :param idle_timeout: the number of seconds to keep idle connections
+                         alive.  :const:`DEFAULT_IDLE_TIMEOUT` by default
+    :type idle_timeout: :class:`numbers.Real`
+    :param dns_cache: an optional cache to resolve hostnames of new
+                      connections through
+    :type dns_cache: :class:`~libearth.dnscache.DNSCache`
+
+    """
+
+    #: (:class:`numbers.Integral`) The maximum number of idle connections
+    #: to keep in total.
+    max_idle = None
+
+    #: (:class:`numbers.Integral`) The maximum number of connections to open
+    #: for each host at a time.
+    max_per_host = None
+
+    #: (:class:`numbers.Real`) The number of seconds to keep idle connections
+    #: alive.
+    idle_timeout = None
+
+    #: (:class:`~libearth.dnscache.DNSCache`) The cache to resolve hostnames
+    #: of new connections through.  It might be :const:`None`.
+    dns_cache = None
+
+    def __init__(self, max_idle=DEFAULT_MAX_IDLE,
+                 max_per_host=DEFAULT_MAX_PER_HOST,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, dns_cache=None):
+        if max_idle < 0:
+            raise ValueError('max_idle must not be negative')
+        elif max_per_host < 1:
+            raise ValueError('max_per_host must be greater than zero')
+        self.max_idle = max_idle
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.dns_cache = dns_cache
+        self.condition = threading.Condition()
+        self.idle = {}
+        self.active = {}
+        self.counters = dict.fromkeys(('requests', 'created', 'reused',
+                                       'discarded'), 0)
+        handlers = [PooledHTTPHandler(self), RedirectHandler()]
+        if PooledHTTPSHandler is not None:
+            handlers.append(PooledHTTPSHandler(self))
+        self.opener = urllib2.build_opener(*handlers)
+
+    def open(self, request, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        """Open the ``request`` in the same way to :func:`urllib2.urlopen()`
+        except it's sent over a pooled connection.
+
+        :param request: the url or request object to open
+        :type request: :class:`str`, :class:`urllib2.Request`
+        :param timeout: optional timeout in seconds
+        :type timeout: :class:`numbers.Real`
+        :returns: the file-like response object
+
+        """
+        return self.opener.open(request, timeout=timeout)
+
+    def acquire(self, key, factory, reuse=True):
+        """Check out an idle connection of the ``key``, or create a new one
+        using ``factory`` if there's no idle connection.  It blocks while
+        the host already has :attr:`max_per_host` connections.
+
+        :param key: the pair of (scheme, host)
+        :type key: :class:`tuple`
+        :param factory: the function that creates a new connection
+        :type factory: :class:`collections.Callable`
+        :param reuse: whether to check out an idle connection.
+                      if it's :const:`False` a new connection is always
+                      created.  :const:`True` by default
+        :type reuse: :class:`bool`
+        :returns: a pair of the connection and whether it's reused
+        :rtype: :class:`tuple`
+
+        .. note::
+
+           Internal method.
+
+        """
+        expired = []
+        with self.condition:
+            while True:
+                idle = self.idle.get(key) if reuse else None
+                now = time.time()
+                while idle:
+                    connection, released_at = idle.pop()
+                    if now - released_at < self.idle_timeout:
+                        self.active[key] = self.active.get(key, 0) + 1
+                        self.counters['reused'] += 1
+                        return connection, True
+                    expired.append(connection)
+                    self.counters['discarded'] += 1
+                if self.active.get(key, 0) < self.max_per_host:
+                    self.active[key] = self.active.get(key, 0) + 1
+                    self.counters['created'] += 1
+                    break
+                self.condition.wait()
+        for connection in expired:
+            connection.close()
+        try:
+            return factory(), False
+        except Exception:
+            self.release(key, None)
+            raise
+
+    def release(self, key, connection, reusable=False):
+        """Give back the ``connection`` checked out by :meth:`acquire()`.
+
+        :param key: the pair of (scheme, host)
+        :type key: :class:`tuple`
+        :param connection: the connection to give back
+        :param reusable: whether the connection can be kept alive.
+                         :const:`False` by default
+        :type reusable: :class:`bool`
+
+        .. note::
+
+           Internal method.
+
+        """
+        with self.condition:
+            self.active[key] -= 1
+            if not self.active[key]:
+                del self.active[key]
+            if reusable and sum(map(len, self.idle.values())) < self.max_idle:
+                self.idle.setdefault(key, []).append((connection, time.time()))
+                connection = None
+            elif connection is not None:
+                self.counters['discarded'] += 1
+            self.condition.notify_all()
+        if connection is not None:
+            connection.close()
+
+    def urlopen(self, request, connection_class):
+        """Send the ``request`` over a pooled connection.  It's used by
+        :class:`PooledHTTPHandler` and :class:`PooledHTTPSHandler`.
+
+        If the kept-alive connection turns out to be already closed by
+        the server, it retries once with a new connection (not another
+        kept-alive one, since the server might have closed all of them
+        at once).
+
+        :param request: the request to send
+        :type request: :class:`urllib2.Request`
+        :param connection_class: the connection class to create new
+                                 connections e.g.
+                                 :class:`httplib.HTTPConnection`
+        :type connection_class: :class:`type`
+        :returns: the file-like response object
+
+        .. note::
+
+           Internal method.
+
+        """
+        logger = logging.getLogger(__name__ + '.ConnectionPool.urlopen')
+        host = getattr(request, 'host', None) or request.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+        scheme = request.get_full_url().split(':', 1)[0].lower()
+        key = scheme, host.lower()
+        timeout = request.timeout
+        selector = getattr(request, 'selector', None)
+        if selector is None:
+            selector = request.get_selector()
+        data = getattr(request, 'data', None)
+        if data is None and hasattr(request, 'get_data'):
+            data = request.get_data()
+        headers = dict(request.unredirected_hdrs)
+        headers.update(request.headers)
+        headers = dict((name.title(), value)
+                       for name, value in headers.items()
+                       if name.lower() != 'connection')
+        with self.condition:
+            self.counters['requests'] += 1
+
+        def connect():
+            connection = connection_class(host, timeout=timeout)
+            if self.dns_cache is not None:
+                connection._create_connection = \
+                    self.dns_cache.create_connection
+            return connection
+        for reuse in (True, False):
+            connection, reused = self.acquire(key, connect, reuse=reuse)
+            connection.timeout = timeout
+            try:
+                if connection.sock is not None:
+                    if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+                        timeout = socket.getdefaulttimeout()
+                    connection.sock.settimeout(timeout)
+                connection.request(request.get_method(), selector, data,
+                                   headers)
+                response = connection.getresponse()
+            except (httplib.HTTPException, socket.error) as e:
+                self.release(key, connection)
+                if reused:
+                    logger.debug('kept-alive connection to %s is gone; '
+                                 'retry with a new connection', host)
+                    continue
+                raise urllib2.URLError(e)
+            break
+        fp = PooledResponse(self, key, connection, response)
+        resp = urllib2.addinfourl(fp, response.msg, request.get_full_url())
+        resp.code = response.status
+        resp.msg = response.reason
+        return resp
+
+    def close(self):
+        """Close all idle connections."""
+        with self.condition:
+            idle = self.idle
+            self.idle = {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+
+    def stats(self):
+        """Take a snapshot of counters.
+
+        :returns: the counters of the pool
+        :rtype: :class:`ConnectionPoolStats`
+
+        """
+        with self.condition:
+            return ConnectionPoolStats(
+                idle=sum(map(len, self.idle.values())),
+                active=sum(self.active.values()),
+                **self.counters
+            )
+
+    def __repr__(self):
+        return '<{0.__module__}.{0.__name__} {1!r}>'.format(type(self),
+                                                            self.stats())
+
+
+class PooledResponse(object):
+    """File-like object wrapping :class:`httplib.HTTPResponse` which gives
+    back its connection to the pool when it's closed.  The connection is
+    kept alive only if the whole body was read (or drained) and the server
+    didn't ask to close it.
+
+    .. note::
+
+       This class is intended to be internal.
+
+    """
+
+    def __init__(self, pool, key, connection, response):
+        self.pool = pool
+        self.key = key
+        self.connection = connection
+        self.response = response
+
+    def read(self, *args):
+        return self.response.read(*args)
+
+    def readline(self, *args):
+        return self.response.readline(*args)
+
+    def readlines(self, *args):
+        return self.response.readlines(*args)
+
+    def fileno(self):
+        return self.response.fileno()
+
+    def __iter__(self):
+        return iter(self.response)
+
+    def close(self):
+        connection = self.connection
+        if connection is None:
+            return
+        self.connection = None
+        response = self.response
+        reusable = not response.will_close
+        if reusable and not response.isclosed():
+            length = response.length
+            if length is not None and length <= DRAIN_LIMIT:
+                try:
+                    response.read()
+                except (httplib.HTTPException, socket.error):
+                    reusable = False
+            else:
+                reusable = False
+        if not reusable:
+            response.close()
+        self.pool.release(self.key, connection, reusable=reusable)
+
+    def __del__(self):
+        # Give back the connection even if the response is not explicitly
+        # closed e.g. HTTPError objects that are ignored.
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class PooledHTTPHandler(urllib2.HTTPHandler):
+    """:mod:`urllib2` handler which sends ``http://`` requests over
+    connections of the given ``pool``.
+
+    :param pool: the connection pool to use
+    :type pool: :class:`ConnectionPool`
+
+    """
+
+    def __init__(self, pool):
+        urllib2.HTTPHandler.__init__(self)
+        self.pool = pool
+
+    def http_open(self, req):
+        if getattr(req, '_tunnel_host', None):
+            return urllib2.HTTPHandler.http_open(self, req)
+        return self.pool.urlopen(req, httplib.HTTPConnection)
+
+
+if hasattr(urllib2, 'HTTPSHandler'):
+    class PooledHTTPSHandler(urllib2.HTTPSHandler):
+        """:mod:`urllib2` handler which sends ``https://`` requests over
+        connections of the given ``pool``.
+
+        :param pool: the connection pool to use
+        :type pool: :class:`ConnectionPool`
+
+        """
+
+        def __init__(self, pool):
+            urllib2.HTTPSHandler.__init__(self)
+            self.pool = pool
+
+        def https_open(self, req):
+            if getattr(req, '_tunnel_host', None):
+                return urllib2.HTTPSHandler.https_open(self, req)
+            return self.pool.urlopen(req, httplib.HTTPSConnection)
+else:
+    PooledHTTPSHandler = None
+
+
+class RedirectHandler(urllib2.HTTPRedirectHandler):
+    """:mod:`urllib2` handler which follows redirects in the same way to
+    the default one, except it records the status code of each redirect
+    so that permanent redirects can be told from temporary ones (see
+    :attr:`CrawlResult.permanent_url
+    <libearth.crawler.CrawlResult.permanent_url>`).  It also follows
+    ``308 Permanent Redirect`` on Pythons that don't know it.
+
+    :class:`ConnectionPool` already uses it, and so does
+    :data:`~libearth.crawler.OPENER` which the crawler uses without a pool.
+
+    """
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        # 308 is the same to 307 except it's permanent
+        new = urllib2.HTTPRedirectHandler.redirect_request(
+            self, req, fp, 307 if code == 308 else code, msg, headers, newurl
+        )
+        statuses = getattr(getattr(req, 'redirect_dict', None), 'statuses',
+                           None)
+        if new is not None and statuses is not None:
+            statuses[newurl] = code
+        return new
+
+    http_error_308 = urllib2.HTTPRedirectHandler.http_error_302
@@ -5,11 +5,23 @@ Crawl feeds.
 
 """
 import collections
+import contextlib
 import functools
+import hashlib
 import logging
+import numbers
 import re
+import socket
 import sys
+import threading
+import time
+import xml.parsers.expat
+import zlib
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 try:
     import urllib.request as urllib2
 except ImportError:
@@ -20,13 +32,37 @@ except ImportError:
     import urlparse
 
 from .compat.parallel import parallel_map
-from .feed import Link
+from .connection import RedirectHandler
+from .feed import Feed, Link
 from .parser.autodiscovery import AutoDiscovery, get_format
-from .subscribe import SubscriptionSet
+from .politeness import HostThrottledError, interleave_by_host
+from .repository import Repository, RepositoryKeyError
+from .schema import Attribute, DocumentElement, Text, read, write
+from .stage import Stage
+from .subscribe import Subscription, SubscriptionSet
 from .version import VERSION
 
 
-__all__ = 'DEFAULT_TIMEOUT', 'CrawlError', 'CrawlResult', 'crawl', 'get_feed'
+__all__ = ('ACCEPT_ENCODING', 'CLIENT_FAILURE', 'CRAWLER_XMLNS',
+           'DEFAULT_BATCH_SIZE', 'DEFAULT_ICON_TTL',
+           'DEFAULT_NEGATIVE_ICON_TTL', 'DEFAULT_QUEUE_SIZE', 'DEFAULT_TIMEOUT',
+           'DNS_FAILURE', 'NETWORK_FAILURE', 'OPENER', 'OVERSIZE_ABORT',
+           'OVERSIZE_TRUNCATE', 'PARSE_FAILURE', 'PERMANENT_REDIRECT_CODES',
+           'SERVER_FAILURE', 'SIZE_FAILURE', 'THROTTLED_FAILURE',
+           'TIMEOUT_FAILURE', 'USER_AGENT',
+           'ContentDecoder', 'CrawlError', 'CrawlMetrics', 'CrawlPhase',
+           'CrawlResult', 'DecodedResponse', 'IconCache',
+           'MemoryValidatorStore', 'RepositoryValidatorStore', 'ValidatorStore',
+           'Validators', 'classify_error', 'crawl', 'crawl_into_stage',
+           'discover_icon_url', 'find_icon_url', 'get_feed', 'parse_feed',
+           'parse_feed_serialized', 'truncate_feed')
+
+
+#: (:class:`str`) The XML namespace name used for documents the crawler
+#: stores for itself e.g. :class:`Validators`.
+#:
+#: .. versionadded:: 0.4.0
+CRAWLER_XMLNS = 'http://earthreader.org/crawler/'
 
 
 #: (:class:`numbers.Integral`) The default timeout for connection attempts.
@@ -36,16 +72,175 @@ __all__ = 'DEFAULT_TIMEOUT', 'CrawlError', 'CrawlResult', 'crawl', 'get_feed'
 DEFAULT_TIMEOUT = 10
 
 
+#: (:class:`numbers.Real`) The default number of seconds
+#: :class:`IconCache` keeps found favicon urls.  A week.
+#:
+#: .. versionadded:: 0.4.0
+DEFAULT_ICON_TTL = 7 * 24 * 60 * 60
+
+
+#: (:class:`numbers.Real`) The default number of seconds
+#: :class:`IconCache` remembers that a site has no favicon.  A day.
+#:
+#: .. versionadded:: 0.4.0
+DEFAULT_NEGATIVE_ICON_TTL = 24 * 60 * 60
+
+#: (:class:`numbers.Integral`) The default maximum number of crawled
+#: results :func:`crawl_into_stage()` keeps waiting to be merged.
+#:
+#: .. versionadded:: 0.4.0
+DEFAULT_QUEUE_SIZE = 64
+
+#: (:class:`numbers.Integral`) The default maximum number of feeds
+#: :func:`crawl_into_stage()` merges in a transaction.
+#:
+#: .. versionadded:: 0.4.0
+DEFAULT_BATCH_SIZE = 16
+
+
+#: (:class:`str`) The :attr:`CrawlError.kind` of failures to resolve
+#: the host name.
+#:
+#: .. versionadded:: 0.4.0
+DNS_FAILURE = 'dns'
+
+#: (:class:`str`) The :attr:`CrawlError.kind` of timed out requests.
+#:
+#: .. versionadded:: 0.4.0
+TIMEOUT_FAILURE = 'timeout'
+
+#: (:class:`str`) The :attr:`CrawlError.kind` of other network failures
+#: e.g. refused connections, and response bodies whose ``Content-Encoding``
+#: is corrupt (e.g. truncated on the wire).
+#:
+#: .. versionadded:: 0.4.0
+NETWORK_FAILURE = 'network'
+
+#: (:class:`str`) The :attr:`CrawlError.kind` of ``4xx`` responses.
+#:
+#: .. versionadded:: 0.4.0
+CLIENT_FAILURE = 'client'
+
+#: (:class:`str`) The :attr:`CrawlError.kind` of ``5xx`` responses,
+#: and ``408 Request Timeout`` and ``429 Too Many Requests`` as well
+#: since they are transient too.
+#:
+#: .. versionadded:: 0.4.0
+SERVER_FAILURE = 'server'
+
+#: (:class:`str`) The :attr:`CrawlError.kind` of crawls which are not
+#: even requested since a :class:`~libearth.politeness.HostLimiter` holds
+#: off the host longer than the timeout.  The feed itself didn't fail,
+#: so it's neither retried nor counted by
+#: :class:`~libearth.retry.CircuitBreaker`.
+#:
+#: .. versionadded:: 0.4.0
+THROTTLED_FAILURE = 'throttled'
+
+#: (:class:`str`) The :attr:`CrawlError.kind` of responses that cannot be
+#: parsed as a feed.
+#:
+#: .. versionadded:: 0.4.0
+PARSE_FAILURE = 'parse'
+
+#: (:class:`str`) The :attr:`CrawlError.kind` of responses larger than
+#: ``max_size`` of :func:`get_feed()`.
+#:
+#: .. versionadded:: 0.4.0
+SIZE_FAILURE = 'size'
+
+
+#: (:class:`str`) The ``oversize`` policy of :func:`get_feed()` which
+#: fails the crawl if the response is too large.
+#:
+#: .. versionadded:: 0.4.0
+OVERSIZE_ABORT = 'abort'
+
+#: (:class:`str`) The ``oversize`` policy of :func:`get_feed()` which
+#: parses only complete entries within the size limit if the response is
+#: too large.  See also :func:`truncate_feed()`.
+#:
+#: .. versionadded:: 0.4.0
+OVERSIZE_TRUNCATE = 'truncate'
+
+
+#: (:class:`str`) The ``User-Agent`` header value the crawler sends.
+#:
+#: .. versionadded:: 0.4.0
+USER_AGENT = '{0}/{1}'.format(__package__, VERSION)
+
+#: (:class:`collections.Set`) HTTP status codes of permanent redirects.
+#: See :attr:`CrawlResult.permanent_url`.
+#:
+#: .. versionadded:: 0.4.0
+PERMANENT_REDIRECT_CODES = frozenset([301, 308])
+
+
+#: (:class:`urllib2.OpenerDirector`) The opener :func:`open_url()` uses
+#: when no connection pool is given.  Unlike the default opener of
+#: :mod:`urllib2`, it records the status code of each redirect (see
+#: :class:`~libearth.connection.RedirectHandler`), so that
+#: :attr:`CrawlResult.permanent_url` is available without a pool as well.
+#:
+#: .. versionadded:: 0.4.0
+OPENER = urllib2.build_opener(RedirectHandler)
+
+
+#: (:class:`str`) The ``Accept-Encoding`` header value the crawler sends.
+#: Compressed responses are transparently decoded by :class:`ContentDecoder`.
+#:
+#: .. versionadded:: 0.4.0
+ACCEPT_ENCODING = 'gzip, deflate'
+
+
 def open_url(url, *args, **kwargs):
     if isinstance(url, Request):
         request = url
     else:
         request = urllib2.Request(url)
-    request.add_header('User-agent', '{0}/{1}'.format(__package__, VERSION))
-    return urllib2.urlopen(request, *args, **kwargs)
+    request.add_header('User-agent', USER_AGENT)
+    if not request.has_header('Accept-encoding'):
+        request.add_header('Accept-encoding', ACCEPT_ENCODING)
+    connection_pool = kwargs.pop('connection_pool', None)
+    host_limiter = kwargs.pop('host_limiter', None)
+    on_close = None
+    if host_limiter is not None:
+        url = request.get_full_url()
+        timeout = kwargs.get('timeout')
+        if not isinstance(timeout, numbers.Real):
+            timeout = None  # socket._GLOBAL_DEFAULT_TIMEOUT
+        host_limiter.acquire(url, timeout=timeout)
+        on_close = functools.partial(host_limiter.release, url)
+    try:
+        if connection_pool is not None:
+            response = connection_pool.open(request, *args, **kwargs)
+        else:
+            response = OPENER.open(request, *args, **kwargs)
+    except urllib2.HTTPError as e:
+        if host_limiter is not None:
+            host_limiter.feedback(url, e.code, e.info())
+            on_close()
+        raise
+    except Exception:
+        if on_close is not None:
+            on_close()
+        raise
+    if host_limiter is not None:
+        host_limiter.feedback(url, response.getcode(), response.info())
+    try:
+        return DecodedResponse(response, on_close=on_close)
+    except ValueError as e:
+        response.close()
+        if on_close is not None:
+            on_close()
+        raise IOError(str(e))
 
 
-def crawl(feed_urls, pool_size, timeout=DEFAULT_TIMEOUT):
+def crawl(feed_urls, pool_size, timeout=DEFAULT_TIMEOUT,
+          validator_store=None, connection_pool=None, icon_cache=None,
+          resolve_icon=True, scheduler=None, host_limiter=None,
+          parse_pool=None, retry_policy=None, circuit_breaker=None,
+          max_size=None, oversize=OVERSIZE_ABORT, executor=None):
     """Crawl feeds in feed list using thread.
 
     :param feed_urls: feed urls to crawl
@@ -55,6 +250,51 @@ def crawl(feed_urls, pool_size, timeout=DEFAULT_TIMEOUT):
     :param timeout: optional timeout for connection attempts.
                     :const:`DEFAULT_TIMEOUT` is used if omitted
     :type timeout: :class:`numbers.Integral`
+    :param validator_store: an optional store of cache validators to make
+                            conditional requests.  see also :func:`get_feed()`
+    :type validator_store: :class:`ValidatorStore`
+    :param connection_pool: an optional pool of keep-alive connections
+                            shared by workers.  see also :func:`get_feed()`
+    :type connection_pool: :class:`~libearth.connection.ConnectionPool`
+    :param icon_cache: an optional cache of favicon urls shared by workers.
+                       see also :func:`get_feed()`
+    :type icon_cache: :class:`IconCache`
+    :param resolve_icon: whether to discover favicons over the network
+                         if they aren't cached.  :const:`True` by default
+    :type resolve_icon: :class:`bool`
+    :param scheduler: an optional scheduler.  if it's present only feeds
+                      that are due are crawled, and then their next due
+                      times are updated
+    :type scheduler: :class:`~libearth.scheduler.Scheduler`
+    :param host_limiter: an optional limiter of requests to each host
+                         shared by workers.  if it's present feeds are
+                         interleaved by their hosts so that workers are
+                         kept busy with other hosts while a host is waited
+    :type host_limiter: :class:`~libearth.politeness.HostLimiter`
+    :param parse_pool: an optional process pool to parse feeds in, so that
+                       parsing isn't serialized by the GIL while requests
+                       are made by threads.  see also :func:`get_feed()`
+    :type parse_pool: :class:`multiprocessing.pool.Pool`
+    :param retry_policy: an optional policy to retry failed crawls of
+                         transient failures (see :attr:`CrawlError.kind`)
+                         in the same crawl
+    :type retry_policy: :class:`~libearth.retry.RetryPolicy`
+    :param circuit_breaker: an optional circuit breaker.  if it's present
+                            repeatedly failing feeds are left out until
+                            their next probe times
+    :type circuit_breaker: :class:`~libearth.retry.CircuitBreaker`
+    :param max_size: an optional maximum number of bytes of each response
+                     body.  the peak memory of a crawl is bounded by
+                     ``pool_size`` times it.  see also :func:`get_feed()`
+    :type max_size: :class:`numbers.Integral`
+    :param oversize: what to do with responses larger than ``max_size``.
+                     :const:`OVERSIZE_ABORT` or :const:`OVERSIZE_TRUNCATE`
+    :type oversize: :class:`str`
+    :param executor: an optional long-lived executor to run workers on
+                     instead of spawning ``pool_size`` threads for every
+                     crawl.  no more than ``pool_size`` feeds are crawled
+                     on it at a time
+    :type executor: :class:`~libearth.compat.parallel.SharedExecutor`
     :returns: a set of :class:`CrawlResult` objects
     :rtype: :class:`collections.Iterable`
 
@@ -71,82 +311,1052 @@ def crawl(feed_urls, pool_size, timeout=DEFAULT_TIMEOUT):
 
        Added optional ``timeout`` parameter.
 
+    .. versionadded:: 0.4.0
+
+       Added optional ``validator_store``, ``connection_pool``,
+       ``icon_cache``, ``resolve_icon``, ``scheduler``, ``host_limiter``,
+       ``parse_pool``, ``retry_policy``, ``circuit_breaker``, ``max_size``,
+       ``oversize`` and ``executor`` parameters.
+
+    .. versionchanged:: 0.4.0
+
+       Even if ``pool_size`` is 1, a failed feed doesn't prevent other
+       feeds from being crawled.  The error is raised after all results
+       are yielded, as it does when ``pool_size`` is greater than 1.
+
     """
-    if type(timeout) is type(DEFAULT_TIMEOUT) and timeout == DEFAULT_TIMEOUT:
-        func = get_feed
-    else:
-        func = functools.partial(get_feed, timeout=int(timeout))
+    options = {}
+    if not (type(timeout) is type(DEFAULT_TIMEOUT) and
+            timeout == DEFAULT_TIMEOUT):
+        options['timeout'] = int(timeout)
+    if validator_store is not None:
+        options['validator_store'] = validator_store
+    if connection_pool is not None:
+        options['connection_pool'] = connection_pool
+    if icon_cache is not None:
+        options['icon_cache'] = icon_cache
+    if not resolve_icon:
+        options['resolve_icon'] = False
+    if scheduler is not None:
+        options['scheduler'] = scheduler
+        feed_urls = scheduler.due(feed_urls)
+    if circuit_breaker is not None:
+        feed_urls = circuit_breaker.allowed(feed_urls)
+    if host_limiter is not None:
+        options['host_limiter'] = host_limiter
+        feed_urls = interleave_by_host(feed_urls)
+    if parse_pool is not None:
+        options['parse_pool'] = parse_pool
+    if max_size is not None:
+        options.update(max_size=max_size, oversize=oversize)
+    func = functools.partial(get_feed, **options) if options else get_feed
+    if retry_policy is not None:
+        func = functools.partial(retry_policy.call, func)
+    if circuit_breaker is not None:
+        func = functools.partial(circuit_breaker.call, func)
     if pool_size < 1:
         raise ValueError('pool_size must be greater than zero')
     elif pool_size == 1:
-        return [func(url) for url in feed_urls]
+        return crawl_serially(func, feed_urls)
+    elif executor is not None:
+        return parallel_map(pool_size, func, feed_urls, executor=executor)
     return parallel_map(pool_size, func, feed_urls)
 
 
-def get_feed(feed_url, timeout=DEFAULT_TIMEOUT):
-    # TODO: should be documented
+def crawl_serially(func, feed_urls):
+    """Apply ``func`` to the ``feed_urls`` one by one, and yield each
+    result as soon as it's fetched.  Like :func:`parallel_map()`,
+    the first error is raised after all other results are yielded.
+
+    .. note::
+
+       Internal function.
+
+    """
+    error = None
+    for url in feed_urls:
+        try:
+            result = func(url)
+        except Exception as e:
+            if error is None:
+                error = e
+            continue
+        yield result
+    if error is not None:
+        raise error
+
+
+def crawl_into_stage(stage, subscriptions, pool_size,
+                     queue_size=DEFAULT_QUEUE_SIZE,
+                     batch_size=DEFAULT_BATCH_SIZE, **options):
+    r"""Crawl feeds of the ``subscriptions``, and merge each of them into
+    the ``stage`` as soon as it's crawled, while other feeds are still
+    being crawled::
+
+        with stage:
+            subscriptions = stage.subscriptions
+        for result in crawl_into_stage(stage, subscriptions, pool_size=8):
+            print(result.url)
+
+    Crawled results wait to be merged in a queue of ``queue_size``.
+    The merger takes all waiting results (up to ``batch_size``) at once,
+    and commits them in a single transaction, so that a transaction isn't
+    committed for every feed when merging falls behind crawling.
+    Results :attr:`~CrawlResult.unchanged` since the last crawl aren't
+    merged at all.
+
+    Like :func:`crawl()`, if some feeds failed, the first error is raised
+    after all other results are merged.
+
+    :param stage: the stage to merge crawled feeds into
+    :type stage: :class:`~libearth.stage.Stage`
+    :param subscriptions: the subscriptions of feeds to crawl.  crawled
+                          feeds are stored to their
+                          :attr:`~libearth.subscribe.Subscription.feed_id`
+    :type subscriptions: :class:`~libearth.subscribe.SubscriptionSet`,
+                         :class:`collections.Iterable`
+    :param pool_size: the number of concurrent workers to crawl
+    :type pool_size: :class:`numbers.Integral`
+    :param queue_size: the maximum number of crawled results waiting to
+                       be merged.  :const:`DEFAULT_QUEUE_SIZE` by default
+    :type queue_size: :class:`numbers.Integral`
+    :param batch_size: the maximum number of feeds to merge in
+                       a transaction.  :const:`DEFAULT_BATCH_SIZE`
+                       by default
+    :type batch_size: :class:`numbers.Integral`
+    :param \*\*options: other options to pass to :func:`crawl()`
+    :returns: crawled results, each of them is yielded after it's
+              committed
+    :rtype: :class:`collections.Iterable`
+    :raises CrawlError: after all other feeds are merged, when any feed
+                        failed to be crawled
+
+    .. versionadded:: 0.4.0
+
+    """
+    if not isinstance(stage, Stage):
+        raise TypeError('stage must be an instance of {0.__module__}.'
+                        '{0.__name__}, not {1!r}'.format(Stage, stage))
+    elif queue_size < 1:
+        raise ValueError('queue_size must be greater than zero')
+    elif batch_size < 1:
+        raise ValueError('batch_size must be greater than zero')
+    if isinstance(subscriptions, SubscriptionSet):
+        subscriptions = subscriptions.recursive_subscriptions
+    feed_urls = []
+    feed_ids = {}
+    for subscription in subscriptions:
+        if not isinstance(subscription, Subscription):
+            raise TypeError(
+                'expected an instance of {0.__module__}.{0.__name__}, '
+                'not {1!r}'.format(Subscription, subscription)
+            )
+        try:
+            feed_ids[subscription.feed_uri].add(subscription.feed_id)
+        except KeyError:
+            feed_ids[subscription.feed_uri] = set([subscription.feed_id])
+            feed_urls.append(subscription.feed_uri)
+    results = crawl(feed_urls, pool_size, **options)
+    return merge_into_stage(stage, feed_ids, results, queue_size, batch_size)
+
+
+def merge_into_stage(stage, feed_ids, results, queue_size, batch_size):
+    """Merge ``results`` into the ``stage`` while they are crawled in
+    the background.  See :func:`crawl_into_stage()`.
+
+    .. note::
+
+       Internal function.
+
+    """
+    buffer_ = queue.Queue(queue_size)
+    finished = object()
+    stopped = threading.Event()
+    errors = []
+
+    def put(item):
+        # Give up if the generator is closed before it's exhausted
+        while not stopped.is_set():
+            try:
+                buffer_.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            return
+
+    def fetch():
+        try:
+            for result in results:
+                put(result)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            put(finished)
+    fetcher = threading.Thread(target=fetch)
+    fetcher.daemon = True
+    fetcher.start()
+    try:
+        while True:
+            batch = [buffer_.get()]
+            while len(batch) < batch_size and batch[-1] is not finished:
+                try:
+                    batch.append(buffer_.get_nowait())
+                except queue.Empty:
+                    break
+            last = batch[-1] is finished
+            if last:
+                batch.pop()
+            changed = [r for r in batch if r.feed is not None]
+            if changed:
+                with stage:
+                    for result in changed:
+                        for feed_id in feed_ids.get(result.url, ()):
+                            stage.feeds[feed_id] = result.feed
+            for result in batch:
+                yield result
+            if last:
+                break
+    finally:
+        stopped.set()
+    fetcher.join()
+    if errors:
+        raise errors[0]
+
+
+def get_feed(feed_url, timeout=DEFAULT_TIMEOUT, validator_store=None,
+             connection_pool=None, icon_cache=None, resolve_icon=True,
+             scheduler=None, host_limiter=None, parse_pool=None,
+             max_size=None, oversize=OVERSIZE_ABORT):
+    """Crawl a feed of the given ``feed_url``.
+
+    If ``validator_store`` is present, the cache validators (``ETag`` and
+    ``Last-Modified``) of the last response are sent together as
+    ``If-None-Match`` and ``If-Modified-Since``.  When the server answers
+    ``304 Not Modified`` the feed isn't parsed at all, and the returned
+    :class:`CrawlResult` is :attr:`~CrawlResult.not_modified`.
+    Validators are stored only when the response is successfully parsed.
+    The digest of the response body is stored together, so that even if
+    the server ignores conditional requests, the byte-identical body
+    isn't parsed again: the returned :class:`CrawlResult` is
+    :attr:`~CrawlResult.unchanged` then, and it skips favicon discovery
+    as well.
+
+    If ``connection_pool`` is present, the feed, its permalink page and
+    its favicon are all requested over kept-alive connections of the pool
+    instead of opening a new connection for each request.
+
+    If the feed doesn't link its favicon, it's discovered from the
+    permalink page of the feed, and then ``/favicon.ico`` of the site.
+    If ``icon_cache`` is present, it's consulted before any network I/O,
+    and the discovered favicon url (or the absence of it) is cached for
+    the origin of the permalink, so that feeds of the same site share it.
+    Favicons only matter when a feed is subscribed at first, so
+    recrawls can skip discovery at all by passing :const:`False`
+    to ``resolve_icon``; :attr:`CrawlResult.icon_url` becomes :const:`None`
+    then unless the feed links its favicon or it's cached.
+
+    If ``scheduler`` is present, the next due time of the feed is
+    updated by the crawled result.
+
+    If ``host_limiter`` is present, every request waits for its turn of
+    the host, and throttling responses defer following requests to
+    the host.  If the host is deferred longer than ``timeout``, the crawl
+    fails with :const:`THROTTLED_FAILURE` right away instead of waiting.
+
+    If ``parse_pool`` is present, the feed is parsed in one of its worker
+    processes by :func:`parse_feed_serialized()`, and the parsed feed is
+    sent back as serialized XML which is lazily read by
+    :func:`~libearth.schema.read()`.  Pass the same pool to every thread
+    (see :func:`crawl()`) so that parsing scales with the number of cores
+    instead of being serialized by the GIL.
+
+    If ``max_size`` is present, no more than that many (decoded) bytes of
+    the response body are read into memory.  If the response is larger,
+    the crawl fails with :const:`SIZE_FAILURE` when ``oversize`` is
+    :const:`OVERSIZE_ABORT`, or only entries that completely fit in
+    the limit are parsed (see :func:`truncate_feed()`) when it's
+    :const:`OVERSIZE_TRUNCATE`; the returned :class:`CrawlResult` is
+    :attr:`~CrawlResult.truncated` then.  It still fails with
+    :const:`SIZE_FAILURE` if the response can't be truncated.
+
+    :param feed_url: the url of the feed to crawl
+    :type feed_url: :class:`str`
+    :param timeout: optional timeout for connection attempts.
+                    :const:`DEFAULT_TIMEOUT` is used if omitted
+    :type timeout: :class:`numbers.Integral`
+    :param validator_store: an optional store of cache validators
+    :type validator_store: :class:`ValidatorStore`
+    :param connection_pool: an optional pool of keep-alive connections
+    :type connection_pool: :class:`~libearth.connection.ConnectionPool`
+    :param icon_cache: an optional cache of favicon urls
+    :type icon_cache: :class:`IconCache`
+    :param resolve_icon: whether to discover the favicon over the network
+                         if it isn't cached.  :const:`True` by default
+    :type resolve_icon: :class:`bool`
+    :param scheduler: an optional scheduler to update
+    :type scheduler: :class:`~libearth.scheduler.Scheduler`
+    :param host_limiter: an optional limiter of requests to each host
+    :type host_limiter: :class:`~libearth.politeness.HostLimiter`
+    :param parse_pool: an optional process pool to parse the feed in
+    :type parse_pool: :class:`multiprocessing.pool.Pool`
+    :param max_size: an optional maximum number of bytes of the response
+                     body
+    :type max_size: :class:`numbers.Integral`
+    :param oversize: what to do with the response larger than ``max_size``.
+                     :const:`OVERSIZE_ABORT` or :const:`OVERSIZE_TRUNCATE`.
+                     :const:`OVERSIZE_ABORT` by default
+    :type oversize: :class:`str`
+    :returns: the crawled result
+    :rtype: :class:`CrawlResult`
+    :raises CrawlError: when crawling goes wrong.  its
+                        :attr:`~CrawlError.kind` tells the kind of
+                        the failure
+
+    .. versionadded:: 0.4.0
+
+       Added optional ``validator_store``, ``connection_pool``,
+       ``icon_cache``, ``resolve_icon``, ``scheduler`` and ``host_limiter``
+       parameters.
+
+    """
     logger = logging.getLogger(__name__ + '.get_feed')
+    if oversize not in (OVERSIZE_ABORT, OVERSIZE_TRUNCATE):
+        raise ValueError('oversize must be OVERSIZE_ABORT or '
+                         'OVERSIZE_TRUNCATE, not ' + repr(oversize))
+    metrics = CrawlMetrics(feed_url)
     try:
-        f = open_url(feed_url, timeout=timeout)
-        feed_xml = f.read()
-        f.close()
-        parser = get_format(feed_xml)
-        if parser is None:
-            logger.warn('failed to detect the format of %s', feed_url)
-            logger.debug('the response body of %s:\n%s', feed_url, feed_xml)
-            raise CrawlError(feed_url,
-                             'failed to detect the format of ' + feed_url)
-        feed, crawler_hints = parser(feed_xml, feed_url)
-        self_uri = None
-        for link in feed.links:
-            if link.relation == 'self':
-                self_uri = link.uri
-        if not self_uri:
-            feed.links.append(Link(relation='self', uri=feed_url,
-                                   mimetype=f.info()['content-type']))
-        feed.entries = sorted(feed.entries, key=lambda entry: entry.updated_at,
-                              reverse=True)
+        request = Request(feed_url)
+        redirects = request.redirect_dict = RedirectChain()
+        validators = new_validators = None
+        if validator_store is not None:
+            validators = validator_store.get(feed_url)
+            if validators is not None:
+                if validators.etag:
+                    request.add_header('If-None-Match', validators.etag)
+                if validators.last_modified:
+                    request.add_header('If-Modified-Since',
+                                       validators.last_modified)
+        try:
+            with metrics.measure('request'):
+                f = open_url(request, timeout=timeout,
+                             connection_pool=connection_pool,
+                             host_limiter=host_limiter)
+        except urllib2.HTTPError as e:
+            metrics.status = e.code
+            metrics.redirects = list(redirects.urls)
+            if e.code != 304:
+                raise
+            e.close()
+            logger.debug('%s: not modified', feed_url)
+            result = CrawlResult(feed_url, None, None, not_modified=True,
+                                 headers=e.info(), metrics=metrics,
+                                 final_url=redirects.final_url,
+                                 permanent_url=redirects.permanent_url)
+            if scheduler is not None:
+                scheduler.update(result)
+            return result
+        metrics.status = f.getcode()
+        metrics.redirects = list(redirects.urls)
+        if redirects.permanent_url is not None:
+            logger.info('%s: permanently moved to %s', feed_url,
+                        redirects.permanent_url)
+        truncated = False
+        with metrics.measure('download') as phase:
+            feed_headers = f.info()
+            try:
+                # Read a byte more than the limit to tell if it's exceeded
+                feed_xml = f.read(-1 if max_size is None else max_size + 1)
+            finally:
+                f.close()
+            phase.size = f.wire_bytes
+        logger.debug('%s: %d bytes on the wire, %d bytes decoded',
+                     feed_url, f.wire_bytes, f.decoded_bytes)
+        if max_size is not None and len(feed_xml) > max_size:
+            if oversize == OVERSIZE_TRUNCATE:
+                feed_xml = truncate_feed(feed_xml[:max_size])
+                truncated = feed_xml is not None
+            if not truncated:
+                raise CrawlError(
+                    feed_url,
+                    '{0} is larger than {1} bytes'.format(feed_url, max_size),
+                    kind=SIZE_FAILURE
+                )
+            logger.debug('%s: truncated to %d bytes', feed_url,
+                         len(feed_xml))
+        if validator_store is not None:
+            new_validators = Validators.from_headers(feed_url, feed_headers,
+                                                     feed_xml)
+            if (validators is not None and
+                    validators.digest == new_validators.digest):
+                logger.debug('%s: unchanged', feed_url)
+                validator_store.set(feed_url, new_validators)
+                result = CrawlResult(feed_url, None, None, unchanged=True,
+                                     wire_bytes=f.wire_bytes,
+                                     decoded_bytes=f.decoded_bytes,
+                                     headers=feed_headers, metrics=metrics,
+                                     final_url=redirects.final_url,
+                                     permanent_url=redirects.permanent_url)
+                if scheduler is not None:
+                    scheduler.update(result)
+                return result
+        if parse_pool is None:
+            feed, crawler_hints = parse_feed(feed_url, feed_xml,
+                                             feed_headers['content-type'],
+                                             metrics=metrics)
+        else:
+            with metrics.measure('dispatch') as phase:
+                serialized, crawler_hints, phases = parse_pool.apply(
+                    parse_feed_serialized,
+                    (feed_url, feed_xml, feed_headers['content-type'])
+                )
+                phase.size = len(serialized)
+            metrics.phases.extend(phases)
+            feed = read(Feed, [serialized])
         favicon = feed.links.favicon
-        if favicon is None:
-            permalink = feed.links.permalink
-            if permalink:
+        permalink = feed.links.permalink
+        if favicon is not None:
+            favicon = favicon.uri
+        elif permalink:
+            cached = False
+            if icon_cache is not None:
                 try:
-                    f = open_url(permalink.uri, timeout=timeout)
-                except IOError:
+                    favicon = icon_cache.get(permalink.uri)
+                except KeyError:
                     pass
                 else:
-                    content_type = f.headers['content-type']
-                    html = f.read()
-                    f.close()
-                    if isinstance(html, bytes) and \
-                       not isinstance(html, str):
-                        match = re.search(r';\s*charset\s*=\s*([^;\s]+)',
-                                          content_type)
-                        enc = match.group(1) if match else 'utf-8'
-                        html = html.decode(enc, 'replace')
-                    _, icon_urls = AutoDiscovery().find(html)
-                    if icon_urls:
-                        favicon = urlparse.urljoin(permalink.uri,
-                                                   icon_urls[0])
-                if favicon is None:
-                    favicon = urlparse.urljoin(permalink.uri, '/favicon.ico')
-                    req = Request(favicon, method='HEAD')
-                    try:
-                        f = open_url(req, timeout=timeout)
-                    except (IOError, OSError):
-                        favicon = None
-                    else:
-                        if f.getcode() != 200:
-                            favicon = None
-                        f.close()
-        else:
-            favicon = favicon.uri
-        return CrawlResult(feed_url, feed, crawler_hints, favicon)
+                    cached = True
+            if not cached and resolve_icon:
+                with metrics.measure('favicon'):
+                    favicon = discover_icon_url(
+                        permalink.uri, timeout=timeout,
+                        connection_pool=connection_pool,
+                        host_limiter=host_limiter
+                    )
+                if icon_cache is not None:
+                    icon_cache.set(permalink.uri, favicon)
+        if new_validators is not None:
+            validator_store.set(feed_url, new_validators)
+        result = CrawlResult(feed_url, feed, crawler_hints, favicon,
+                             wire_bytes=f.wire_bytes,
+                             decoded_bytes=f.decoded_bytes,
+                             headers=feed_headers, metrics=metrics,
+                             truncated=truncated,
+                             final_url=redirects.final_url,
+                             permanent_url=redirects.permanent_url)
+        if scheduler is not None:
+            scheduler.update(result)
+        return result
     except Exception as e:
         logger.exception(
             '%s: %s', feed_url, e
         )
-        raise CrawlError(feed_url, '{0} failed: {1}'.format(feed_url, e))
+        error = CrawlError(feed_url, '{0} failed: {1}'.format(feed_url, e),
+                           kind=classify_error(e, metrics.status))
+        error.metrics = metrics
+        raise error
+
+
+def parse_feed(feed_url, feed_xml, mimetype=None, metrics=None):
+    """Detect the format of the given ``feed_xml`` and parse it.
+    It's the CPU-bound part of :func:`get_feed()`: it adds the ``self`` link
+    if the feed lacks it, and sorts entries by their updated time as well.
+
+    :param feed_url: the url of the feed
+    :type feed_url: :class:`str`
+    :param feed_xml: the response body of the feed
+    :type feed_xml: :class:`bytes`
+    :param mimetype: an optional content type of the response
+    :type mimetype: :class:`str`
+    :param metrics: an optional record to add durations of ``detect``,
+                    ``parse`` and ``sort`` phases to
+    :type metrics: :class:`CrawlMetrics`
+    :returns: a pair of (:class:`~libearth.feed.Feed`, crawler hints)
+    :rtype: :class:`tuple`
+    :raises CrawlError: when the format cannot be detected
+
+    .. versionadded:: 0.4.0
+
+    """
+    logger = logging.getLogger(__name__ + '.parse_feed')
+    if metrics is None:
+        metrics = CrawlMetrics(feed_url)
+    with metrics.measure('detect', len(feed_xml)):
+        parser = get_format(feed_xml)
+    if parser is None:
+        logger.warn('failed to detect the format of %s', feed_url)
+        logger.debug('the response body of %s:\n%s', feed_url, feed_xml)
+        raise CrawlError(feed_url,
+                         'failed to detect the format of ' + feed_url,
+                         kind=PARSE_FAILURE)
+    with metrics.measure('parse', len(feed_xml)):
+        feed, crawler_hints = parser(feed_xml, feed_url)
+    self_uri = None
+    for link in feed.links:
+        if link.relation == 'self':
+            self_uri = link.uri
+    if not self_uri:
+        feed.links.append(Link(relation='self', uri=feed_url,
+                               mimetype=mimetype))
+    with metrics.measure('sort', len(feed.entries)):
+        feed.entries = sorted(feed.entries,
+                              key=lambda entry: entry.updated_at,
+                              reverse=True)
+    return feed, crawler_hints
+
+
+def parse_feed_serialized(feed_url, feed_xml, mimetype=None):
+    """Parse the given ``feed_xml`` like :func:`parse_feed()`, but return
+    the parsed feed serialized by :func:`~libearth.schema.write()`.
+    It's a module-level function so that it can be sent to worker
+    processes e.g. :meth:`multiprocessing.pool.Pool.apply()`; its results
+    are picklable and much cheaper to send back than
+    :class:`~libearth.feed.Feed` objects.  See also ``parse_pool``
+    parameter of :func:`get_feed()`.
+
+    :param feed_url: the url of the feed
+    :type feed_url: :class:`str`
+    :param feed_xml: the raw feed document
+    :type feed_xml: :class:`bytes`
+    :param mimetype: an optional content type of the response
+    :type mimetype: :class:`str`
+    :returns: a triple of (the serialized :class:`~libearth.feed.Feed`,
+              crawler hints, :class:`CrawlPhase` list).  the feed can be
+              loaded by :func:`~libearth.schema.read()`
+    :rtype: :class:`tuple`
+    :raises CrawlError: when the format cannot be detected
+
+    .. versionadded:: 0.4.0
+
+    """
+    metrics = CrawlMetrics(feed_url)
+    feed, crawler_hints = parse_feed(feed_url, feed_xml, mimetype,
+                                     metrics=metrics)
+    with metrics.measure('serialize') as phase:
+        serialized = b''.join(write(feed, validate=False, indent='',
+                                    newline='', as_bytes=True))
+        phase.size = len(serialized)
+    return serialized, crawler_hints, metrics.phases
+
+
+def truncate_feed(feed_xml):
+    """Cut the given incomplete ``feed_xml`` right after its last complete
+    entry (i.e. Atom ``<entry>`` or RSS ``<item>``), and then close
+    elements left open, so that it becomes a well-formed feed which has
+    fewer entries::
+
+        truncate_feed(b'<feed><entry>1</entry><entry>2</en')
+        # b'<feed><entry>1</entry></feed>'
+
+    Documents not in ASCII-compatible encodings e.g. UTF-16 are
+    not truncated.
+
+    :param feed_xml: the beginning of the feed document
+    :type feed_xml: :class:`bytes`
+    :returns: the truncated feed document, or :const:`None` if there's
+              no complete entry or it can't be truncated safely
+    :rtype: :class:`bytes`
+
+    .. versionadded:: 0.4.0
+
+    """
+    if feed_xml[:2] in (b'\xfe\xff', b'\xff\xfe') or b'\0' in feed_xml[:4]:
+        # UTF-16 or UTF-32; byte offsets and closing tags would be wrong
+        return
+    parser = xml.parsers.expat.ParserCreate()
+    stack = []
+    pending = []
+    boundary = []
+    declaration = {}
+
+    def mark(*args):
+        # The end of an entry is known when the next node starts, since
+        # CurrentByteIndex of the end event points the start of its tag
+        # which might be an empty tag having '>' in its attribute values
+        if pending:
+            boundary[:] = parser.CurrentByteIndex, pending.pop()
+
+    def xml_decl(version, encoding, standalone):
+        declaration['encoding'] = encoding
+
+    def start_element(name, attrs):
+        mark()
+        stack.append(name)
+
+    def end_element(name):
+        mark()
+        stack.pop()
+        if name.rpartition(':')[2] in ('entry', 'item'):
+            pending.append(list(stack))
+    parser.XmlDeclHandler = xml_decl
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = mark
+    parser.CommentHandler = mark
+    parser.ProcessingInstructionHandler = mark
+    parser.StartCdataSectionHandler = mark
+    try:
+        parser.Parse(feed_xml, False)
+    except xml.parsers.expat.ExpatError:
+        pass
+    if not boundary:
+        return
+    end, open_elements = boundary
+    closing_tags = ''.join('</{0}>'.format(name)
+                           for name in reversed(open_elements))
+    encoding = declaration.get('encoding') or 'utf-8'
+    try:
+        if '</>'.encode(encoding) != b'</>':
+            # Not an ASCII-compatible encoding e.g. EBCDIC
+            return
+        closing_tags = closing_tags.encode(encoding)
+    except (LookupError, UnicodeError):
+        return
+    return feed_xml[:end] + closing_tags
+
+
+def discover_icon_url(page_url, timeout=DEFAULT_TIMEOUT, connection_pool=None,
+                      host_limiter=None):
+    """Discover the favicon url of the site of the given ``page_url``.
+    It fetches the page to find the icon link, and then falls back to
+    ``/favicon.ico`` of the site if it exists.
+
+    :param page_url: the url of the page e.g. the permalink of a feed
+    :type page_url: :class:`str`
+    :param timeout: optional timeout for connection attempts.
+                    :const:`DEFAULT_TIMEOUT` is used if omitted
+    :type timeout: :class:`numbers.Integral`
+    :param connection_pool: an optional pool of keep-alive connections
+    :type connection_pool: :class:`~libearth.connection.ConnectionPool`
+    :param host_limiter: an optional limiter of requests to each host
+    :type host_limiter: :class:`~libearth.politeness.HostLimiter`
+    :returns: the absolute favicon url, or :const:`None` if the site
+              has no favicon
+    :rtype: :class:`str`
+
+    .. versionadded:: 0.4.0
+
+    """
+    try:
+        f = open_url(page_url, timeout=timeout,
+                     connection_pool=connection_pool,
+                     host_limiter=host_limiter)
+    except urllib2.HTTPError as e:
+        e.close()
+    except IOError:
+        pass
+    else:
+        content_type = f.headers['content-type']
+        html = f.read()
+        f.close()
+        icon_url = find_icon_url(page_url, html, content_type)
+        if icon_url is not None:
+            return icon_url
+    icon_url = urlparse.urljoin(page_url, '/favicon.ico')
+    try:
+        f = open_url(Request(icon_url, method='HEAD'), timeout=timeout,
+                     connection_pool=connection_pool,
+                     host_limiter=host_limiter)
+    except urllib2.HTTPError as e:
+        e.close()
+    except (IOError, OSError):
+        pass
+    else:
+        status = f.getcode()
+        f.close()
+        if status == 200:
+            return icon_url
+
+
+def find_icon_url(base_uri, html, content_type=None):
+    """Find the favicon url from the given ``html`` using
+    :class:`~libearth.parser.autodiscovery.AutoDiscovery`.
+
+    :param base_uri: the url of the html page
+    :type base_uri: :class:`str`
+    :param html: the html of the page.  if it's :class:`bytes` it's decoded
+                 using the charset of ``content_type``
+    :type html: :class:`str`, :class:`bytes`
+    :param content_type: an optional content type of the response
+    :type content_type: :class:`str`
+    :returns: the absolute favicon url, or :const:`None` if the page
+              doesn't link any icon
+    :rtype: :class:`str`
+
+    .. versionadded:: 0.4.0
+
+    """
+    if isinstance(html, bytes) and not isinstance(html, str):
+        match = re.search(r';\s*charset\s*=\s*([^;\s]+)', content_type or '')
+        enc = match.group(1) if match else 'utf-8'
+        html = html.decode(enc, 'replace')
+    _, icon_urls = AutoDiscovery().find(html)
+    if icon_urls:
+        return urlparse.urljoin(base_uri, icon_urls[0])
+
+
+class ContentDecoder(object):
+    """Streaming decoder of the ``Content-Encoding`` of responses.
+    Chunks of the compressed body can be fed as they arrive, so that
+    the whole compressed body never needs to be buffered.
+
+    :param encoding: the ``Content-Encoding`` header value.
+                     ``'gzip'``, ``'deflate'`` and ``'identity'``
+                     are supported
+    :type encoding: :class:`str`
+    :raises ValueError: when the ``encoding`` is unsupported
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    def __init__(self, encoding=None):
+        encoding = (encoding or 'identity').strip().lower()
+        if encoding in ('gzip', 'x-gzip'):
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            # Decided by the first chunk since some servers send raw deflate
+            # streams without the zlib header.
+            self.decompressor = None
+        elif encoding == 'identity':
+            self.decompressor = False
+        else:
+            raise ValueError('unsupported content encoding: ' + repr(encoding))
+        self.encoding = encoding
+
+    @property
+    def pending(self):
+        """(:class:`bool`) Whether some of the fed chunks are left to be
+        decoded because of ``max_length`` of :meth:`decode()`.
+
+        """
+        return bool(self.decompressor and self.decompressor.unconsumed_tail)
+
+    def decode(self, chunk, max_length=0):
+        """Decode the given ``chunk`` of the response body.
+
+        A small compressed chunk can be decoded to a huge number of bytes,
+        so the result can be limited by ``max_length``.  The rest of
+        the chunk is kept (see :attr:`pending`), and decoded by following
+        calls first; pass an empty ``chunk`` to continue decoding it.
+
+        :param chunk: the next chunk of the encoded body
+        :type chunk: :class:`bytes`
+        :param max_length: the maximum number of bytes to decode.
+                           no limit if it's zero (which is the default)
+        :type max_length: :class:`numbers.Integral`
+        :returns: the decoded bytes so far.  it might be empty
+        :rtype: :class:`bytes`
+
+        """
+        if self.decompressor is False:
+            return chunk
+        elif self.decompressor is None:
+            if not chunk:
+                return chunk
+            header = bytearray(chunk[:2])
+            zlib_wrapped = (len(header) == 2 and header[0] & 0x0f == 8 and
+                            (header[0] << 8 | header[1]) % 31 == 0)
+            self.decompressor = zlib.decompressobj(
+                zlib.MAX_WBITS if zlib_wrapped else -zlib.MAX_WBITS
+            )
+        chunk = self.decompressor.unconsumed_tail + chunk
+        if not chunk:
+            return chunk
+        return self.decompressor.decompress(chunk, max_length)
+
+    def flush(self):
+        """Decode the rest of the response body.  It has to be called
+        after the last chunk is fed.
+
+        :returns: the rest of the decoded bytes
+        :rtype: :class:`bytes`
+
+        """
+        if self.decompressor:
+            return self.decompressor.flush()
+        return b''
+
+
+class DecodedResponse(object):
+    """File-like object which wraps the response returned by
+    :func:`urllib2.urlopen()` and transparently decodes its
+    ``Content-Encoding`` using :class:`ContentDecoder` while it's read.
+    Other attributes e.g. :meth:`info()`, :meth:`getcode()` are
+    delegated to the wrapped response.
+
+    :param response: the response to wrap
+    :param chunk_size: the number of bytes to read from the wrapped
+                       response at a time
+    :type chunk_size: :class:`numbers.Integral`
+    :param on_close: an optional function to be called once when
+                     the response is closed
+    :type on_close: :class:`collections.Callable`
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    #: (:class:`numbers.Integral`) The number of bytes read on the wire
+    #: so far, i.e. before decoding.
+    wire_bytes = None
+
+    #: (:class:`numbers.Integral`) The number of decoded bytes read so far.
+    decoded_bytes = None
+
+    def __init__(self, response, chunk_size=16 * 1024, on_close=None):
+        self.response = response
+        self.chunk_size = chunk_size
+        self.on_close = on_close
+        headers = response.info()
+        self.decoder = ContentDecoder(
+            headers.get('content-encoding')
+            if hasattr(headers, 'get') else None
+        )
+        self.buffer = []
+        self.buffered = 0
+        self.eof = False
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+        while not self.eof and (size < 0 or self.buffered < size):
+            # Decode no more than requested so that a small compressed
+            # chunk can't blow up the memory
+            max_length = 0 if size < 0 else size - self.buffered
+            if self.decoder.pending:
+                decoded = self.decoder.decode(b'', max_length)
+            else:
+                chunk = self.response.read(self.chunk_size)
+                if chunk:
+                    self.wire_bytes += len(chunk)
+                    decoded = self.decoder.decode(chunk, max_length)
+                else:
+                    self.eof = True
+                    decoded = self.decoder.flush()
+            if decoded:
+                self.buffer.append(decoded)
+                self.buffered += len(decoded)
+        data = self.buffer[0][:0].join(self.buffer) if self.buffer else b''
+        if 0 <= size < len(data):
+            data, rest = data[:size], data[size:]
+            self.buffer = [rest]
+            self.buffered = len(rest)
+        else:
+            self.buffer = []
+            self.buffered = 0
+        self.decoded_bytes += len(data)
+        return data
+
+    def close(self):
+        self.response.close()
+        on_close = self.on_close
+        if on_close is not None:
+            self.on_close = None
+            on_close()
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+
+class CrawlPhase(object):
+    """The measurement of a phase of a crawl.  See :class:`CrawlMetrics`.
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    #: (:class:`str`) The name of the phase e.g. ``'download'``.
+    name = None
+
+    #: (:class:`numbers.Real`) The duration of the phase in seconds.
+    seconds = None
+
+    #: (:class:`numbers.Integral`) The size the phase processed e.g.
+    #: the number of bytes downloaded.  It might be :const:`None`.
+    size = None
+
+    def __init__(self, name, seconds=None, size=None):
+        self.name = name
+        self.seconds = seconds
+        self.size = size
+
+    def __repr__(self):
+        return '{0.__module__}.{0.__name__}({1!r}, {2!r}, {3!r})'.format(
+            type(self), self.name, self.seconds, self.size
+        )
+
+
+class CrawlMetrics(object):
+    """The record of where the time of a crawl goes.  It's attached to
+    :attr:`CrawlResult.metrics` and :attr:`CrawlError.metrics`, so that
+    latency histograms can be built from them.
+
+    :func:`get_feed()` measures these phases in order, though some of
+    them can be absent e.g. if the response is
+    :attr:`~CrawlResult.unchanged`:
+
+    ``request``
+       From sending the request to receiving the response headers.
+       It includes name resolution, connecting, and following redirects.
+    ``download``
+       Reading (and decoding) the response body.  Its
+       :attr:`~CrawlPhase.size` is the number of bytes on the wire.
+    ``detect``
+       Detecting the format of the feed.
+    ``parse``
+       Parsing the feed.
+    ``sort``
+       Sorting entries.  Its :attr:`~CrawlPhase.size` is the number of
+       entries.
+    ``favicon``
+       Discovering the favicon over the network.
+
+    :param url: the crawled feed url
+    :type url: :class:`str`
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    #: (:class:`str`) The crawled feed url.
+    url = None
+
+    #: (:class:`numbers.Integral`) The HTTP status code of the final
+    #: response.  It might be :const:`None` if the request failed before
+    #: the response.
+    status = None
+
+    #: (:class:`collections.Sequence`) The urls the request was redirected
+    #: to, in order.  Empty if it wasn't redirected.
+    redirects = None
+
+    #: (:class:`collections.Sequence`) The measured :class:`CrawlPhase`
+    #: objects, in order.
+    phases = None
+
+    def __init__(self, url):
+        self.url = url
+        self.redirects = []
+        self.phases = []
+
+    @contextlib.contextmanager
+    def measure(self, name, size=None):
+        """Measure the duration of the phase in the :keyword:`with` block.
+        The :class:`CrawlPhase` is recorded even if the block raises
+        an exception::
+
+            with metrics.measure('download') as phase:
+                body = response.read()
+                phase.size = len(body)
+
+        :param name: the name of the phase
+        :type name: :class:`str`
+        :param size: the optional size the phase processes
+        :type size: :class:`numbers.Integral`
+        :returns: the context manager which results in :class:`CrawlPhase`
+
+        """
+        phase = CrawlPhase(name, size=size)
+        started_at = time.time()
+        try:
+            yield phase
+        finally:
+            phase.seconds = time.time() - started_at
+            self.phases.append(phase)
+
+    def get(self, name):
+        """Get the total duration of the phases of the given ``name``.
+
+        :param name: the name of the phase
+        :type name: :class:`str`
+        :returns: the duration in seconds, or :const:`None` if there's
+                  no such phase
+        :rtype: :class:`numbers.Real`
+
+        """
+        seconds = [phase.seconds for phase in self.phases
+                   if phase.name == name]
+        return sum(seconds) if seconds else None
+
+    @property
+    def seconds(self):
+        """(:class:`numbers.Real`) The total duration of all phases."""
+        return sum(phase.seconds for phase in self.phases)
+
+    def __repr__(self):
+        return '<{0.__module__}.{0.__name__} {1!r} status={2!r} ' \
+               '{3}>'.format(type(self), self.url, self.status,
+                             ' '.join('{0}={1:.3f}s'.format(p.name, p.seconds)
+                                      for p in self.phases))
+
+
+class RedirectChain(dict):
+    """The ``redirect_dict`` of :class:`urllib2.Request` which remembers
+    the order of redirected urls as well.  :mod:`urllib2` shares
+    the ``redirect_dict`` of the original request with redirected requests,
+    so setting it to the original request makes the chain observable.
+    Status codes of redirects are kept in ``statuses`` as well if
+    :class:`~libearth.connection.RedirectHandler` follows them.
+
+    .. note::
+
+       This class is intended to be internal.
+
+    """
+
+    def __init__(self):
+        super(RedirectChain, self).__init__()
+        self.urls = []
+        # Filled by libearth.connection.RedirectHandler if it's used
+        self.statuses = {}
+
+    def __setitem__(self, url, count):
+        if url not in self:
+            self.urls.append(url)
+        super(RedirectChain, self).__setitem__(url, count)
+
+    @property
+    def final_url(self):
+        """(:class:`str`) The last redirected url.  :const:`None` if
+        the request wasn't redirected.
+
+        """
+        return self.urls[-1] if self.urls else None
+
+    @property
+    def permanent_url(self):
+        """(:class:`str`) The last url reached by only permanent redirects
+        from the start.  :const:`None` if the first redirect isn't
+        permanent or the status codes weren't recorded.
+
+        """
+        return get_permanent_url(self.urls,
+                                 [self.statuses.get(u) for u in self.urls])
+
+
+def get_permanent_url(urls, statuses):
+    """Find the last url reached by only permanent redirects.
+
+    :param urls: the urls the request was redirected to, in order
+    :type urls: :class:`collections.Sequence`
+    :param statuses: the status codes of the redirects to ``urls``
+    :type statuses: :class:`collections.Sequence`
+    :returns: the permanent url, or :const:`None` if the first redirect
+              isn't permanent
+    :rtype: :class:`str`
+
+    .. note::
+
+       Internal function.
+
+    """
+    permanent_url = None
+    for url, status in zip(urls, statuses):
+        if status not in PERMANENT_REDIRECT_CODES:
+            break
+        permanent_url = url
+    return permanent_url
 
 
 class CrawlResult(collections.Sequence):
@@ -176,11 +1386,93 @@ class CrawlResult(collections.Sequence):
     #: It might be :const:`None`.
     icon_url = None
 
-    def __init__(self, url, feed, hints, icon_url=None):
+    #: (:class:`bool`) Whether the server answered ``304 Not Modified``
+    #: to the conditional request.  If it's :const:`True` the response
+    #: wasn't parsed at all, so :attr:`feed` and :attr:`hints` are
+    #: :const:`None`.  There's nothing to merge in that case.
+    #:
+    #: .. versionadded:: 0.4.0
+    not_modified = False
+
+    #: (:class:`bool`) Whether the feed is unchanged since the last crawl,
+    #: i.e. the response body is byte-identical to the last one, or
+    #: it's :attr:`not_modified`.  If it's :const:`True` the response
+    #: wasn't parsed at all, so :attr:`feed` and :attr:`hints` are
+    #: :const:`None`, and it can be skipped to merge into the stage.
+    #:
+    #: .. versionadded:: 0.4.0
+    unchanged = False
+
+    #: (:class:`numbers.Integral`) The number of bytes of the feed response
+    #: body transferred on the wire.  It's smaller than :attr:`decoded_bytes`
+    #: if the response was compressed.  It might be :const:`None`.
+    #:
+    #: .. versionadded:: 0.4.0
+    wire_bytes = None
+
+    #: (:class:`numbers.Integral`) The number of bytes of the feed response
+    #: body after ``Content-Encoding`` is decoded.  It might be
+    #: :const:`None`.
+    #:
+    #: .. versionadded:: 0.4.0
+    decoded_bytes = None
+
+    #: (:class:`collections.Mapping`) The response headers of the feed
+    #: e.g. ``Cache-Control``, ``Expires``.  It might be :const:`None`.
+    #:
+    #: .. versionadded:: 0.4.0
+    headers = None
+
+    #: (:class:`CrawlMetrics`) The durations of each phase of the crawl,
+    #: the status code and the redirect chain.  It might be :const:`None`.
+    #:
+    #: .. versionadded:: 0.4.0
+    metrics = None
+
+    #: (:class:`bool`) Whether the response was larger than ``max_size``
+    #: of :func:`get_feed()`, and the :attr:`feed` lacks entries after
+    #: the size limit.
+    #:
+    #: .. versionadded:: 0.4.0
+    truncated = False
+
+    #: (:class:`str`) The url the :attr:`feed` was finally fetched from.
+    #: It's the same to :attr:`url` unless the request was redirected.
+    #:
+    #: .. versionadded:: 0.4.0
+    final_url = None
+
+    #: (:class:`str`) The url the feed has permanently moved to, i.e.
+    #: the last url reached by only ``301 Moved Permanently`` and
+    #: ``308 Permanent Redirect`` from :attr:`url`.  It's :const:`None`
+    #: if the feed hasn't permanently moved.  Subscriptions of the feed
+    #: should be relocated to it (see :meth:`relocate_subscription()`)
+    #: so that later crawls go straight to it.
+    #:
+    #: Status codes of redirects are only known when requests are
+    #: made through :class:`~libearth.connection.RedirectHandler`, e.g.
+    #: with ``connection_pool``, or by :mod:`libearth.aiocrawler`.
+    #:
+    #: .. versionadded:: 0.4.0
+    permanent_url = None
+
+    def __init__(self, url, feed, hints, icon_url=None, not_modified=False,
+                 wire_bytes=None, decoded_bytes=None, headers=None,
+                 unchanged=False, metrics=None, truncated=False,
+                 final_url=None, permanent_url=None):
         self.url = url
+        self.final_url = url if final_url is None else final_url
+        self.permanent_url = permanent_url
         self.feed = feed
         self.hints = hints
         self.icon_url = icon_url
+        self.not_modified = bool(not_modified)
+        self.unchanged = bool(unchanged or not_modified)
+        self.metrics = metrics
+        self.truncated = bool(truncated)
+        self.wire_bytes = wire_bytes
+        self.decoded_bytes = decoded_bytes
+        self.headers = headers
 
     def add_as_subscription(self, subscription_set):
         """Add it as a subscription to the given ``subscription_set``.
@@ -190,6 +1482,7 @@ class CrawlResult(collections.Sequence):
         :type subscription_set: :class:`~libearth.subscribe.SubscriptionSet`
         :returns: the created subscription object
         :rtype: :class:`~libearth.subscribe.Subscription`
+        :raises ValueError: when the result is :attr:`unchanged`
 
         """
         if not isinstance(subscription_set, SubscriptionSet):
@@ -197,8 +1490,46 @@ class CrawlResult(collections.Sequence):
                 'expected an instance of {0.__module__}.{0.__name__}, '
                 'not {1!r}'.format(SubscriptionSet, subscription_set)
             )
+        elif self.feed is None:
+            raise ValueError('{0} has no feed to subscribe; it was '
+                             'unchanged since the last crawl'.format(self.url))
         return subscription_set.subscribe(self.feed, icon_uri=self.icon_url)
 
+    @property
+    def permanent_redirect(self):
+        """(:class:`bool`) Whether the feed has permanently moved to
+        :attr:`permanent_url`.
+
+        .. versionadded:: 0.4.0
+
+        """
+        return self.permanent_url is not None
+
+    def relocate_subscription(self, subscription_set):
+        """Relocate subscriptions of the feed in the given
+        ``subscription_set`` to :attr:`permanent_url` if the feed has
+        permanently moved.  See also
+        :meth:`SubscriptionSet.relocate()
+        <libearth.subscribe.SubscriptionSet.relocate>`.
+
+        :param subscription_set: a subscription list or category to
+                                 find subscriptions in
+        :type subscription_set: :class:`~libearth.subscribe.SubscriptionSet`
+        :returns: the number of relocated subscriptions
+        :rtype: :class:`numbers.Integral`
+
+        .. versionadded:: 0.4.0
+
+        """
+        if not isinstance(subscription_set, SubscriptionSet):
+            raise TypeError(
+                'expected an instance of {0.__module__}.{0.__name__}, '
+                'not {1!r}'.format(SubscriptionSet, subscription_set)
+            )
+        elif self.permanent_url is None:
+            return 0
+        return subscription_set.relocate(self.url, self.permanent_url)
+
     def __len__(self):
         return 3
 
@@ -212,6 +1543,310 @@ class CrawlResult(collections.Sequence):
         raise IndexError('index out of range')
 
 
+class Validators(DocumentElement):
+    """HTTP cache validators of the last response of a feed.  They are
+    sent together on the next crawl to make a conditional request.
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    __tag__ = 'validators'
+    __xmlns__ = CRAWLER_XMLNS
+
+    #: (:class:`str`) The feed url the validators belong to.
+    url = Attribute('url')
+
+    #: (:class:`str`) The ``ETag`` header value of the last response.
+    #: It might be :const:`None`.
+    etag = Text('etag', xmlns=CRAWLER_XMLNS)
+
+    #: (:class:`str`) The ``Last-Modified`` header value of the last response.
+    #: It might be :const:`None`.
+    last_modified = Text('last-modified', xmlns=CRAWLER_XMLNS)
+
+    #: (:class:`str`) The SHA1 hex digest of the last response body.
+    #: It might be :const:`None`.
+    #:
+    #: .. versionadded:: 0.4.0
+    digest = Text('digest', xmlns=CRAWLER_XMLNS)
+
+    @classmethod
+    def from_headers(cls, url, headers, body=None):
+        """Take validators from the given response ``headers``.
+
+        :param url: the feed url the response belongs to
+        :type url: :class:`str`
+        :param headers: the response headers
+        :type headers: :class:`collections.Mapping`
+        :param body: the optional response body to take its :attr:`digest`
+        :type body: :class:`bytes`
+        :returns: the validators, or :const:`None` if the response has
+                  no validators at all
+        :rtype: :class:`Validators`
+
+        .. versionadded:: 0.4.0
+
+           Added optional ``body`` parameter.
+
+        """
+        etag = headers.get('etag')
+        last_modified = headers.get('last-modified')
+        if body is not None:
+            if not isinstance(body, bytes):
+                body = body.encode('utf-8')
+            digest = hashlib.sha1(body).hexdigest()
+            return cls(url=url, etag=etag, last_modified=last_modified,
+                       digest=digest)
+        elif etag or last_modified:
+            return cls(url=url, etag=etag, last_modified=last_modified)
+
+    def __repr__(self):
+        return '<{0.__module__}.{0.__name__} {1!r} etag={2!r} ' \
+               'last_modified={3!r}>'.format(type(self), self.url,
+                                             self.etag, self.last_modified)
+
+
+class ValidatorStore(object):
+    """The interface of stores that keep :class:`Validators` for each feed
+    url.  Pass it to :func:`get_feed()` or :func:`crawl()` to make
+    conditional requests.
+
+    Builtin implementations are :class:`MemoryValidatorStore`, and
+    :class:`RepositoryValidatorStore` which survives restarts.
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    def get(self, url):
+        """Find the validators of the given feed ``url``.
+
+        :param url: the feed url
+        :type url: :class:`str`
+        :returns: the stored validators, or :const:`None` if there's
+                  nothing stored for the ``url``
+        :rtype: :class:`Validators`
+
+        .. note::
+
+           Every subclass of :class:`ValidatorStore` has to override
+           :meth:`get()` method to implement details.
+
+        """
+        raise NotImplementedError(
+            'every subclass of {0.__module__}.{0.__name__} has to '
+            'implement get() method'.format(ValidatorStore)
+        )
+
+    def set(self, url, validators):
+        """Store the ``validators`` of the given feed ``url``.
+
+        :param url: the feed url
+        :type url: :class:`str`
+        :param validators: the validators to store
+        :type validators: :class:`Validators`
+
+        .. note::
+
+           Every subclass of :class:`ValidatorStore` has to override
+           :meth:`set()` method to implement details.
+
+        """
+        raise NotImplementedError(
+            'every subclass of {0.__module__}.{0.__name__} has to '
+            'implement set() method'.format(ValidatorStore)
+        )
+
+
+class MemoryValidatorStore(ValidatorStore):
+    """:class:`ValidatorStore` which simply keeps validators in memory.
+    Stored validators are lost when the process ends.
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    def __init__(self):
+        self.validators = {}
+
+    def get(self, url):
+        return self.validators.get(url)
+
+    def set(self, url, validators):
+        if not isinstance(validators, Validators):
+            raise TypeError(
+                'validators must be an instance of {0.__module__}.'
+                '{0.__name__}, not {1!r}'.format(Validators, validators)
+            )
+        self.validators[url] = validators
+
+
+class RepositoryValidatorStore(ValidatorStore):
+    """:class:`ValidatorStore` which persists validators into
+    the ``repository``, so that they survive restarts.  Each feed url
+    becomes a small XML document under the ``key``.
+
+    :param repository: the repository to store validators
+    :type repository: :class:`~libearth.repository.Repository`
+    :param key: the repository key of the directory where validators
+                are stored.  ``['.crawler', 'validators']`` by default
+    :type key: :class:`collections.Sequence`
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    #: (:class:`~libearth.repository.Repository`) The repository where
+    #: validators are stored.
+    repository = None
+
+    #: (:class:`collections.Sequence`) The repository key of the directory
+    #: where validators are stored.
+    key = None
+
+    def __init__(self, repository, key=('.crawler', 'validators')):
+        if not isinstance(repository, Repository):
+            raise TypeError(
+                'repository must be an instance of {0.__module__}.'
+                '{0.__name__}, not {1!r}'.format(Repository, repository)
+            )
+        self.repository = repository
+        self.key = list(key)
+        self.lock = threading.RLock()
+
+    def get_key(self, url):
+        """Get the repository key to store the validators of
+        the given ``url``.
+
+        :param url: the feed url
+        :type url: :class:`str`
+        :returns: the repository key
+        :rtype: :class:`collections.Sequence`
+
+        """
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return self.key + [digest + '.xml']
+
+    def get(self, url):
+        key = self.get_key(url)
+        with self.lock:
+            try:
+                chunks = list(self.repository.read(key))
+            except RepositoryKeyError:
+                return
+        validators = read(Validators, chunks)
+        if validators.url == url:
+            return validators
+
+    def set(self, url, validators):
+        if not isinstance(validators, Validators):
+            raise TypeError(
+                'validators must be an instance of {0.__module__}.'
+                '{0.__name__}, not {1!r}'.format(Validators, validators)
+            )
+        validators.url = url
+        with self.lock:
+            self.repository.write(self.get_key(url),
+                                  write(validators, as_bytes=True))
+
+    def __repr__(self):
+        return '{0.__module__}.{0.__name__}({1!r}, {2!r})'.format(
+            type(self), self.repository, self.key
+        )
+
+
+class IconCache(object):
+    """Thread-safe cache of favicon urls keyed by site origin (scheme,
+    host and port), so that favicons of feeds of the same site are
+    discovered only once.  It also remembers sites without any favicon
+    (negative caching), but for a shorter time.
+
+    Entries are kept in memory, and expire after their TTL.
+
+    :param ttl: the number of seconds to keep found favicon urls.
+                :const:`DEFAULT_ICON_TTL` by default
+    :type ttl: :class:`numbers.Real`
+    :param negative_ttl: the number of seconds to remember that the site
+                         has no favicon.
+                         :const:`DEFAULT_NEGATIVE_ICON_TTL` by default
+    :type negative_ttl: :class:`numbers.Real`
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    #: (:class:`numbers.Real`) The number of seconds to keep found
+    #: favicon urls.
+    ttl = None
+
+    #: (:class:`numbers.Real`) The number of seconds to remember that
+    #: the site has no favicon.
+    negative_ttl = None
+
+    def __init__(self, ttl=DEFAULT_ICON_TTL,
+                 negative_ttl=DEFAULT_NEGATIVE_ICON_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_origin(url):
+        """Get the origin of the given ``url``, which is used as the key.
+
+        :param url: the url of a page of the site
+        :type url: :class:`str`
+        :returns: the origin e.g. ``'http://example.com:8080'``
+        :rtype: :class:`str`
+
+        """
+        parsed = urlparse.urlsplit(url)
+        return '{0}://{1}'.format(parsed.scheme.lower(), parsed.netloc.lower())
+
+    def get(self, url):
+        """Find the cached favicon url of the site of the given ``url``.
+
+        :param url: the url of a page of the site
+        :type url: :class:`str`
+        :returns: the cached favicon url, or :const:`None` if the site is
+                  known to have no favicon
+        :rtype: :class:`str`
+        :raises KeyError: when nothing is cached for the site, or
+                          the cached entry has expired
+
+        """
+        origin = self.get_origin(url)
+        with self.lock:
+            icon_url, expires_at = self.entries[origin]
+            if expires_at <= time.time():
+                del self.entries[origin]
+                raise KeyError(origin)
+        return icon_url
+
+    def set(self, url, icon_url):
+        """Cache the favicon url of the site of the given ``url``.
+
+        :param url: the url of a page of the site
+        :type url: :class:`str`
+        :param icon_url: the favicon url, or :const:`None` if the site
+                         has no favicon
+        :type icon_url: :class:`str`
+
+        """
+        ttl = self.negative_ttl if icon_url is None else self.ttl
+        with self.lock:
+            self.entries[self.get_origin(url)] = icon_url, time.time() + ttl
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return '{0.__module__}.{0.__name__}(ttl={1!r}, ' \
+               'negative_ttl={2!r})'.format(type(self), self.ttl,
+                                            self.negative_ttl)
+
+
 class CrawlError(IOError):
     """Error which rises when crawling given url failed.
 
@@ -224,9 +1859,73 @@ class CrawlError(IOError):
     #: (:class:`str`) The errored feed uri.
     feed_uri = None
 
+    #: (:class:`CrawlMetrics`) The durations of phases done until the crawl
+    #: failed.  It might be :const:`None`.
+    #:
+    #: .. versionadded:: 0.4.0
+    metrics = None
+
+    #: (:class:`str`) The kind of the failure.  One of
+    #: :const:`DNS_FAILURE`, :const:`TIMEOUT_FAILURE`,
+    #: :const:`NETWORK_FAILURE`, :const:`CLIENT_FAILURE`,
+    #: :const:`SERVER_FAILURE`, :const:`THROTTLED_FAILURE`,
+    #: :const:`PARSE_FAILURE` and :const:`SIZE_FAILURE`.  It might be
+    #: :const:`None` if it's unknown.
+    #: See also :func:`classify_error()`.
+    #:
+    #: .. versionadded:: 0.4.0
+    kind = None
+
     def __init__(self, feed_uri, *args, **kwargs):
+        kind = kwargs.pop('kind', None)
         super(CrawlError, self).__init__(*args, **kwargs)
         self.feed_uri = feed_uri
+        self.kind = kind
+
+    def __reduce__(self):
+        # It can be raised in worker processes (see parse_pool parameter of
+        # get_feed()), so it has to survive pickling with its feed_uri.
+        return type(self), (self.feed_uri,) + self.args, self.__dict__
+
+
+def classify_error(error, status=None):
+    """Classify the ``error`` raised while crawling into one of
+    :const:`DNS_FAILURE`, :const:`TIMEOUT_FAILURE`, :const:`NETWORK_FAILURE`,
+    :const:`CLIENT_FAILURE`, :const:`SERVER_FAILURE`,
+    :const:`THROTTLED_FAILURE` and :const:`PARSE_FAILURE`.  Errors that
+    aren't I/O errors are considered parse errors, except :exc:`zlib.error`
+    from decoding corrupt compressed bodies is considered a network failure.
+
+    :param error: the raised error
+    :type error: :class:`Exception`
+    :param status: the HTTP status code of the response if it's received
+    :type status: :class:`numbers.Integral`
+    :returns: the kind of the failure
+    :rtype: :class:`str`
+
+    .. versionadded:: 0.4.0
+
+    """
+    if isinstance(error, CrawlError) and error.kind is not None:
+        return error.kind
+    elif isinstance(error, HostThrottledError):
+        return THROTTLED_FAILURE
+    elif isinstance(error, urllib2.HTTPError):
+        status = error.code
+    if status is not None and status >= 400:
+        if status >= 500 or status in (408, 429):
+            return SERVER_FAILURE
+        return CLIENT_FAILURE
+    reason = getattr(error, 'reason', None)
+    if isinstance(error, urllib2.URLError) and isinstance(reason, Exception):
+        error = reason
+    if isinstance(error, socket.timeout):
+        return TIMEOUT_FAILURE
+    elif isinstance(error, socket.gaierror):
+        return DNS_FAILURE
+    elif isinstance(error, (IOError, OSError, socket.error, zlib.error)):
+        return NETWORK_FAILURE
+    return PARSE_FAILURE
 
 
 if sys.version_info >= (3, 3):
@@ -0,0 +1,220 @@
+""":mod:`libearth.dnscache` --- Caching DNS resolution
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Every new connection resolves its hostname again through the system
+resolver, which isn't cached at all on hosts without a caching daemon
+like nscd.  :class:`DNSCache` keeps resolved addresses in memory for
+a while, and also remembers names that failed to resolve so that dead
+hosts don't cost a lookup for every feed.  It's opt-in, and used by
+:class:`~libearth.connection.ConnectionPool`::
+
+    dns_cache = DNSCache(ttl=300)
+    pool = ConnectionPool(dns_cache=dns_cache)
+    results = crawl(feed_urls, pool_size=16, connection_pool=pool)
+    print(dns_cache.stats())
+
+.. versionadded:: 0.4.0
+
+"""
+import collections
+import socket
+import threading
+import time
+
+__all__ = ('DEFAULT_MAX_SIZE', 'DEFAULT_NEGATIVE_TTL', 'DEFAULT_TTL',
+           'DNSCache', 'DNSCacheStats')
+
+
+#: (:class:`numbers.Real`) The default number of seconds to keep resolved
+#: addresses.  Five minutes.
+DEFAULT_TTL = 5 * 60
+
+#: (:class:`numbers.Real`) The default number of seconds to remember
+#: names that failed to resolve.
+DEFAULT_NEGATIVE_TTL = 30
+
+#: (:class:`numbers.Integral`) The default maximum number of names
+#: to keep.
+DEFAULT_MAX_SIZE = 1024
+
+#: (:class:`type`) The snapshot of :class:`DNSCache` counters, which
+#: :meth:`DNSCache.stats()` returns.
+#:
+#: ``hits``
+#:    The number of lookups answered by cached addresses.
+#: ``negative_hits``
+#:    The number of lookups answered by cached failures.
+#: ``misses``
+#:    The number of lookups sent to the system resolver.
+#: ``evictions``
+#:    The number of names evicted before they expired, to keep
+#:    :attr:`~DNSCache.max_size`.
+#: ``size``
+#:    The number of currently cached names.
+DNSCacheStats = collections.namedtuple(
+    'DNSCacheStats',
+    'hits negative_hits misses evictions size'
+)
+
+
+class DNSCache(object):
+    """Thread-safe cache of :func:`socket.getaddrinfo()` results with
+    expiration.
+
+    :param ttl: the number of seconds to keep resolved addresses.
+                :const:`DEFAULT_TTL` by default
+    :type ttl: :class:`numbers.Real`
+    :param negative_ttl: the number of seconds to remember names that
+                         failed to resolve.  zero disables negative
+                         caching.  :const:`DEFAULT_NEGATIVE_TTL` by default
+    :type negative_ttl: :class:`numbers.Real`
+    :param max_size: the maximum number of names to keep.  if it's full
+                     the name to expire soonest is evicted.
+                     :const:`DEFAULT_MAX_SIZE` by default
+    :type max_size: :class:`numbers.Integral`
+
+    """
+
+    #: (:class:`numbers.Real`) The number of seconds to keep resolved
+    #: addresses.
+    ttl = None
+
+    #: (:class:`numbers.Real`) The number of seconds to remember names
+    #: that failed to resolve.
+    negative_ttl = None
+
+    #: (:class:`numbers.Integral`) The maximum number of names to keep.
+    max_size = None
+
+    def __init__(self, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 max_size=DEFAULT_MAX_SIZE):
+        if max_size < 1:
+            raise ValueError('max_size must be greater than zero')
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.counters = dict.fromkeys(('hits', 'negative_hits', 'misses',
+                                       'evictions'), 0)
+
+    def getaddrinfo(self, host, port):
+        """Resolve the ``host`` in the same way to :func:`socket.getaddrinfo()`
+        for stream sockets, except the result is cached.
+
+        :param host: the hostname to resolve
+        :type host: :class:`str`
+        :param port: the port number
+        :type port: :class:`numbers.Integral`
+        :returns: the list of 5-tuples of (family, socktype, proto,
+                  canonname, sockaddr)
+        :rtype: :class:`collections.Sequence`
+        :raises socket.gaierror: when the ``host`` failed to resolve.
+                                 the failure is cached as well
+
+        """
+        key = host.lower(), port
+        now = time.time()
+        with self.lock:
+            try:
+                expires_at, addresses, error = self.entries[key]
+            except KeyError:
+                pass
+            else:
+                if expires_at > now:
+                    if error is None:
+                        self.counters['hits'] += 1
+                        return addresses
+                    self.counters['negative_hits'] += 1
+                    raise socket.gaierror(*error.args)
+                del self.entries[key]
+            self.counters['misses'] += 1
+        try:
+            addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            if self.negative_ttl > 0:
+                self.store(key, (now + self.negative_ttl, None, e))
+            raise
+        self.store(key, (now + self.ttl, addresses, None))
+        return addresses
+
+    def store(self, key, entry):
+        """Store the ``entry`` for the ``key``, and evict another entry
+        if it's full.
+
+        .. note::
+
+           Internal method.
+
+        """
+        with self.lock:
+            entries = self.entries
+            if key not in entries and len(entries) >= self.max_size:
+                now = time.time()
+                expired = [k for k, (expires_at, _, _) in entries.items()
+                           if expires_at <= now]
+                if expired:
+                    for k in expired:
+                        del entries[k]
+                else:
+                    del entries[min(entries, key=lambda k: entries[k][0])]
+                    self.counters['evictions'] += 1
+            entries[key] = entry
+
+    def create_connection(self, address,
+                          timeout=socket._GLOBAL_DEFAULT_TIMEOUT,
+                          source_address=None):
+        """Connect to the ``address`` in the same way to
+        :func:`socket.create_connection()`, except its host is resolved
+        through the cache.  It can be set to ``_create_connection`` of
+        :class:`httplib.HTTPConnection` objects.
+
+        :param address: the pair of (host, port)
+        :type address: :class:`tuple`
+        :param timeout: optional timeout in seconds
+        :type timeout: :class:`numbers.Real`
+        :param source_address: optional pair of (host, port) to bind
+        :type source_address: :class:`tuple`
+        :returns: the connected socket
+        :rtype: :class:`socket.socket`
+
+        """
+        host, port = address
+        error = None
+        addresses = self.getaddrinfo(host, port)
+        for family, socktype, proto, _, sockaddr in addresses:
+            sock = None
+            try:
+                sock = socket.socket(family, socktype, proto)
+                if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+                return sock
+            except socket.error as e:
+                error = e
+                if sock is not None:
+                    sock.close()
+        if error is not None:
+            raise error
+        raise socket.error('getaddrinfo returns an empty list')
+
+    def clear(self):
+        """Forget all cached names."""
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Take a snapshot of counters.
+
+        :returns: the counters of the cache
+        :rtype: :class:`DNSCacheStats`
+
+        """
+        with self.lock:
+            return DNSCacheStats(size=len(self.entries), **self.counters)
+
+    def __repr__(self):
+        return '<{0.__module__}.{0.__name__} {1!r}>'.format(type(self),
+                                                            self.stats())
@@ -701,11 +701,13 @@ class Entry(DocumentElement, Metadata):
         for attribute in 'read', 'starred':
             self_mark = getattr(self, attribute)
             other_mark = getattr(other, attribute)
-            if self_mark is None:
+            if other_mark is None:
+                continue
+            elif self_mark is not None:
+                other_mark = self_mark.__merge_entities__(other_mark)
+            # Not to invalidate the source of the unchanged entry
+            if other_mark is not self_mark:
                 setattr(self, attribute, other_mark)
-            elif self_mark is not None and other_mark is not None:
-                merged_mark = self_mark.__merge_entities__(other_mark)
-                setattr(self, attribute, merged_mark)
         return self
 
 
@@ -141,6 +141,52 @@ def parse_guid(element, session):
     return None, session
 
 
+#: (:class:`collections.Sequence`) The valid day names of ``<skipDays>``.
+SKIP_DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday',
+             'Saturday', 'Sunday')
+
+
+def parse_crawler_hints(channel):
+    """Take crawler hints from the ``<ttl>``, ``<skipHours>`` and
+    ``<skipDays>`` elements of the given RSS ``channel``.  Invalid values
+    are ignored.
+
+    :param channel: the ``<channel>`` element
+    :returns: the crawler hints, or :const:`None` if the channel has
+              no hints at all.  ``'ttl'`` is the number of minutes,
+              ``'skipHours'`` is a set of hours (0--23, GMT), and
+              ``'skipDays'`` is a set of day names e.g. ``'Sunday'``
+    :rtype: :class:`collections.Mapping`
+
+    .. versionadded:: 0.4.0
+
+    """
+    hints = {}
+    ttl = channel.find('ttl')
+    if ttl is not None and ttl.text:
+        try:
+            ttl = int(ttl.text.strip())
+        except ValueError:
+            pass
+        else:
+            if ttl > 0:
+                hints['ttl'] = ttl
+    hours = set()
+    for hour in channel.findall('skipHours/hour'):
+        try:
+            hours.add(int((hour.text or '').strip()) % 24)
+        except ValueError:
+            pass
+    if hours:
+        hints['skipHours'] = frozenset(hours)
+    days = frozenset((day.text or '').strip().capitalize()
+                     for day in channel.findall('skipDays/day'))
+    days = days.intersection(SKIP_DAYS)
+    if days:
+        hints['skipDays'] = days
+    return hints or None
+
+
 def parse_rss2(xml, feed_url=None, parse_entry=True):
     """Parse RSS 2.0 XML and translate it into Atom.
 
@@ -156,9 +202,15 @@ def parse_rss2(xml, feed_url=None, parse_entry=True):
                        it's useful when to ignore items when retrieve
                        ``<source>``.  :const:`True` by default
     :type parse_item: :class:`bool`
-    :returns: a pair of (:class:`~libearth.feed.Feed`, crawler hint)
+    :returns: a pair of (:class:`~libearth.feed.Feed`, crawler hint).
+              see also :func:`parse_crawler_hints()`
     :rtype: :class:`tuple`
 
+    .. versionchanged:: 0.4.0
+
+       Crawler hints became filled from ``<ttl>``, ``<skipHours>`` and
+       ``<skipDays>``.
+
     """
     root = fromstring(normalize_xml_encoding(xml))
     channel = root.find('channel')
@@ -172,4 +224,4 @@ def parse_rss2(xml, feed_url=None, parse_entry=True):
             entry_list.append(parse_item(item, session))
         feed_data.entries = entry_list
     make_legal_as_atom(feed_data, session)
-    return feed_data, None
+    return feed_data, parse_crawler_hints(channel)
@@ -0,0 +1,309 @@
+""":mod:`libearth.politeness` --- Per-host rate limiting
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Crawling many feeds of the same host in parallel easily looks like
+an attack to the host, and gets the crawler throttled or banned.
+:class:`HostLimiter` limits the number of concurrent requests to each host,
+and keeps the minimum delay between them.  It also backs off from hosts
+that answer ``429 Too Many Requests`` or ``503 Service Unavailable``
+with respect to their ``Retry-After`` header::
+
+    limiter = HostLimiter(max_per_host=2, min_delay=1)
+    results = crawl(feed_urls, pool_size=16, host_limiter=limiter)
+
+:func:`~libearth.crawler.crawl()` also interleaves feeds of different
+hosts (see :func:`interleave_by_host()`) so that workers are kept busy
+with other hosts while a host is being waited.
+
+.. versionadded:: 0.4.0
+
+"""
+import collections
+import email.utils
+import threading
+import time
+
+try:
+    import urllib.parse as urlparse
+except ImportError:
+    import urlparse
+
+__all__ = ('DEFAULT_MAX_PER_HOST', 'DEFAULT_MAX_RETRY_AFTER',
+           'DEFAULT_MIN_DELAY', 'DEFAULT_THROTTLE_DELAY', 'THROTTLE_CODES',
+           'HostLimiter', 'HostThrottledError', 'get_host',
+           'interleave_by_host', 'parse_retry_after')
+
+
+#: (:class:`numbers.Integral`) The default maximum number of concurrent
+#: requests to each host.
+DEFAULT_MAX_PER_HOST = 2
+
+#: (:class:`numbers.Real`) The default minimum number of seconds between
+#: requests to the same host.
+DEFAULT_MIN_DELAY = 1
+
+#: (:class:`numbers.Real`) The default number of seconds to back off from
+#: a host that throttles without ``Retry-After``.
+DEFAULT_THROTTLE_DELAY = 60
+
+#: (:class:`numbers.Real`) The default maximum number of seconds to respect
+#: ``Retry-After``.  An hour.
+DEFAULT_MAX_RETRY_AFTER = 60 * 60
+
+#: (:class:`collections.Set`) HTTP status codes of throttling responses.
+THROTTLE_CODES = frozenset([429, 503])
+
+
+def get_host(url):
+    """Get the host (including the port if present) of the given ``url``.
+
+    :param url: the url
+    :type url: :class:`str`
+    :returns: the lowercased host
+    :rtype: :class:`str`
+
+    """
+    return urlparse.urlsplit(url).netloc.rpartition('@')[2].lower()
+
+
+def interleave_by_host(urls):
+    """Reorder the given ``urls`` so that urls of the same host are spread
+    out as much as possible, in round-robin fashion.  Relative order of
+    urls of each host is kept.
+
+    >>> interleave_by_host(['http://a/1', 'http://a/2', 'http://b/1'])
+    ['http://a/1', 'http://b/1', 'http://a/2']
+
+    :param urls: urls to reorder
+    :type urls: :class:`collections.Iterable`
+    :returns: the reordered urls
+    :rtype: :class:`collections.Sequence`
+
+    """
+    queues = []
+    host_queues = {}
+    for url in urls:
+        host = get_host(url)
+        try:
+            queue = host_queues[host]
+        except KeyError:
+            queue = host_queues[host] = collections.deque()
+            queues.append(queue)
+        queue.append(url)
+    result = []
+    while queues:
+        for queue in queues:
+            result.append(queue.popleft())
+        queues = [queue for queue in queues if queue]
+    return result
+
+
+def parse_retry_after(value, now=None):
+    """Parse the ``Retry-After`` header value.
+
+    :param value: the header value, either the number of seconds or
+                  an HTTP date
+    :type value: :class:`str`
+    :param now: the current unix time.  :func:`time.time()` by default
+    :type now: :class:`numbers.Real`
+    :returns: the number of seconds to wait, or :const:`None` if the value
+              is invalid
+    :rtype: :class:`numbers.Real`
+
+    """
+    if not value:
+        return
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    date = email.utils.parsedate_tz(value)
+    if date is None:
+        return
+    if now is None:
+        now = time.time()
+    return max(0, email.utils.mktime_tz(date) - now)
+
+
+class HostThrottledError(IOError):
+    """Raised by :meth:`HostLimiter.acquire()` when the host is held off
+    longer than the caller is willing to wait.
+
+    """
+
+    #: (:class:`str`) The throttled host.
+    host = None
+
+    #: (:class:`numbers.Real`) The number of seconds the host is held off.
+    wait = None
+
+    def __init__(self, host, wait):
+        super(HostThrottledError, self).__init__(
+            '{0} is throttled for {1:.0f} more seconds'.format(host, wait)
+        )
+        self.host = host
+        self.wait = wait
+
+
+class HostLimiter(object):
+    """Thread-safe limiter of requests to each host.
+
+    :param max_per_host: the maximum number of concurrent requests to
+                         each host.  :const:`DEFAULT_MAX_PER_HOST` by default
+    :type max_per_host: :class:`numbers.Integral`
+    :param min_delay: the minimum number of seconds between requests to
+                      the same host.  :const:`DEFAULT_MIN_DELAY` by default
+    :type min_delay: :class:`numbers.Real`
+    :param throttle_delay: the number of seconds to back off from a host
+                           that throttles without ``Retry-After``.
+                           :const:`DEFAULT_THROTTLE_DELAY` by default
+    :type throttle_delay: :class:`numbers.Real`
+    :param max_retry_after: the maximum number of seconds to respect
+                            ``Retry-After``.
+                            :const:`DEFAULT_MAX_RETRY_AFTER` by default
+    :type max_retry_after: :class:`numbers.Real`
+
+    """
+
+    #: (:class:`numbers.Integral`) The maximum number of concurrent requests
+    #: to each host.
+    max_per_host = None
+
+    #: (:class:`numbers.Real`) The minimum number of seconds between
+    #: requests to the same host.
+    min_delay = None
+
+    #: (:class:`numbers.Real`) The number of seconds to back off from a host
+    #: that throttles without ``Retry-After``.
+    throttle_delay = None
+
+    #: (:class:`numbers.Real`) The maximum number of seconds to respect
+    #: ``Retry-After``.
+    max_retry_after = None
+
+    def __init__(self, max_per_host=DEFAULT_MAX_PER_HOST,
+                 min_delay=DEFAULT_MIN_DELAY,
+                 throttle_delay=DEFAULT_THROTTLE_DELAY,
+                 max_retry_after=DEFAULT_MAX_RETRY_AFTER):
+        if max_per_host < 1:
+            raise ValueError('max_per_host must be greater than zero')
+        self.max_per_host = max_per_host
+        self.min_delay = min_delay
+        self.throttle_delay = throttle_delay
+        self.max_retry_after = max_retry_after
+        self.condition = threading.Condition()
+        self.active = {}
+        self.ready_at = {}
+
+    def acquire(self, url, timeout=None):
+        """Wait until a request to the host of the given ``url`` is allowed,
+        and then take a slot of the host.  Every :meth:`acquire()` call has
+        to be paired with :meth:`release()`.
+
+        If the host is held off (e.g. by ``Retry-After``) longer than
+        ``timeout``, it doesn't wait at all but raises
+        :exc:`HostThrottledError`, so that the caller can move on to
+        other hosts.
+
+        :param url: the url to request
+        :type url: :class:`str`
+        :param timeout: the maximum number of seconds to wait for the host
+                        to be ready.  no limit if it's :const:`None`
+                        (which is the default)
+        :type timeout: :class:`numbers.Real`
+        :raises HostThrottledError: when the host is held off longer than
+                                    ``timeout``
+
+        """
+        host = get_host(url)
+        with self.condition:
+            while True:
+                now = time.time()
+                wait = self.ready_at.get(host, now) - now
+                if timeout is not None and wait > timeout:
+                    raise HostThrottledError(host, wait)
+                elif self.active.get(host, 0) >= self.max_per_host:
+                    self.condition.wait()
+                elif wait > 0:
+                    self.condition.wait(wait)
+                else:
+                    break
+            self.active[host] = self.active.get(host, 0) + 1
+            self.ready_at[host] = now + self.min_delay
+
+    def release(self, url):
+        """Give back the slot of the host taken by :meth:`acquire()`.
+
+        :param url: the requested url
+        :type url: :class:`str`
+
+        """
+        host = get_host(url)
+        with self.condition:
+            self.active[host] -= 1
+            if not self.active[host]:
+                del self.active[host]
+            self.condition.notify_all()
+
+    def defer(self, url, seconds):
+        """Hold off requests to the host of the given ``url`` for
+        ``seconds``.
+
+        :param url: the url of the host
+        :type url: :class:`str`
+        :param seconds: the number of seconds to hold off.  it's capped by
+                        :attr:`max_retry_after`
+        :type seconds: :class:`numbers.Real`
+
+        """
+        host = get_host(url)
+        ready_at = time.time() + min(seconds, self.max_retry_after)
+        with self.condition:
+            if ready_at > self.ready_at.get(host, 0):
+                self.ready_at[host] = ready_at
+            self.condition.notify_all()
+
+    def feedback(self, url, status, headers=None):
+        """Let the limiter know the response of a request.  If the host
+        throttles (see :const:`THROTTLE_CODES`) it's deferred by its
+        ``Retry-After``, or :attr:`throttle_delay` if it's absent.
+
+        :param url: the requested url
+        :type url: :class:`str`
+        :param status: the HTTP status code of the response
+        :type status: :class:`numbers.Integral`
+        :param headers: the response headers
+        :type headers: :class:`collections.Mapping`
+        :returns: the number of seconds the host is deferred, or
+                  :const:`None` if it's not throttled
+        :rtype: :class:`numbers.Real`
+
+        """
+        retry_after = None
+        if headers is not None:
+            retry_after = parse_retry_after(headers.get('retry-after'))
+        if status in THROTTLE_CODES:
+            if retry_after is None:
+                retry_after = self.throttle_delay
+        elif not retry_after:
+            return
+        self.defer(url, retry_after)
+        return retry_after
+
+    def get_wait(self, url):
+        """Get the number of seconds until the host of the given ``url``
+        is ready for the next request, regardless of its concurrency.
+
+        :param url: the url of the host
+        :type url: :class:`str`
+        :returns: the number of seconds to wait.  zero if it's ready
+        :rtype: :class:`numbers.Real`
+
+        """
+        host = get_host(url)
+        with self.condition:
+            return max(0, self.ready_at.get(host, 0) - time.time())
+
+    def __repr__(self):
+        return '{0.__module__}.{0.__name__}(max_per_host={1!r}, ' \
+               'min_delay={2!r})'.format(type(self), self.max_per_host,
+                                         self.min_delay)
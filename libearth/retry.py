@@ -0,0 +1,430 @@
+""":mod:`libearth.retry` --- Retrying and circuit breaking failed crawls
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Crawl failures are classified by their kinds (see
+:attr:`CrawlError.kind <libearth.crawler.CrawlError.kind>`) e.g. timeouts,
+``5xx`` responses, or broken feeds.  Some of them are transient, so
+:class:`RetryPolicy` retries them with exponential backoff in the same
+crawl.  Others are not: a feed which has been dead for weeks only wastes
+a worker for a whole timeout on every crawl.  :class:`CircuitBreaker` keeps
+repeatedly failing feeds out of crawls until their next probe times::
+
+    policy = RetryPolicy(max_attempts=3)
+    breaker = CircuitBreaker(repository)
+    results = crawl(feed_urls, pool_size=8,
+                    retry_policy=policy, circuit_breaker=breaker)
+
+.. versionadded:: 0.4.0
+
+"""
+import datetime
+import hashlib
+import random
+import threading
+import time
+
+from .codecs import Integer, Rfc3339
+from .crawler import (CRAWLER_XMLNS, NETWORK_FAILURE, SERVER_FAILURE,
+                      THROTTLED_FAILURE, TIMEOUT_FAILURE, CrawlError)
+from .repository import Repository, RepositoryKeyError
+from .schema import Attribute, DocumentElement, Text, read, write
+from .tz import now as utcnow
+
+__all__ = ('DEFAULT_BREAKER_THRESHOLD', 'DEFAULT_MAX_ATTEMPTS',
+           'DEFAULT_MAX_PROBE_DELAY', 'DEFAULT_PROBE_DELAY',
+           'DEFAULT_RETRY_ON', 'Circuit', 'CircuitBreaker', 'RetryPolicy')
+
+
+#: (:class:`numbers.Integral`) The default maximum number of attempts
+#: to crawl a feed, including the first one.
+DEFAULT_MAX_ATTEMPTS = 3
+
+#: (:class:`collections.Set`) The default kinds of failures to retry.
+#: See :attr:`CrawlError.kind <libearth.crawler.CrawlError.kind>`.
+DEFAULT_RETRY_ON = frozenset([TIMEOUT_FAILURE, NETWORK_FAILURE,
+                              SERVER_FAILURE])
+
+#: (:class:`numbers.Integral`) The default number of consecutive failures
+#: which opens the circuit of a feed.
+DEFAULT_BREAKER_THRESHOLD = 3
+
+#: (:class:`numbers.Real`) The default number of seconds until the first
+#: probe of an opened circuit.  An hour.
+DEFAULT_PROBE_DELAY = 60 * 60
+
+#: (:class:`numbers.Real`) The default maximum number of seconds between
+#: probes of an opened circuit.  A week.
+DEFAULT_MAX_PROBE_DELAY = 7 * 24 * 60 * 60
+
+
+class RetryPolicy(object):
+    """Retry crawls which failed with transient failures, waiting
+    exponentially longer between attempts.
+
+    :param max_attempts: the maximum number of attempts including
+                         the first one.  :const:`DEFAULT_MAX_ATTEMPTS`
+                         by default
+    :type max_attempts: :class:`numbers.Integral`
+    :param base_delay: the number of seconds to wait before the first retry.
+                       it's doubled for each next retry
+    :type base_delay: :class:`numbers.Real`
+    :param max_delay: the maximum number of seconds to wait between
+                      attempts
+    :type max_delay: :class:`numbers.Real`
+    :param jitter: the fraction of delays to randomly cut so that
+                   retries of many feeds don't happen at once.
+                   zero makes delays deterministic
+    :type jitter: :class:`numbers.Real`
+    :param retry_on: the kinds of failures to retry.
+                     :const:`DEFAULT_RETRY_ON` by default
+    :type retry_on: :class:`collections.Set`
+
+    """
+
+    #: (:class:`numbers.Integral`) The maximum number of attempts including
+    #: the first one.
+    max_attempts = None
+
+    #: (:class:`numbers.Real`) The number of seconds to wait before the first
+    #: retry.
+    base_delay = None
+
+    #: (:class:`numbers.Real`) The maximum number of seconds to wait between
+    #: attempts.
+    max_delay = None
+
+    #: (:class:`numbers.Real`) The fraction of delays to randomly cut.
+    jitter = None
+
+    #: (:class:`collections.Set`) The kinds of failures to retry.
+    retry_on = None
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=1,
+                 max_delay=30, jitter=0.5, retry_on=DEFAULT_RETRY_ON):
+        if max_attempts < 1:
+            raise ValueError('max_attempts must be greater than zero')
+        elif not 0 <= jitter <= 1:
+            raise ValueError('jitter must be between 0 and 1')
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.retry_on = frozenset(retry_on)
+
+    def should_retry(self, error, attempt):
+        """Whether to retry after the ``attempt``-th attempt failed with
+        the given ``error``.
+
+        :param error: the raised error
+        :type error: :exc:`~libearth.crawler.CrawlError`
+        :param attempt: the number of attempts made so far
+        :type attempt: :class:`numbers.Integral`
+        :returns: :const:`True` if it should be retried
+        :rtype: :class:`bool`
+
+        """
+        return (attempt < self.max_attempts and
+                getattr(error, 'kind', None) in self.retry_on)
+
+    def get_delay(self, attempt):
+        """Get the number of seconds to wait after the ``attempt``-th
+        attempt failed.
+
+        :param attempt: the number of attempts made so far
+        :type attempt: :class:`numbers.Integral`
+        :returns: the number of seconds to wait
+        :rtype: :class:`numbers.Real`
+
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        if self.jitter:
+            delay *= 1 - self.jitter * random.random()
+        return delay
+
+    def call(self, function, url, *args, **kwargs):
+        """Call the crawling ``function`` e.g.
+        :func:`~libearth.crawler.get_feed()` with the ``url``,
+        and retry it according to the policy.
+
+        :param function: the function to crawl a feed
+        :type function: :class:`collections.Callable`
+        :param url: the feed url
+        :type url: :class:`str`
+        :returns: the result of the ``function``
+        :raises CrawlError: the last error if all attempts failed or
+                            the failure isn't retried.  its
+                            ``attempts`` attribute is the number of
+                            attempts made
+
+        """
+        attempt = 1
+        while True:
+            try:
+                return function(url, *args, **kwargs)
+            except CrawlError as e:
+                if not self.should_retry(e, attempt):
+                    e.attempts = attempt
+                    raise
+                time.sleep(self.get_delay(attempt))
+                attempt += 1
+
+    def __repr__(self):
+        return '{0.__module__}.{0.__name__}(max_attempts={1!r}, ' \
+               'base_delay={2!r}, max_delay={3!r})'.format(
+                   type(self), self.max_attempts, self.base_delay,
+                   self.max_delay
+               )
+
+
+class Circuit(DocumentElement):
+    """The failure state of a feed.  It's stored by :class:`CircuitBreaker`.
+    """
+
+    __tag__ = 'circuit'
+    __xmlns__ = CRAWLER_XMLNS
+
+    #: (:class:`str`) The feed url.
+    url = Attribute('url')
+
+    #: (:class:`numbers.Integral`) The number of consecutive failures.
+    #: Zero if the last crawl succeeded.
+    failures = Text('failures', Integer, xmlns=CRAWLER_XMLNS)
+
+    #: (:class:`str`) The :attr:`~libearth.crawler.CrawlError.kind` of
+    #: the last failure.
+    kind = Text('kind', xmlns=CRAWLER_XMLNS)
+
+    #: (:class:`datetime.datetime`) When the feed failed last.
+    failed_at = Text('failed-at', Rfc3339, xmlns=CRAWLER_XMLNS)
+
+    #: (:class:`datetime.datetime`) When the feed can be crawled again
+    #: if the circuit is opened.  It might be :const:`None`.
+    next_probe = Text('next-probe', Rfc3339, xmlns=CRAWLER_XMLNS)
+
+    def __repr__(self):
+        return '<{0.__module__}.{0.__name__} {1!r} failures={2!r} ' \
+               'next_probe={3!r}>'.format(type(self), self.url,
+                                          self.failures, self.next_probe)
+
+
+class CircuitBreaker(object):
+    """Keep feeds which failed :attr:`threshold` times in a row out of
+    crawls until their next probe times.  The probe delay starts from
+    :attr:`probe_delay`, and is doubled for each failed probe up to
+    :attr:`max_probe_delay`.  A successful crawl closes the circuit.
+
+    Circuits are kept in memory, and also persisted into the
+    ``repository`` if it's present so that they survive restarts.
+    It's thread-safe.
+
+    :param repository: an optional repository to persist circuits
+    :type repository: :class:`~libearth.repository.Repository`
+    :param key: the repository key of the directory where circuits are
+                stored.  ``['.crawler', 'circuits']`` by default
+    :type key: :class:`collections.Sequence`
+    :param threshold: the number of consecutive failures which opens
+                      the circuit.  :const:`DEFAULT_BREAKER_THRESHOLD`
+                      by default
+    :type threshold: :class:`numbers.Integral`
+    :param probe_delay: the number of seconds until the first probe.
+                        :const:`DEFAULT_PROBE_DELAY` by default
+    :type probe_delay: :class:`numbers.Real`
+    :param max_probe_delay: the maximum number of seconds between probes.
+                            :const:`DEFAULT_MAX_PROBE_DELAY` by default
+    :type max_probe_delay: :class:`numbers.Real`
+
+    """
+
+    #: (:class:`~libearth.repository.Repository`) The repository where
+    #: circuits are persisted.  It might be :const:`None`.
+    repository = None
+
+    #: (:class:`collections.Sequence`) The repository key of the directory
+    #: where circuits are stored.
+    key = None
+
+    #: (:class:`numbers.Integral`) The number of consecutive failures which
+    #: opens the circuit.
+    threshold = None
+
+    #: (:class:`numbers.Real`) The number of seconds until the first probe.
+    probe_delay = None
+
+    #: (:class:`numbers.Real`) The maximum number of seconds between probes.
+    max_probe_delay = None
+
+    def __init__(self, repository=None, key=('.crawler', 'circuits'),
+                 threshold=DEFAULT_BREAKER_THRESHOLD,
+                 probe_delay=DEFAULT_PROBE_DELAY,
+                 max_probe_delay=DEFAULT_MAX_PROBE_DELAY):
+        if not (repository is None or isinstance(repository, Repository)):
+            raise TypeError(
+                'repository must be an instance of {0.__module__}.'
+                '{0.__name__}, not {1!r}'.format(Repository, repository)
+            )
+        elif threshold < 1:
+            raise ValueError('threshold must be greater than zero')
+        self.repository = repository
+        self.key = list(key)
+        self.threshold = threshold
+        self.probe_delay = probe_delay
+        self.max_probe_delay = max_probe_delay
+        self.circuits = {}
+        self.lock = threading.RLock()
+
+    def get_key(self, url):
+        """Get the repository key to store the circuit of the given ``url``.
+
+        :param url: the feed url
+        :type url: :class:`str`
+        :returns: the repository key
+        :rtype: :class:`collections.Sequence`
+
+        """
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return self.key + [digest + '.xml']
+
+    def get(self, url):
+        """Find the circuit of the given feed ``url``.
+
+        :param url: the feed url
+        :type url: :class:`str`
+        :returns: the circuit, or :const:`None` if the feed has never
+                  failed
+        :rtype: :class:`Circuit`
+
+        """
+        with self.lock:
+            try:
+                return self.circuits[url]
+            except KeyError:
+                pass
+            if self.repository is None:
+                return
+            try:
+                chunks = list(self.repository.read(self.get_key(url)))
+            except RepositoryKeyError:
+                return
+            circuit = read(Circuit, chunks)
+            if circuit.url != url:
+                return
+            self.circuits[url] = circuit
+            return circuit
+
+    def is_open(self, url, now=None):
+        """Whether the feed of the given ``url`` should be left out of
+        crawls for now.
+
+        :param url: the feed url
+        :type url: :class:`str`
+        :param now: the time to compare.  the current time by default
+        :type now: :class:`datetime.datetime`
+        :returns: :const:`True` if the circuit is open
+        :rtype: :class:`bool`
+
+        """
+        circuit = self.get(url)
+        if circuit is None or circuit.next_probe is None:
+            return False
+        return circuit.next_probe > (now or utcnow())
+
+    def allowed(self, feed_urls, now=None):
+        """Filter only feeds of which circuits aren't open.
+
+        :param feed_urls: feed urls to filter
+        :type feed_urls: :class:`collections.Iterable`
+        :param now: the time to compare.  the current time by default
+        :type now: :class:`datetime.datetime`
+        :returns: feed urls that can be crawled
+        :rtype: :class:`collections.Sequence`
+
+        """
+        now = now or utcnow()
+        return [url for url in feed_urls if not self.is_open(url, now)]
+
+    def record_success(self, url):
+        """Close the circuit of the feed of the given ``url``.
+
+        :param url: the feed url
+        :type url: :class:`str`
+
+        """
+        with self.lock:
+            circuit = self.get(url)
+            if circuit is None or not circuit.failures:
+                return
+            circuit.failures = 0
+            circuit.next_probe = None
+            self.store(circuit)
+
+    def record_failure(self, url, error=None, now=None):
+        """Count a failure of the feed of the given ``url``, and open its
+        circuit if it failed :attr:`threshold` times in a row.
+
+        :param url: the feed url
+        :type url: :class:`str`
+        :param error: the raised error
+        :type error: :exc:`~libearth.crawler.CrawlError`
+        :param now: the time the feed failed.  the current time by default
+        :type now: :class:`datetime.datetime`
+        :returns: the updated circuit
+        :rtype: :class:`Circuit`
+
+        """
+        now = now or utcnow()
+        with self.lock:
+            circuit = self.get(url) or Circuit(url=url)
+            circuit.failures = (circuit.failures or 0) + 1
+            circuit.kind = getattr(error, 'kind', None)
+            circuit.failed_at = now
+            if circuit.failures >= self.threshold:
+                delay = min(
+                    self.max_probe_delay,
+                    self.probe_delay * 2 ** (circuit.failures - self.threshold)
+                )
+                circuit.next_probe = now + datetime.timedelta(seconds=delay)
+            self.store(circuit)
+        return circuit
+
+    def store(self, circuit):
+        """Keep the ``circuit``, and persist it into the :attr:`repository`
+        if it's present.
+
+        :param circuit: the circuit to store
+        :type circuit: :class:`Circuit`
+
+        """
+        with self.lock:
+            self.circuits[circuit.url] = circuit
+            if self.repository is not None:
+                self.repository.write(self.get_key(circuit.url),
+                                      write(circuit, as_bytes=True))
+
+    def call(self, function, url, *args, **kwargs):
+        """Call the crawling ``function`` e.g.
+        :func:`~libearth.crawler.get_feed()` with the ``url``, and
+        record its success or failure.  Throttled crawls
+        (:const:`~libearth.crawler.THROTTLED_FAILURE`) are not recorded,
+        since the feed wasn't even requested.
+
+        :param function: the function to crawl a feed
+        :type function: :class:`collections.Callable`
+        :param url: the feed url
+        :type url: :class:`str`
+        :returns: the result of the ``function``
+        :raises CrawlError: when the ``function`` failed
+
+        """
+        try:
+            result = function(url, *args, **kwargs)
+        except CrawlError as e:
+            if e.kind != THROTTLED_FAILURE:
+                self.record_failure(url, e)
+            raise
+        self.record_success(url)
+        return result
+
+    def __repr__(self):
+        return '{0.__module__}.{0.__name__}({1!r}, {2!r})'.format(
+            type(self), self.repository, self.key
+        )
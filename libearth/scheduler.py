@@ -0,0 +1,399 @@
+""":mod:`libearth.scheduler` --- Adaptive crawl scheduling
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Most feeds are updated less than daily, so refetching every feed on every
+crawl mostly wastes requests.  :class:`Scheduler` keeps the next due time
+of each feed, and :func:`~libearth.crawler.crawl()` takes only feeds that
+are due::
+
+    scheduler = Scheduler(repository)
+    for result in crawl(feed_urls, pool_size=8, scheduler=scheduler):
+        ...
+
+The next due time is computed from:
+
+- the observed interval between entries of the feed,
+- exponential backoff while the feed has no new entries,
+- crawler hints of the feed e.g. RSS ``<ttl>``, ``<skipHours>``
+  and ``<skipDays>``, and
+- HTTP caching headers: ``Cache-Control: max-age`` and ``Expires``.
+
+.. versionadded:: 0.4.0
+
+"""
+import calendar
+import datetime
+import email.utils
+import hashlib
+import math
+import re
+import threading
+
+from .codecs import Integer, Rfc3339
+from .crawler import CRAWLER_XMLNS, CrawlResult
+from .repository import Repository, RepositoryKeyError
+from .schema import Attribute, DocumentElement, Text, read, write
+from .tz import now as utcnow, utc
+
+__all__ = ('DEFAULT_BACKOFF', 'DEFAULT_MAX_INTERVAL', 'DEFAULT_MIN_INTERVAL',
+           'Schedule', 'Scheduler', 'get_cache_lifetime',
+           'get_entry_interval')
+
+
+#: (:class:`numbers.Integral`) The default minimum number of seconds between
+#: crawls of a feed.  15 minutes.
+DEFAULT_MIN_INTERVAL = 15 * 60
+
+#: (:class:`numbers.Integral`) The default maximum number of seconds between
+#: crawls of a feed.  A day.
+DEFAULT_MAX_INTERVAL = 24 * 60 * 60
+
+#: (:class:`numbers.Real`) The default factor the interval is multiplied by
+#: for each crawl that finds no new entries.
+DEFAULT_BACKOFF = 2
+
+#: (:class:`collections.Sequence`) Day names used by RSS ``<skipDays>``,
+#: in the order of :meth:`datetime.date.weekday()`.
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday',
+            'Saturday', 'Sunday')
+
+
+class Schedule(DocumentElement):
+    """The crawl schedule of a feed.  It's stored by :class:`Scheduler`."""
+
+    __tag__ = 'schedule'
+    __xmlns__ = CRAWLER_XMLNS
+
+    #: (:class:`str`) The feed url.
+    url = Attribute('url')
+
+    #: (:class:`datetime.datetime`) When the feed should be crawled next.
+    next_due = Text('next-due', Rfc3339, xmlns=CRAWLER_XMLNS)
+
+    #: (:class:`numbers.Integral`) The number of seconds between the last
+    #: crawl and :attr:`next_due`, before skip hints are applied.
+    interval = Text('interval', Integer, xmlns=CRAWLER_XMLNS)
+
+    #: (:class:`datetime.datetime`) When the feed was crawled last.
+    crawled_at = Text('crawled-at', Rfc3339, xmlns=CRAWLER_XMLNS)
+
+    #: (:class:`datetime.datetime`) The updated time of the newest entry
+    #: seen so far.  It might be :const:`None`.
+    latest_entry_at = Text('latest-entry-at', Rfc3339, xmlns=CRAWLER_XMLNS)
+
+    #: (:class:`numbers.Integral`) The number of consecutive crawls that
+    #: found no new entries.
+    idle_crawls = Text('idle-crawls', Integer, xmlns=CRAWLER_XMLNS)
+
+    def __repr__(self):
+        return '<{0.__module__}.{0.__name__} {1!r} next_due={2!r}>'.format(
+            type(self), self.url, self.next_due
+        )
+
+
+def get_entry_interval(feed, limit=10):
+    """Estimate how often the ``feed`` is updated from the updated times of
+    its newest entries.
+
+    :param feed: the feed to estimate
+    :type feed: :class:`~libearth.feed.Feed`
+    :param limit: the number of newest entries to take into account.
+                  10 by default
+    :type limit: :class:`numbers.Integral`
+    :returns: the average number of seconds between entries, or
+              :const:`None` if the feed has less than two entries
+    :rtype: :class:`numbers.Real`
+
+    """
+    times = sorted((entry.updated_at for entry in feed.entries
+                    if entry.updated_at is not None),
+                   reverse=True)[:limit]
+    if len(times) < 2:
+        return
+    delta = times[0] - times[-1]
+    seconds = delta.days * 86400 + delta.seconds
+    return seconds / float(len(times) - 1)
+
+
+def get_cache_lifetime(headers, now=None):
+    """Get the freshness lifetime of the response from its HTTP caching
+    headers: ``Cache-Control: max-age`` has precedence over ``Expires``.
+
+    :param headers: the response headers
+    :type headers: :class:`collections.Mapping`
+    :param now: the time the response was received.  the current time
+                by default
+    :type now: :class:`datetime.datetime`
+    :returns: the number of seconds the response is fresh, or
+              :const:`None` if the headers don't tell
+    :rtype: :class:`numbers.Integral`
+
+    """
+    if not headers:
+        return
+    cache_control = headers.get('cache-control') or ''
+    if re.search(r'(?:^|,)\s*(?:no-cache|no-store)\s*(?:,|$)',
+                 cache_control, re.IGNORECASE):
+        return 0
+    match = re.search(r'(?:^|,)\s*max-age\s*=\s*"?(\d+)', cache_control,
+                      re.IGNORECASE)
+    if match:
+        return int(match.group(1))
+    expires = email.utils.parsedate_tz(headers.get('expires') or '')
+    if expires is None:
+        return
+    date = email.utils.parsedate_tz(headers.get('date') or '')
+    if date is not None:
+        base = email.utils.mktime_tz(date)
+    else:
+        base = calendar.timegm((now or utcnow()).utctimetuple())
+    return max(0, int(email.utils.mktime_tz(expires) - base))
+
+
+class Scheduler(object):
+    """Keep the next due time of each feed, and adapt it to how often
+    the feed is updated.  See also the module docs.
+
+    Schedules are kept in memory, and also persisted into the
+    ``repository`` if it's present so that they survive restarts.
+    It's thread-safe.
+
+    :param repository: an optional repository to persist schedules
+    :type repository: :class:`~libearth.repository.Repository`
+    :param key: the repository key of the directory where schedules are
+                stored.  ``['.crawler', 'schedules']`` by default
+    :type key: :class:`collections.Sequence`
+    :param min_interval: the minimum number of seconds between crawls
+                         of a feed.  :const:`DEFAULT_MIN_INTERVAL` by default
+    :type min_interval: :class:`numbers.Integral`
+    :param max_interval: the maximum number of seconds between crawls
+                         of a feed.  :const:`DEFAULT_MAX_INTERVAL` by default
+    :type max_interval: :class:`numbers.Integral`
+    :param backoff: the factor the interval is multiplied by for each crawl
+                    that finds no new entries.
+                    :const:`DEFAULT_BACKOFF` by default
+    :type backoff: :class:`numbers.Real`
+
+    """
+
+    #: (:class:`~libearth.repository.Repository`) The repository where
+    #: schedules are persisted.  It might be :const:`None`.
+    repository = None
+
+    #: (:class:`collections.Sequence`) The repository key of the directory
+    #: where schedules are stored.
+    key = None
+
+    #: (:class:`numbers.Integral`) The minimum number of seconds between
+    #: crawls of a feed.
+    min_interval = None
+
+    #: (:class:`numbers.Integral`) The maximum number of seconds between
+    #: crawls of a feed.
+    max_interval = None
+
+    #: (:class:`numbers.Real`) The factor the interval is multiplied by
+    #: for each crawl that finds no new entries.
+    backoff = None
+
+    def __init__(self, repository=None, key=('.crawler', 'schedules'),
+                 min_interval=DEFAULT_MIN_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL, backoff=DEFAULT_BACKOFF):
+        if not (repository is None or isinstance(repository, Repository)):
+            raise TypeError(
+                'repository must be an instance of {0.__module__}.'
+                '{0.__name__}, not {1!r}'.format(Repository, repository)
+            )
+        elif min_interval > max_interval:
+            raise ValueError('min_interval must not be greater than '
+                             'max_interval')
+        self.repository = repository
+        self.key = list(key)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.schedules = {}
+        self.lock = threading.RLock()
+
+    def get_key(self, url):
+        """Get the repository key to store the schedule of the given
+        ``url``.
+
+        :param url: the feed url
+        :type url: :class:`str`
+        :returns: the repository key
+        :rtype: :class:`collections.Sequence`
+
+        """
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return self.key + [digest + '.xml']
+
+    def get(self, url):
+        """Find the schedule of the given feed ``url``.
+
+        :param url: the feed url
+        :type url: :class:`str`
+        :returns: the schedule, or :const:`None` if the feed has never
+                  been crawled
+        :rtype: :class:`Schedule`
+
+        """
+        with self.lock:
+            try:
+                return self.schedules[url]
+            except KeyError:
+                pass
+            if self.repository is None:
+                return
+            try:
+                chunks = list(self.repository.read(self.get_key(url)))
+            except RepositoryKeyError:
+                return
+            schedule = read(Schedule, chunks)
+            if schedule.url != url:
+                return
+            self.schedules[url] = schedule
+            return schedule
+
+    def is_due(self, url, now=None):
+        """Whether the feed of the given ``url`` should be crawled.
+        Feeds that have never been crawled are always due.
+
+        :param url: the feed url
+        :type url: :class:`str`
+        :param now: the time to compare.  the current time by default
+        :type now: :class:`datetime.datetime`
+        :returns: :const:`True` if the feed is due
+        :rtype: :class:`bool`
+
+        """
+        schedule = self.get(url)
+        if schedule is None or schedule.next_due is None:
+            return True
+        return schedule.next_due <= (now or utcnow())
+
+    def due(self, feed_urls, now=None):
+        """Filter only feeds that are due.
+
+        :param feed_urls: feed urls to filter
+        :type feed_urls: :class:`collections.Iterable`
+        :param now: the time to compare.  the current time by default
+        :type now: :class:`datetime.datetime`
+        :returns: feed urls that are due
+        :rtype: :class:`collections.Sequence`
+
+        """
+        now = now or utcnow()
+        return [url for url in feed_urls if self.is_due(url, now)]
+
+    def update(self, result, now=None):
+        """Compute and store the next due time of the crawled feed.
+
+        :param result: the crawled result
+        :type result: :class:`~libearth.crawler.CrawlResult`
+        :param now: the time the feed was crawled.  the current time
+                    by default
+        :type now: :class:`datetime.datetime`
+        :returns: the updated schedule
+        :rtype: :class:`Schedule`
+
+        """
+        if not isinstance(result, CrawlResult):
+            raise TypeError(
+                'result must be an instance of {0.__module__}.{0.__name__}, '
+                'not {1!r}'.format(CrawlResult, result)
+            )
+        now = now or utcnow()
+        with self.lock:
+            schedule = self.get(result.url) or Schedule(url=result.url)
+            feed = result.feed
+            times = [entry.updated_at for entry in feed.entries
+                     if entry.updated_at is not None] if feed else []
+            latest = max(times) if times else None
+            if latest is not None and (schedule.latest_entry_at is None or
+                                       latest > schedule.latest_entry_at):
+                schedule.latest_entry_at = latest
+                schedule.idle_crawls = 0
+            else:
+                schedule.idle_crawls = (schedule.idle_crawls or 0) + 1
+            schedule.interval = self.get_interval(result, schedule, now)
+            schedule.crawled_at = now
+            schedule.next_due = self.skip(
+                now + datetime.timedelta(seconds=schedule.interval),
+                result.hints
+            )
+            self.schedules[result.url] = schedule
+            if self.repository is not None:
+                self.repository.write(self.get_key(result.url),
+                                      write(schedule, as_bytes=True))
+        return schedule
+
+    def get_interval(self, result, schedule, now):
+        """Compute the number of seconds until the next crawl.
+
+        :param result: the crawled result
+        :type result: :class:`~libearth.crawler.CrawlResult`
+        :param schedule: the schedule of the feed, of which
+                         :attr:`~Schedule.idle_crawls` is already updated
+        :type schedule: :class:`Schedule`
+        :param now: the time the feed was crawled
+        :type now: :class:`datetime.datetime`
+        :returns: the interval in seconds
+        :rtype: :class:`numbers.Integral`
+
+        """
+        idle_crawls = schedule.idle_crawls or 0
+        interval = None
+        if result.feed is not None:
+            interval = get_entry_interval(result.feed)
+            if interval is not None:
+                exponent = idle_crawls
+                if interval > 0 and self.backoff > 1:
+                    # The interval is clamped by max_interval anyway, so
+                    # cap the exponent not to overflow
+                    limit = math.log(float(self.max_interval) / interval,
+                                     self.backoff)
+                    exponent = min(exponent, max(int(math.ceil(limit)), 0))
+                interval *= self.backoff ** exponent
+        if interval is None:
+            if schedule.interval and idle_crawls:
+                interval = schedule.interval * self.backoff
+            else:
+                interval = self.min_interval
+        hints = result.hints or {}
+        if hints.get('ttl'):
+            interval = max(interval, hints['ttl'] * 60)
+        lifetime = get_cache_lifetime(result.headers, now)
+        if lifetime:
+            interval = max(interval, lifetime)
+        return int(min(max(interval, self.min_interval), self.max_interval))
+
+    def skip(self, due, hints):
+        """Postpone the ``due`` time out of ``skipHours`` and ``skipDays``
+        of the crawler ``hints``.
+
+        :param due: the due time
+        :type due: :class:`datetime.datetime`
+        :param hints: the crawler hints.  it might be :const:`None`
+        :type hints: :class:`collections.Mapping`
+        :returns: the postponed due time
+        :rtype: :class:`datetime.datetime`
+
+        """
+        if not hints:
+            return due
+        skip_hours = hints.get('skipHours') or ()
+        skip_days = hints.get('skipDays') or ()
+        due = due.astimezone(utc)
+        for _ in range(7 * 24):
+            if (due.hour not in skip_hours and
+                    WEEKDAYS[due.weekday()] not in skip_days):
+                break
+            due = due.replace(minute=0, second=0, microsecond=0) + \
+                datetime.timedelta(hours=1)
+        return due
+
+    def __repr__(self):
+        return '{0.__module__}.{0.__name__}({1!r}, {2!r})'.format(
+            type(self), self.repository, self.key
+        )
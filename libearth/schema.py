@@ -60,19 +60,21 @@ import xml.sax
 import xml.sax.handler
 import xml.sax.saxutils
 
-from .compat import UNICODE_BY_DEFAULT, binary_type, string_type
+from .compat import UNICODE_BY_DEFAULT, binary_type, string_type, xrange
 from .compat.xmlpullreader import PullReader
 
 __all__ = ('PARSER_LIST', 'SCHEMA_XMLNS',
            'Attribute', 'Child', 'Codec', 'CodecDescriptor', 'CodecError',
            'Content', 'ContentHandler', 'DecodeError', 'Descriptor',
            'DescriptorConflictError', 'DocumentElement', 'Element',
-           'ElementList', 'EncodeError', 'IntegrityError',
-           'SchemaError', 'Text',
-           'complete', 'element_list_for',
+           'ElementList', 'EncodeError', 'FragmentHandler', 'IntegrityError',
+           'ProjectionError', 'SchemaError', 'Text',
+           'check_projection', 'complete', 'element_list_for',
            'index_descriptors', 'inspect_attributes', 'inspect_child_tags',
-           'inspect_content_tag', 'inspect_xmlns_set', 'is_partially_loaded',
-           'read', 'validate', 'write')
+           'inspect_content_tag', 'inspect_dispatch_table',
+           'inspect_write_plan', 'inspect_xmlns_set', 'invalidate_source',
+           'is_partially_loaded', 'read', 'record_source', 'validate',
+           'write')
 
 
 #: (:class:`str`) The XML namespace name used for schema metadata.
@@ -94,6 +96,17 @@ class IntegrityError(SchemaError, AttributeError):
     """Rise when an element is invalid according to the schema."""
 
 
+class ProjectionError(SchemaError):
+    """Error which rises when a child excluded by :func:`read()` is
+    accessed, or a document read with excluded children is written.
+    It's intentionally not an :exc:`AttributeError` so that it can't be
+    mistaken for a missing child.
+
+    .. versionadded:: 0.4.0
+
+    """
+
+
 class CodecError(SchemaError, ValueError):
     """Rise when encoding/decoding between Python values and XML data
     goes wrong.
@@ -186,6 +199,10 @@ class Descriptor(object):
             root = obj._root() if hasattr(obj, '_root') else None
             if root is not None and getattr(root, '_handler', None):
                 handler = root._handler
+                if self in handler.exclude and self not in obj._data:
+                    # Raise before parsing the rest of the parent element
+                    # to look for the child which would never be read
+                    check_projection(obj, self)
                 stack = handler.stack
                 while ((obj._data.get(self) is None and
                        (not stack or stack[-1]))):
@@ -341,6 +358,7 @@ class Child(Descriptor):
                                     '{0.__name__}, not {1!r}'.format(e)
                                 )
                         obj._data[self] = value
+                        invalidate_source(obj)
                     else:
                         raise TypeError(
                             'expected a sequence of {0.__module__}.'
@@ -360,7 +378,9 @@ class Child(Descriptor):
                         'expected an instance of {0.__module__}.{0.__name__}, '
                         'not {1!r}'.format(element_type, value)
                     )
-                obj._data[self] = value
+                if self not in obj._data or obj._data[self] is not value:
+                    obj._data[self] = value
+                    invalidate_source(obj)
         else:
             raise AttributeError('cannot change the class attribute')
 
@@ -370,8 +390,7 @@ class Child(Descriptor):
             element_list = element._data.setdefault(self, [])
             element_list.append(child_element)
         else:
-            if self not in element._data:
-                setattr(element, attribute, child_element)
+            element._data.setdefault(self, child_element)
         return child_element
 
     def end_element(self, reserved_value, content):
@@ -728,6 +747,17 @@ class Text(Descriptor, CodecDescriptor):
                 return ElementList(obj, self, string_type)
         return super(Text, self).__get__(obj, cls)
 
+    def __set__(self, obj, value):
+        if isinstance(obj, Element):
+            if self.multiple:
+                value = list(value)
+            elif self in obj._data and obj._data[self] is value:
+                return  # unchanged; keep the source span
+            obj._data[self] = value
+            invalidate_source(obj)
+        else:
+            raise AttributeError('cannot change the class attribute')
+
     def start_element(self, element, attribute):
         return element
 
@@ -821,6 +851,7 @@ class Attribute(CodecDescriptor):
     def __set__(self, obj, value):
         if isinstance(obj, Element):
             obj._attrs[self] = value
+            invalidate_source(obj)
 
 
 class Content(CodecDescriptor):
@@ -858,6 +889,7 @@ class Content(CodecDescriptor):
 
     def __set__(self, obj, value):
         obj._content = value
+        invalidate_source(obj)
 
     def read(self, element, value):
         """Read raw ``value`` from XML, decode it, and then set the attribute
@@ -868,8 +900,7 @@ class Content(CodecDescriptor):
            Internal method.
 
         """
-        decoded = self.decode(value, element)
-        self.__set__(element, decoded)
+        element._content = self.decode(value, element)
 
 
 class Element(object):
@@ -896,7 +927,7 @@ class Element(object):
     """
 
     __slots__ = ('_attrs', '_content', '_data', '_parent', '_root', '_partial',
-                 '_hints')
+                 '_hints', '_span')
 
     def __init__(self, _parent=None, **attributes):
         self._attrs = getattr(self, '_attrs', {})  # FIXME
@@ -907,7 +938,10 @@ class Element(object):
         # 1. the element is partially loaded
         # 2. the element is partially loaded, but _hints are loaded
         self._partial = 0
-        self._hints = {}
+        self._hints = getattr(self, '_hints', {})  # FIXME
+        # _span is a triple of (source buffer, start, end) of the element
+        # in the document read by read(), or None if it has changed since
+        self._span = None
         if _parent is not None:
             if not isinstance(_parent, Element):
                 raise TypeError('expected a {0.__module__}.{0.__name__} '
@@ -1050,6 +1084,7 @@ class DocumentElement(Element):
         del self._parser
         if hasattr(self, '_iterator'):
             del self._iterator
+        self._handler.source = None
         return False
 
 
@@ -1166,6 +1201,8 @@ class ElementList(collections.MutableSequence):
         self.element = element
         self.descriptor = descriptor
         self.value_type = value_type
+        if descriptor not in element._data:
+            check_projection(element, descriptor)
 
     def consume_buffer(self):
         """Consume the buffer for the parser.  It returns a generator,
@@ -1275,25 +1312,124 @@ class ElementList(collections.MutableSequence):
         self._length_hint = length
         return length
 
+    def seek_index(self, start, stop):
+        """Parse only children from ``start`` to ``stop`` through the byte
+        offsets :class:`write` exported with its ``index`` option,
+        instead of parsing all children before them.
+
+        :returns: the list of children, or :const:`None` if offsets aren't
+                  available or the parser already reached ``start``
+        :rtype: :class:`collections.Sequence`
+
+        .. note::
+
+           Internal method.
+
+        """
+        element = self.element
+        handler = getattr(element, '_handler', None)
+        key = self.descriptor
+        if handler is None or \
+           start <= len(element._data.get(key, ())) or self.consumes_all():
+            return
+        self._length_hint  # consumes the buffer until hints are loaded
+        try:
+            hints = element._hints[key]
+            head = int(hints['head'])
+            offsets = hints['offsets'].split()
+        except (KeyError, ValueError):
+            return
+        stop = min(stop, len(offsets))
+        if start >= stop or start <= len(element._data.get(key, ())):
+            return
+        return handler.read_fragment(key, head, int(offsets[start]),
+                                     start, stop - start)
+
+    def forget_offsets(self):
+        """Forget the byte offsets of children since the list is about to
+        be mutated, so that indices don't match them anymore.  Children
+        already read through the offsets are adopted by parsing the rest
+        of the list first, so that they aren't lost.
+
+        .. note::
+
+           Internal method.
+
+        """
+        key = self.descriptor
+        self._length_hint  # consumes the buffer until hints are loaded
+        hints = self.element._hints.get(key)
+        if not hints or 'offsets' not in hints:
+            return
+        handler = getattr(self.element, '_handler', None)
+        fragments = getattr(handler, 'fragments', None)
+        if fragments and any(desc is key for desc, _ in fragments):
+            for _ in self.consume_buffer():
+                continue
+        del hints['offsets']
+
     def __getitem__(self, index):
+        if not isinstance(index, slice):
+            if index >= 0:
+                children = self.seek_index(index, index + 1)
+                if children:
+                    return children[0]
+        elif (index.step is None and index.start is not None and
+              index.stop is not None and 0 <= index.start < index.stop):
+            children = self.seek_index(index.start, index.stop)
+            if children is not None:
+                return children
         return self.consume_index(index)[index]
 
     def __setitem__(self, index, value):
+        self.forget_offsets()
         data = self.consume_index(index)
         if isinstance(index, slice):
             data[index] = map(self.validate_value, value)
         else:
             data[index] = self.validate_value(value)
+        invalidate_source(self.element)
 
     def __delitem__(self, index):
+        self.forget_offsets()
         data = self.consume_index(index)
+        length = len(data)
         del data[index]
-        self._length_hint = len(data)
+        self.adjust_length_hint(len(data) - length)
+        invalidate_source(self.element)
 
     def insert(self, index, value):
+        self.forget_offsets()
         data = self.consume_index(index, ignore_length_hint=True)
         data.insert(index, self.validate_value(value))
-        self._length_hint = len(data)
+        self.adjust_length_hint(1)
+        invalidate_source(self.element)
+
+    def adjust_length_hint(self, delta):
+        """Adjust the length hint by ``delta`` after the list is mutated.
+        The list might not be consumed to the end yet, so the number of
+        consumed children isn't the length.
+
+        .. note::
+
+           Internal method.
+
+        """
+        length_hint = self._length_hint
+        if length_hint is not None:
+            self._length_hint = length_hint + delta
+
+    def __eq__(self, other):
+        if isinstance(other, collections.Sequence) and \
+           not isinstance(other, string_type):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
 
     def __nonzero__(self):
         length_hint = self._length_hint
@@ -1378,6 +1514,19 @@ class ContentHandler(xml.sax.handler.ContentHandler):
     def __init__(self, document):
         self.document = weakref.ref(document)
         self.stack = []
+        self.dispatch_tables = {}
+        self.source = None
+        self.fragments = {}
+        self.fragment_documents = []
+        self.buffer = None
+        self.byte_index = None
+        self.exclude = frozenset()
+        self.skipping = 0
+
+    def setDocumentLocator(self, locator):
+        xml.sax.handler.ContentHandler.setDocumentLocator(self, locator)
+        # It's an extension of libearth.compat.expatreader.ExpatReader
+        self.byte_index = getattr(locator, 'getByteIndex', None)
 
     def load_hint(self, parent_element, tag, attrs):
         xmlns, name = tag
@@ -1392,41 +1541,50 @@ class ContentHandler(xml.sax.handler.ContentHandler):
         hint_dict[attrs[None, 'id']] = attrs[None, 'value']
         return True
 
+    def load_dispatch_table(self, element_type):
+        """Get the dispatch table of :func:`inspect_dispatch_table()` for
+        the ``element_type``, except descriptors to :attr:`exclude` are
+        replaced by :const:`None`.
+
+        .. note::
+
+           Internal method.
+
+        """
+        dispatch_table = inspect_dispatch_table(element_type)
+        exclude = self.exclude
+        if exclude:
+            dispatch_table = dict(
+                (tag, (attr, None, None) if desc in exclude
+                 else (attr, desc, attributes))
+                for tag, (attr, desc, attributes) in dispatch_table.items()
+            )
+        self.dispatch_tables[element_type] = dispatch_table
+        return dispatch_table
+
     def startElementNS(self, tag, qname, attrs):
+        if self.skipping:
+            self.skipping += 1
+            return
         xmlns, name = tag
-        try:
-            parent_context = self.stack[-1]
-        except IndexError:
-            # document element
-            doc = self.document()
-            if self.load_hint(doc, tag, attrs):
-                return
-            expected = getattr(doc, '__xmlns__', None), doc.__tag__
-            if tag != expected:
-                raise IntegrityError('document element must be {0}, '
-                                     'not {1}'.format(expected, name))
-            self.stack.append(
-                ParserContext(
-                    tag=name,
-                    xmlns=xmlns,
-                    descriptor=None,
-                    reserved_value=doc,
-                    content_buffer=[]
-                )
-            )
-            reserved_value = doc
-        else:
-            parent_element = parent_context.reserved_value
-            if self.load_hint(parent_element, tag, attrs):
+        stack = self.stack
+        if stack:
+            parent_element = stack[-1].reserved_value
+            if xmlns == SCHEMA_XMLNS and name == 'hint':
+                self.load_hint(parent_element, tag, attrs)
                 return
+            parent_element._partial = 2
             element_type = type(parent_element)
-            child_tags = inspect_child_tags(element_type)
             try:
-                attr, child = child_tags[tag]
+                dispatch_table = self.dispatch_tables[element_type]
+            except KeyError:
+                dispatch_table = self.load_dispatch_table(element_type)
+            try:
+                attr, child, attributes = dispatch_table[tag]
             except KeyError:
                 available_children = [
                     '{0} (namespace: {1})'.format(name_, ns) if xmlns else name
-                    for ns, name_ in child_tags
+                    for ns, name_ in dispatch_table
                 ]
                 available_children.sort()
                 available_children = ', '.join(available_children)
@@ -1441,42 +1599,51 @@ class ContentHandler(xml.sax.handler.ContentHandler):
                         available_children
                     )
                 )
-            if isinstance(child, Descriptor):
-                reserved_value = child.start_element(parent_element, attr)
-                self.stack.append(
-                    ParserContext(
-                        tag=name,
-                        xmlns=xmlns,
-                        descriptor=child,
-                        reserved_value=reserved_value,
-                        content_buffer=[]
-                    )
-                )
-            else:
-                if xmlns:
-                    raise IntegrityError('unexpected element: {0} (namespace: '
-                                         '{1})'.format(name, xmlns))
-                raise IntegrityError('unexpected element: ' + name)
-        if isinstance(reserved_value, Element):
-            instance = reserved_value
-            instance_type = type(instance)
-            attributes = inspect_attributes(instance_type)
-            instance_attrs_dict = instance._attrs
-            for xml_attr, raw_value in attrs.items():
-                try:
-                    _, attr_desc = attributes[xml_attr]
-                except KeyError:
-                    continue
-                instance_attrs_dict[attr_desc] = attr_desc.decode(
-                    raw_value,
-                    instance
-                )
+            if child is None:
+                # Excluded by read(); skip the whole subtree
+                self.skipping = 1
+                return
+            reserved_value = child.start_element(parent_element, attr)
+            if len(stack) == 1 and reserved_value is not parent_element:
+                self.start_span(reserved_value)
+            stack.append(ParserContext(name, xmlns, child, reserved_value, []))
+        else:
+            # document element
+            doc = self.document()
+            if self.load_hint(doc, tag, attrs):
+                return
+            expected = getattr(doc, '__xmlns__', None), doc.__tag__
+            if tag != expected:
+                raise IntegrityError('document element must be {0}, '
+                                     'not {1}'.format(expected, name))
+            stack.append(ParserContext(name, xmlns, None, doc, []))
+            reserved_value = doc
+            attributes = inspect_attributes(type(doc))
+        if not attrs:
+            return
+        elif attributes is None:
+            if not isinstance(reserved_value, Element):
+                return
+            attributes = inspect_attributes(type(reserved_value))
+        instance_attrs_dict = reserved_value._attrs
+        for xml_attr, raw_value in attrs.items():
+            try:
+                _, attr_desc = attributes[xml_attr]
+            except KeyError:
+                continue
+            instance_attrs_dict[attr_desc] = attr_desc.decode(
+                raw_value,
+                reserved_value
+            )
 
     def characters(self, content):
-        context = self.stack[-1]
-        context.content_buffer.append(content)
+        if not self.skipping:
+            self.stack[-1].content_buffer.append(content)
 
     def endElementNS(self, tag, qname):
+        if self.skipping:
+            self.skipping -= 1
+            return
         xmlns, name = tag
         if xmlns == SCHEMA_XMLNS:
             return
@@ -1493,6 +1660,230 @@ class ContentHandler(xml.sax.handler.ContentHandler):
             context.reserved_value._partial = 0
         else:
             context.descriptor.end_element(context.reserved_value, text)
+            if len(self.stack) == 1:
+                if context.reserved_value is not self.stack[0].reserved_value:
+                    self.end_span(context.reserved_value)
+                if self.fragments:
+                    self.adopt_fragment(context.descriptor)
+
+    def start_span(self, element):
+        """Remember the start offset of the ``element`` in the source
+        :attr:`buffer`.
+
+        .. note::
+
+           Internal method.
+
+        """
+        if self.buffer is not None and self.byte_index is not None:
+            element._span = self.buffer, self.byte_index(), None
+
+    def end_span(self, element):
+        """Complete the span of the ``element`` in the source :attr:`buffer`
+        at the end of it, unless it has changed while it's parsed.
+
+        .. note::
+
+           Internal method.
+
+        """
+        span = element._span
+        if span is None or span[0] is None:
+            return
+        source, start, _ = span
+        index = self.byte_index()
+        # An empty-element tag ends where its end event is reported, while
+        # an end tag starts there.  "<" can't be in attribute values.
+        if source[index - 2:index] == b'/>' and \
+           source.find(b'<', start + 1, index) < 0:
+            end = index
+        else:
+            end = source.find(b'>', index) + 1
+        element._span = (source, start, end) if end > start else None
+
+    def adopt_fragment(self, descriptor):
+        """Replace the lastly parsed child of the document element with
+        the same child read by :meth:`read_fragment()` before, if any,
+        so that the same child is always represented by the same object.
+
+        .. note::
+
+           Internal method.
+
+        """
+        children = self.stack[0].reserved_value._data.get(descriptor)
+        if descriptor.multiple and children:
+            try:
+                fragment = self.fragments[descriptor, len(children) - 1]
+            except KeyError:
+                return
+            if fragment._span is not None:  # unless it has changed
+                fragment._span = children[-1]._span
+            children[-1] = fragment
+
+    def iter_source(self, head, offset, buffer_size=4096):
+        """Read the :attr:`source` from the start to ``head``, and then
+        from ``offset`` to the end.  It works only if the source is
+        a sequence of bytes or seekable e.g.
+        :class:`~libearth.repository.FileIterator`.
+
+        :returns: chunks of bytes, or :const:`None` if the source cannot
+                  be randomly accessed
+        :rtype: :class:`collections.Iterable`
+
+        .. note::
+
+           Internal method.
+
+        """
+        source = self.source
+        if isinstance(source, collections.Sequence):
+            if not all(isinstance(chunk, binary_type) for chunk in source):
+                return
+            data = b''.join(source)
+
+            def iterate():
+                yield data[:head]
+                for i in xrange(offset, len(data), buffer_size):
+                    yield data[i:i + buffer_size]
+            return iterate()
+        try:
+            if source.tell() is None:
+                return
+        except (AttributeError, IOError, OSError, ValueError):
+            return
+
+        def read_at(position):
+            # The source is shared with the ongoing parser
+            saved_position = source.tell()
+            source.seek(position)
+            try:
+                return source.read(head if position == 0 else buffer_size)
+            finally:
+                source.seek(saved_position)
+
+        def iterate():
+            yield read_at(0)
+            position = offset
+            while True:
+                chunk = read_at(position)
+                if not chunk:
+                    break
+                yield chunk
+                position += len(chunk)
+        return iterate()
+
+    def read_fragment(self, descriptor, head, offset, start, count):
+        """Parse only ``count`` children of the ``descriptor`` from
+        the ``offset`` of the :attr:`source` in a separate parser.
+        Read children are cached.
+
+        :returns: the list of children, or :const:`None` if the source
+                  cannot be randomly accessed or the offset is invalid
+        :rtype: :class:`collections.Sequence`
+
+        .. note::
+
+           Internal method.
+
+        """
+        fragments = self.fragments
+        keys = [(descriptor, i) for i in xrange(start, start + count)]
+        if all(key in fragments for key in keys):
+            return [fragments[key] for key in keys]
+        chunks = self.iter_source(head, offset)
+        if chunks is None:
+            return
+        document = self.document()
+        fragment = type(document)()
+        handler = FragmentHandler(fragment, count)
+        handler.exclude = self.exclude
+        parser = xml.sax.make_parser(PARSER_LIST)
+        parser.setContentHandler(handler)
+        parser.setFeature(xml.sax.handler.feature_namespaces, True)
+        try:
+            if isinstance(parser, PullReader):
+                parser.prepareParser(chunks)
+                while not handler.done and parser.feed():
+                    pass
+            else:
+                for chunk in chunks:
+                    parser.feed(chunk)
+                    if handler.done:
+                        break
+        except (xml.sax.SAXException, SchemaError):
+            return
+        children = fragment._data.get(descriptor)
+        if not handler.done or list(fragment._data) != [descriptor] or \
+           len(children) != count:
+            return
+        for child in children:
+            child._parent = weakref.ref(document)
+        # Children refer the fragment document as their root
+        self.fragment_documents.append(fragment)
+        return [fragments.setdefault(key, child)
+                for key, child in zip(keys, children)]
+
+
+class FragmentHandler(ContentHandler):
+    """Event handler which parses only the given number of children of
+    the document element, and then ignores the rest.  It's used by
+    :meth:`ContentHandler.read_fragment()`.
+
+    .. note::
+
+       Internal class.
+
+    """
+
+    def __init__(self, document, count):
+        super(FragmentHandler, self).__init__(document)
+        self.count = count
+        self.done = False
+
+    def start_span(self, element):
+        # The span is adopted from the main parser later
+        element._span = None, None, None
+
+    def startElementNS(self, tag, qname, attrs):
+        if not self.done:
+            super(FragmentHandler, self).startElementNS(tag, qname, attrs)
+
+    def characters(self, content):
+        if not self.done:
+            super(FragmentHandler, self).characters(content)
+
+    def endElementNS(self, tag, qname):
+        if self.done:
+            return
+        super(FragmentHandler, self).endElementNS(tag, qname)
+        if len(self.stack) == 1 and tag[0] != SCHEMA_XMLNS:
+            self.count -= 1
+            self.done = self.count < 1
+
+
+def check_projection(element, descriptor):
+    """Raise :exc:`ProjectionError` if the ``descriptor`` of the ``element``
+    was excluded by :func:`read()`.
+
+    :param element: the element to check
+    :type element: :class:`Element`
+    :param descriptor: the descriptor to check
+    :type descriptor: :class:`Descriptor`
+    :raises ProjectionError: when the child was excluded
+
+    .. note::
+
+       Internal function.
+
+    """
+    root_ref = getattr(element, '_root', None)
+    handler = getattr(root_ref and root_ref(), '_handler', None)
+    if handler is not None and descriptor in handler.exclude:
+        raise ProjectionError(
+            '{0.__module__}.{0.__name__} <{1}> children were excluded by '
+            'read()'.format(type(element), descriptor.tag)
+        )
 
 
 def complete(element):
@@ -1511,6 +1902,26 @@ def complete(element):
             parse_next()
 
 
+def invalidate_source(element):
+    """Forget the source spans of the ``element`` and its ancestors
+    since it has changed, so that :class:`write` serializes them again
+    instead of copying them from the source document.
+
+    :param element: the changed element
+    :type element: :class:`Element`
+
+    .. note::
+
+       Internal function.
+
+    """
+    while element is not None:
+        element._span = None
+        parent_ref = getattr(element, '_parent', None)
+        parent = parent_ref() if parent_ref is not None else None
+        element = None if parent is element else parent
+
+
 def is_partially_loaded(element):
     """Return whether the given ``element`` is not completely loaded
     by :func:`read()` yet.
@@ -1646,10 +2057,18 @@ def inspect_attributes(element_type):
 
     """
     try:
-        return element_type.__attributes__
+        attributes = element_type.__attributes__
     except AttributeError:
         index_descriptors(element_type)
-        return element_type.__attributes__
+        attributes = element_type.__attributes__
+    else:
+        # The inherited index of the base type lacks descriptors the subtype
+        # defines (e.g. Subscription.icon_uri on Outline).
+        if any(getattr(sup, '__attributes__', None) is attributes
+               for sup in element_type.__bases__):
+            index_descriptors(element_type)
+            attributes = element_type.__attributes__
+    return attributes
 
 
 def inspect_child_tags(element_type):
@@ -1674,8 +2093,8 @@ def inspect_child_tags(element_type):
         index_descriptors(element_type)
         child_tags = element_type.__child_tags__
     else:
-        # FIXME: it should be tested, and considered in inspect_content_tag(),
-        # inspect_xmlns_set(), and inspect_attributes() as well.
+        # FIXME: it should be tested, and considered in inspect_content_tag()
+        # and inspect_xmlns_set() as well.
         if any(hasattr(sup, '__child_tags__') and
                sup.__child_tags__ is child_tags
                for sup in element_type.__bases__):
@@ -1706,15 +2125,99 @@ def inspect_content_tag(element_type):
     return content
 
 
+def inspect_write_plan(element_type):
+    """Get the plan to serialize elements of the given ``element_type``,
+    so that :class:`write` doesn't have to inspect and sort descriptors
+    for every element.  It's computed once for each type.
+
+    :param element_type: a subtype of :class:`Element` to inspect
+    :type element_type: :class:`type`
+    :returns: a tuple of (required instance attribute names,
+              pairs of attribute instance attribute name and
+              :class:`Attribute` descriptor, the result of
+              :func:`inspect_content_tag()`, and triples of
+              child instance attribute name, :class:`Descriptor`,
+              and whether it's :class:`Text` or not)
+    :rtype: :class:`tuple`
+
+    .. note::
+
+       Internal function.
+
+    """
+    try:
+        return element_type.__dict__['__write_plan__']
+    except KeyError:
+        pass
+    attributes = sorted(inspect_attributes(element_type).values(),
+                        key=operator.itemgetter(0))
+    children = sorted(inspect_child_tags(element_type).values(),
+                      key=lambda pair: pair[1].descriptor_counter)
+    content = inspect_content_tag(element_type)
+    assert not (content and children)
+    required = tuple(attr for attr, desc in attributes + children
+                     if desc.required)
+    plan = (
+        required,
+        tuple(attributes),
+        content,
+        tuple((attr, desc, isinstance(desc, Text))  # FIXME: type query
+              for attr, desc in children)
+    )
+    element_type.__write_plan__ = plan
+    return plan
+
+
+def inspect_dispatch_table(element_type):
+    """Get the table to dispatch parser events of child elements of
+    the given ``element_type``, so that :class:`ContentHandler` doesn't
+    have to inspect descriptors for every event.  It's computed once for
+    each type.
+
+    :param element_type: a subtype of :class:`Element` to inspect
+    :type element_type: :class:`type`
+    :returns: a dictionary of child node identifiers (pairs of
+              xml namespace uri and tag name) to triples of
+              instance attribute name, associated :class:`Descriptor`,
+              and the result of :func:`inspect_attributes()` for
+              the element the descriptor starts (:const:`None` if
+              it's unknown)
+    :rtype: :class:`collections.Mapping`
+
+    .. note::
+
+       Internal function.
+
+    """
+    try:
+        return element_type.__dict__['__dispatch_table__']
+    except KeyError:
+        pass
+    dispatch_table = {}
+    for key, (attr, desc) in inspect_child_tags(element_type).items():
+        if isinstance(desc, Child):  # FIXME: should be polymorphic
+            attributes = inspect_attributes(desc.element_type)
+        elif isinstance(desc, Text):
+            # Text.start_element() returns the parent element
+            attributes = inspect_attributes(element_type)
+        else:
+            attributes = None
+        dispatch_table[key] = attr, desc, attributes
+    element_type.__dispatch_table__ = dispatch_table
+    return dispatch_table
+
+
 #: (:class:`collections.Sequence`) The list of :mod:`xml.sax` parser
 #: implementations to try to import.
 PARSER_LIST = []
 
 if platform.python_implementation() == 'IronPython':
     PARSER_LIST = ['libearth.compat.clrxmlreader']
+else:
+    PARSER_LIST = ['libearth.compat.expatreader']
 
 
-def read(cls, iterable):
+def read(cls, iterable, exclude=(), record=False):
     """Initialize a document in read mode by opening the ``iterable``
     of XML string.  ::
 
@@ -1725,13 +2228,34 @@ def read(cls, iterable):
     into memory, and then lazily (and eventually) loaded when these
     are actually needed.
 
+    Children which aren't needed at all can be excluded, e.g. contents
+    of entries for listing them::
+
+        feed = read(Feed, f, exclude=[Entry.content, Entry.summary])
+
+    Excluded children are neither decoded nor kept in memory, and
+    accessing them raises :exc:`ProjectionError`.  The document cannot
+    be written either.
+
     :param cls: a subtype of :class:`DocumentElement`
     :type cls: :class:`type`
     :param iterable: chunks of XML string to read
     :type iterable: :class:`collections.Iterable`
+    :param exclude: :class:`Child` and :class:`Text` descriptors to skip
+                    wherever they appear in the document
+    :type exclude: :class:`collections.Iterable`
+    :param record: record the source document, so that :class:`write`
+                   with ``verbatim=True`` can copy unchanged children
+                   as they are.  note that the whole source is kept in
+                   memory as long as any of its elements lives.
+                   :const:`False` by default
+    :type record: :class:`bool`
     :returns: initialized document element in read mode
     :rtype: :class:`DocumentElement`
 
+    .. versionadded:: 0.4.0
+       The ``exclude`` and ``record`` options.
+
     """
     if not isinstance(cls, type):
         raise TypeError('cls must be a type object, not ' + repr(cls))
@@ -1740,11 +2264,24 @@ def read(cls, iterable):
             'cls must be a subtype of {0.__module__}.{0.__name__}, not '
             '{1.__module__}.{1.__name__}'.format(cls, DocumentElement)
         )
+    exclude = frozenset(exclude)
+    for desc in exclude:
+        if not isinstance(desc, Descriptor):
+            raise TypeError(
+                'exclude must consist of {0.__module__}.{0.__name__} '
+                'instances, not {1!r}'.format(Descriptor, desc)
+            )
     doc = cls()
     parser = xml.sax.make_parser(PARSER_LIST)
     handler = ContentHandler(doc)
+    handler.exclude = exclude
     parser.setContentHandler(handler)
     parser.setFeature(xml.sax.handler.feature_namespaces, True)
+    handler.source = iterable
+    # The source isn't recorded for documents which cannot be written
+    if record and not exclude and hasattr(parser, 'getByteIndex'):
+        handler.buffer = bytearray()
+        iterable = record_source(iterable, handler.buffer)
     if isinstance(parser, PullReader):
         parser.prepareParser(iterable)
     else:
@@ -1759,6 +2296,30 @@ def read(cls, iterable):
     return doc
 
 
+def record_source(iterable, buffer_):
+    """Append chunks of the ``iterable`` to the ``buffer_`` as they are
+    consumed.  Text chunks are recorded in UTF-8, as expat reads them.
+
+    :param iterable: chunks of XML string
+    :type iterable: :class:`collections.Iterable`
+    :param buffer_: the buffer to record chunks
+    :type buffer_: :class:`bytearray`
+    :returns: the same chunks to the ``iterable``
+    :rtype: :class:`collections.Iterable`
+
+    .. note::
+
+       Internal function.
+
+    """
+    for chunk in iterable:
+        if isinstance(chunk, binary_type):
+            buffer_.extend(chunk)
+        else:
+            buffer_.extend(chunk.encode('utf-8'))
+        yield chunk
+
+
 def validate(element, recurse=True, raise_error=True):
     """Validate the given ``element`` according to the schema.  ::
 
@@ -1849,18 +2410,45 @@ class write(collections.Iterable):
                      (:class:`unicode` in Python 3) if :const:`False`.
                      return chunks as default string type (:class:`str`)
                      by default
+    :param index: export byte offsets of multiple children of the document
+                  element as hints as well, so that :func:`read()` can
+                  parse only requested children of them instead of all
+                  children before them.  it's available only when
+                  ``hints`` is turned on.  note that the whole document
+                  is buffered in memory before the first chunk is
+                  yielded.  :const:`False` by default
+    :type index: :class:`bool`
+    :param verbatim: copy children of the document element which haven't
+                     changed since they were read by :func:`read()` with
+                     ``record=True`` from the source document as they are,
+                     instead of serializing them again.  it's applied only
+                     when the source document was written with the same
+                     namespace prefixes, indent, and newline.  copied
+                     children are not validated.  :const:`False` by default
+    :type verbatim: :class:`bool`
     :returns: chunks of an XML string
     :rtype: :class:`collections.Iterable`
 
+    .. versionadded:: 0.4.0
+       The ``index`` and ``verbatim`` options.
+
     """
 
+    #: (:class:`str`) The XML declaration written at first.
+    declaration = '<?xml version="1.0" encoding="utf-8"?>\n'
+
     def __init__(self, document, validate=True, indent='  ', newline='\n',
-                 canonical_order=False, hints=True, as_bytes=None):
+                 canonical_order=False, hints=True, as_bytes=None,
+                 index=False, verbatim=False):
         if not isinstance(document, DocumentElement):
             raise TypeError(
                 'document must be an instance of {0.__module__}.{0.__name__}, '
                 'not {1!r}'.format(DocumentElement, document)
             )
+        handler = getattr(document, '_handler', None)
+        if handler is not None and handler.exclude:
+            raise ProjectionError('the document cannot be written since '
+                                  'some children were excluded by read()')
         self.document = document
         self.document_type = type(document)
         self.validate = validate
@@ -1869,6 +2457,10 @@ class write(collections.Iterable):
         self.as_bytes = as_bytes
         self.sort = sorted if canonical_order else lambda l, *a, **k: l
         self.hints = hints
+        self.index = index
+        self.verbatim = verbatim
+        self.plans = {}
+        self.sources = {}
         xmlns_set = inspect_xmlns_set(self.document_type)
         self.xmlns_alias = dict(
             (uri, 'ns{0}'.format(i))
@@ -1876,9 +2468,14 @@ class write(collections.Iterable):
         )
         if hints:
             self.xmlns_alias[SCHEMA_XMLNS] = 'libearth'
+        self.xmlns_declarations = ''.join(
+            ' xmlns:' + prefix + '=' + xml.sax.saxutils.quoteattr(uri)
+            for uri, prefix in self.sort(self.xmlns_alias.items(),
+                                         key=operator.itemgetter(0))
+        )
 
     def __iter__(self):
-        result = itertools.chain(['<?xml version="1.0" encoding="utf-8"?>\n'],
+        result = itertools.chain([self.declaration],
                                  self.export(self.document,
                                              self.document_type.__tag__,
                                              self.document_type.__xmlns__))
@@ -1890,34 +2487,175 @@ class write(collections.Iterable):
 
     if UNICODE_BY_DEFAULT:
         encode = staticmethod(lambda s: s)
+        measure = staticmethod(lambda s: len(s.encode('utf-8')))
+        decode = staticmethod(lambda b: b.decode('utf-8'))
     else:
         encode = staticmethod(lambda s: s.encode('utf-8'))
+        measure = staticmethod(len)
+        decode = staticmethod(binary_type)
 
-    def export(self, element, tag, xmlns, depth=0):
-        if self.validate:
-            validate(element, recurse=False, raise_error=True)
+    def compile(self, element_type, tag, xmlns):
+        """Get the plan of :func:`inspect_write_plan()` rendered with
+        namespace prefixes of the document, which is cached for each
+        element type and tag.
+
+        .. note::
+
+           Internal method.
+
+        """
+        key = element_type, tag, xmlns
+        try:
+            return self.plans[key]
+        except KeyError:
+            pass
+        required, attributes, content, children = \
+            inspect_write_plan(element_type)
+        xmlns_alias = self.xmlns_alias
+
+        def qualify(xmlns, name):
+            return xmlns_alias[xmlns] + ':' + name if xmlns else name
+        qname = qualify(xmlns, tag)
+        plan = self.plans[key] = (
+            required,
+            '<' + qname,
+            tuple((attr, desc, ' ' + qualify(desc.xmlns, desc.name) + '=')
+                  for attr, desc in attributes),
+            content,
+            tuple((attr, desc, text,
+                   '<' + qualify(desc.xmlns, desc.tag) + '>',
+                   '</' + qualify(desc.xmlns, desc.tag) + '>')
+                  for attr, desc, text in children),
+            '</' + qname + '>'
+        )
+        return plan
+
+    def export(self, element, tag, xmlns):
+        """Serialize the document ``element``.  Every child of it is
+        serialized into a single chunk.
+
+        .. note::
+
+           Internal method.
+
+        """
+        plan = self.compile(type(element), tag, xmlns)
+        hints = {}
+        for desc, hint_dict in element._hints.items():
+            # Offsets read from the previous document are no more valid
+            hint_dict = dict((hint_id, value)
+                             for hint_id, value in hint_dict.items()
+                             if hint_id not in ('head', 'offsets'))
+            if hint_dict:
+                hints[desc] = hint_dict
+        if self.index and self.hints and plan[4]:
+            return self.export_indexed(element, plan, hints)
+        return self.export_streaming(element, plan, hints)
+
+    def export_streaming(self, element, plan, hints):
+        buffer_ = []
+        self.write_start(element, plan, 0, buffer_, hints)
+        yield ''.join(buffer_)
+        if plan[4]:
+            for child_plan, child_element in self.iter_children(element,
+                                                                plan):
+                del buffer_[:]
+                self.write_child(element, child_plan, child_element, 1,
+                                 buffer_)
+                yield ''.join(buffer_)
+            del buffer_[:]
+            self.write_end(plan, 0, buffer_)
+            yield ''.join(buffer_)
+
+    def export_indexed(self, element, plan, hints):
+        children = []
+        for child_plan, child_element in self.iter_children(element, plan):
+            buffer_ = []
+            self.write_child(element, child_plan, child_element, 1, buffer_)
+            children.append((child_plan, ''.join(buffer_)))
+        buffer_ = []
+        self.write_start(element, plan, 0, buffer_, {})
+        start = ''.join(buffer_)
+        # The "head" is the XML declaration and the start tag of
+        # the document element, which are enough to parse a child alone
+        head = self.measure(self.declaration + start)
+        measure = self.measure
+        margin = measure(self.newline + self.indent)
+        positions = {}
+        position = 0
+        for (_, desc, text, _, _), chunk in children:
+            if desc.multiple and not text:
+                positions.setdefault(desc, []).append(position + margin)
+            position += measure(chunk)
+        for desc, relative_offsets in positions.items():
+            hints[desc] = dict(hints.get(desc, {}),
+                               head=str(head),
+                               length=str(len(relative_offsets)))
+        # Offsets depend on the length of hints which contain them,
+        # so repeat until the length of hints doesn't change
+        base = head
+        while True:
+            for desc, relative_offsets in positions.items():
+                hints[desc]['offsets'] = ' '.join(
+                    str(base + offset) for offset in relative_offsets
+                )
+            buffer_ = []
+            self.write_hints(hints, 0, buffer_)
+            hint_chunk = ''.join(buffer_)
+            if head + measure(hint_chunk) == base:
+                break
+            base = head + measure(hint_chunk)
+        yield start + hint_chunk
+        for _, chunk in children:
+            yield chunk
+        buffer_ = []
+        self.write_end(plan, 0, buffer_)
+        yield ''.join(buffer_)
+
+    def write_element(self, element, tag, xmlns, depth, buffer_):
+        """Serialize the ``element`` into the ``buffer_`` list.
+
+        .. note::
+
+           Internal method.
+
+        """
+        plan = self.compile(type(element), tag, xmlns)
+        self.write_start(element, plan, depth, buffer_)
+        if plan[4]:
+            for child_plan, child_element in self.iter_children(element,
+                                                                plan):
+                self.write_child(element, child_plan, child_element,
+                                 depth + 1, buffer_)
+            self.write_end(plan, depth, buffer_)
+
+    def write_start(self, element, plan, depth, buffer_, hints=None):
+        """Serialize the start tag of the ``element`` into the ``buffer_``
+        list.  If the element has no children the whole element is
+        serialized.  Its own hints are written unless ``hints`` are given.
+
+        .. note::
+
+           Internal method.
+
+        """
+        required, start, attributes, content, children, end = plan
         element_type = type(element)
-        for s in itertools.repeat(self.indent, depth):
-            yield s
-        yield '<'
-        if xmlns:
-            yield self.xmlns_alias[xmlns]
-            yield ':'
-        yield tag
+        if self.validate:
+            for attr in required:
+                if not getattr(element, attr, None):
+                    raise IntegrityError(
+                        '{0.__module__}.{0.__name__}.{1} is required, but '
+                        '{2!r} lacks it'.format(element_type, attr, element)
+                    )
+        append = buffer_.append
+        encode = self.encode
         quoteattr = xml.sax.saxutils.quoteattr
+        append(self.indent * depth)
+        append(start)
         if not depth:
-            for uri, prefix in self.sort(self.xmlns_alias.items(),
-                                         key=operator.itemgetter(0)):
-                yield ' xmlns:'
-                yield prefix
-                yield '='
-                yield quoteattr(uri)
-        attr_descriptors = self.sort(
-            inspect_attributes(element_type).values(),
-            key=operator.itemgetter(0)
-        )
-        encode = self.encode
-        for attr, desc in attr_descriptors:
+            append(self.xmlns_declarations)
+        for attr, desc, prefix in attributes:
             raw_attr_value = getattr(element, attr, None)
             if raw_attr_value is None:
                 continue
@@ -1931,127 +2669,181 @@ class write(collections.Iterable):
                         element_type, attr, raw_attr_value, encoded_attr_value
                     )
                 )
-            yield ' '
-            if desc.xmlns:
-                yield self.xmlns_alias[desc.xmlns]
-                yield ':'
-            yield desc.name
-            yield '='
-            quoted_attr = quoteattr(encoded_attr_value)
-            if not isinstance(quoteattr, binary_type):
-                quoted_attr = encode(quoted_attr)
-            yield quoted_attr
-        content = inspect_content_tag(element_type)
-        children = inspect_child_tags(element_type)
-        escape = xml.sax.saxutils.escape
-        newline = self.newline
-        if content or children:
-            assert not (content and children)
-            yield '>'
-            if content:
-                raw_content_value = getattr(element, content[0], None)
-                encoded_content_value = content[1].encode(raw_content_value,
-                                                          element)
-                if encoded_content_value is not None:
-                    if not isinstance(encoded_content_value, string_type):
-                        raise EncodeError(
-                            '{0.__module__}.{0.__name__}.{1} attribute value '
-                            '{2!r} is incorrectly encoded to {3!r}'.format(
-                                element_type, content[0],
-                                raw_content_value, encoded_content_value
-                            )
+            append(prefix)
+            append(encode(quoteattr(encoded_attr_value)))
+        if content:
+            append('>')
+            raw_content_value = getattr(element, content[0], None)
+            encoded_content_value = content[1].encode(raw_content_value,
+                                                      element)
+            if encoded_content_value is not None:
+                if not isinstance(encoded_content_value, string_type):
+                    raise EncodeError(
+                        '{0.__module__}.{0.__name__}.{1} attribute value '
+                        '{2!r} is incorrectly encoded to {3!r}'.format(
+                            element_type, content[0],
+                            raw_content_value, encoded_content_value
                         )
-                    yield encode(escape(encoded_content_value))
-            else:
-                if self.hints:
-                    hints = self.sort(
-                        (desc.tag, desc.xmlns, hint_dict)
-                        for desc, hint_dict in element._hints.items()
                     )
-                    for hint_tag, hint_xmlns, hint_dict in hints:
-                        for hint_id, hint_val in self.sort(hint_dict.items()):
-                            yield newline
-                            for s in itertools.repeat(self.indent, depth + 1):
-                                yield s
-                            yield '<'
-                            yield self.xmlns_alias[SCHEMA_XMLNS]
-                            yield ':hint tag='
-                            yield quoteattr(hint_tag)
-                            if hint_xmlns:
-                                yield ' tag-xmlns='
-                                yield quoteattr(hint_xmlns)
-                            yield ' id='
-                            if not isinstance(hint_id, binary_type):
-                                hint_id = encode(hint_id)
-                            yield quoteattr(hint_id)
-                            yield ' value='
-                            if not isinstance(hint_val, binary_type):
-                                hint_val = encode(hint_val)
-                            yield quoteattr(hint_val)
-                            yield '/>'
-                children = self.sort(
-                    children.values(),
-                    key=lambda pair: pair[1].descriptor_counter
-                )
-                for attr, desc in children:
-                    child_elements = getattr(element, attr, None)
-                    if not desc.multiple:
-                        child_elements = [child_elements]
-                    if desc.sort_key is not None:
-                        child_elements = sorted(
-                            child_elements,
-                            key=desc.sort_key,
-                            reverse=bool(desc.sort_reverse)
-                        )
-                    for child_element in child_elements:
-                        if isinstance(desc, Text):  # FIXME: remove type query
-                            if child_element is None:
-                                continue
-                            encoded_child = desc.encode(child_element, element)
-                            if encoded_child is None:
-                                continue
-                            elif not isinstance(encoded_child, string_type):
-                                raise EncodeError(
-                                    '{0.__module__}.{0.__name__}.{1} attribute '
-                                    'value {2!r} is incorrectly encoded to '
-                                    '{3!r}'.format(element_type,
-                                                   attr,
-                                                   child_element,
-                                                   encoded_child)
-                                )
-                            yield newline
-                            for s in itertools.repeat(self.indent, depth + 1):
-                                yield s
-                            yield '<'
-                            if desc.xmlns:
-                                yield self.xmlns_alias[desc.xmlns]
-                                yield ':'
-                            yield desc.tag
-                            yield '>'
-                            yield encode(escape(encoded_child))
-                            yield '</'
-                            if desc.xmlns:
-                                yield self.xmlns_alias[desc.xmlns]
-                                yield ':'
-                            yield desc.tag
-                            yield '>'
-                        elif child_element is not None:
-                            yield newline
-                            subiter = self.export(child_element,
-                                                  desc.tag,
-                                                  desc.xmlns,
-                                                  depth=depth + 1)
-                            for chunk in subiter:
-                                yield chunk
-                yield newline
-            if children:
-                for s in itertools.repeat(self.indent, depth):
-                    yield s
-            yield '</'
-            if xmlns:
-                yield self.xmlns_alias[xmlns]
-                yield ':'
-            yield tag
-            yield '>'
+                append(encode(xml.sax.saxutils.escape(encoded_content_value)))
+            append(end)
+        elif children:
+            append('>')
+            if self.hints:
+                self.write_hints(element._hints if hints is None else hints,
+                                 depth, buffer_)
         else:
-            yield '/>'
+            append('/>')
+
+    def write_hints(self, hints, depth, buffer_):
+        """Serialize ``hints`` of an element into the ``buffer_`` list.
+
+        .. note::
+
+           Internal method.
+
+        """
+        append = buffer_.append
+        encode = self.encode
+        quoteattr = xml.sax.saxutils.quoteattr
+        hints = self.sort(
+            (desc.tag, desc.xmlns, hint_dict)
+            for desc, hint_dict in hints.items()
+        )
+        for hint_tag, hint_xmlns, hint_dict in hints:
+            for hint_id, hint_val in self.sort(hint_dict.items()):
+                append(self.newline)
+                append(self.indent * (depth + 1))
+                append('<')
+                append(self.xmlns_alias[SCHEMA_XMLNS])
+                append(':hint tag=')
+                append(quoteattr(hint_tag))
+                if hint_xmlns:
+                    append(' tag-xmlns=')
+                    append(quoteattr(hint_xmlns))
+                append(' id=')
+                if not isinstance(hint_id, binary_type):
+                    hint_id = encode(hint_id)
+                append(quoteattr(hint_id))
+                append(' value=')
+                if not isinstance(hint_val, binary_type):
+                    hint_val = encode(hint_val)
+                append(quoteattr(hint_val))
+                append('/>')
+
+    def iter_children(self, element, plan):
+        """Yield pairs of (child plan, child value) of the ``element``
+        in the order to be serialized, except of :const:`None` values.
+
+        .. note::
+
+           Internal method.
+
+        """
+        for child_plan in plan[4]:
+            attr, desc = child_plan[:2]
+            child_elements = getattr(element, attr, None)
+            if not desc.multiple:
+                if child_elements is not None:
+                    yield child_plan, child_elements
+                continue
+            elif desc.sort_key is not None:
+                child_elements = sorted(
+                    child_elements,
+                    key=desc.sort_key,
+                    reverse=bool(desc.sort_reverse)
+                )
+            for child_element in child_elements:
+                if child_element is not None:
+                    yield child_plan, child_element
+
+    def write_child(self, element, child_plan, child_element, depth, buffer_):
+        """Serialize the ``child_element`` of the ``element`` into
+        the ``buffer_`` list.
+
+        .. note::
+
+           Internal method.
+
+        """
+        attr, desc, text, start, end = child_plan
+        if not text:
+            if depth == 1 and self.verbatim and \
+               self.write_source(child_element, buffer_):
+                return
+            buffer_.append(self.newline)
+            self.write_element(child_element, desc.tag, desc.xmlns, depth,
+                               buffer_)
+            return
+        encoded_child = desc.encode(child_element, element)
+        if encoded_child is None:
+            return
+        elif not isinstance(encoded_child, string_type):
+            raise EncodeError(
+                '{0.__module__}.{0.__name__}.{1} attribute value {2!r} is '
+                'incorrectly encoded to {3!r}'.format(
+                    type(element), attr, child_element, encoded_child
+                )
+            )
+        buffer_.extend((
+            self.newline,
+            self.indent * depth,
+            start,
+            self.encode(xml.sax.saxutils.escape(encoded_child)),
+            end
+        ))
+
+    def write_source(self, element, buffer_):
+        """Copy the source of the ``element`` into the ``buffer_`` list
+        if it hasn't changed since it was read.
+
+        :returns: whether it's copied or not
+        :rtype: :class:`bool`
+
+        .. note::
+
+           Internal method.
+
+        """
+        span = getattr(element, '_span', None)
+        if span is not None and span[2] is None and element._partial:
+            # Parse the rest of the element to complete its span
+            parse_next = element._root()._parse_next
+            while element._partial and parse_next():
+                pass
+            span = element._span
+        if span is None or span[0] is None or span[2] is None:
+            return False
+        source, start, end = span
+        try:
+            compatible, separator = self.sources[id(source)][1:]
+        except KeyError:
+            plan = self.compile(self.document_type,
+                                self.document_type.__tag__,
+                                self.document_type.__xmlns__)
+            head = self.declaration + plan[1] + self.xmlns_declarations
+            separator = self.newline + self.indent
+            if UNICODE_BY_DEFAULT:
+                head = head.encode('utf-8')
+                separator = separator.encode('utf-8')
+            # No other namespace prefixes can be declared
+            compatible = source.startswith(head) and \
+                source[len(head):len(head) + 7] != b' xmlns:'
+            self.sources[id(source)] = source, compatible, separator
+        if not compatible or \
+           source[start - len(separator):start] != separator:
+            return False
+        buffer_.extend((self.newline, self.indent,
+                        self.decode(source[start:end])))
+        return True
+
+    def write_end(self, plan, depth, buffer_):
+        """Serialize the end tag of the ``element`` having children into
+        the ``buffer_`` list.
+
+        .. note::
+
+           Internal method.
+
+        """
+        buffer_.extend((self.newline, self.indent * depth, plan[5]))
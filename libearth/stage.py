@@ -104,6 +104,16 @@ class BaseStage(object):
     :type session: :class:`~libearth.session.Session`
     :param repository: the repository to stage
     :type repository: :class:`~libearth.repository.Repository`
+    :param index: write documents with byte offsets of their children
+                  (see ``index`` option of :class:`~libearth.schema.write`),
+                  so that children can be randomly accessed without parsing
+                  all children before them.  note that every document is
+                  buffered in memory to be written then.
+                  :const:`False` by default
+    :type index: :class:`bool`
+
+    .. versionadded:: 0.4.0
+       The ``index`` option.
 
     """
 
@@ -123,7 +133,13 @@ class BaseStage(object):
     #: when the transaction is committed, and stack information.
     transactions = None
 
-    def __init__(self, session, repository):
+    #: (:class:`bool`) Whether to write documents with byte offsets of
+    #: their children.
+    #:
+    #: .. versionadded:: 0.4.0
+    index = None
+
+    def __init__(self, session, repository, index=False):
         if not isinstance(session, Session):
             raise TypeError('session must be an instance of {0.__module__}.'
                             '{0.__name__}, not {1!r}'.format(Session, session))
@@ -134,6 +150,7 @@ class BaseStage(object):
             )
         self.session = session
         self.repository = repository
+        self.index = bool(index)
         self.transactions = {}
         self.lock = threading.RLock()
 
@@ -152,8 +169,8 @@ class BaseStage(object):
                 'note that previous transaction is begun at:\n' +
                 ''.join('  ' + line.replace('\n', '\n  ', 1) for line in stack)
             )
-        transactions[context_id] = (DirtyBuffer(self.repository, self.lock),
-                                    traceback.format_stack())
+        dirty_buffer = DirtyBuffer(self.repository, self.lock, self.index)
+        transactions[context_id] = dirty_buffer, traceback.format_stack()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -250,7 +267,7 @@ class BaseStage(object):
             )
         repository = self.get_current_transaction()
         chunks = repository.read(key)
-        document = read(document_type, chunks)
+        document = read(document_type, chunks, record=True)
         assert isinstance(document, MergeableDocumentElement)
         not_stamped = document.__revision__ is None
         if not_stamped:
@@ -323,7 +340,7 @@ class BaseStage(object):
             document = self.session.pull(document)
             pull = True
         else:
-            prev_doc = read(type(document), prev)
+            prev_doc = read(type(document), prev, record=True)
             prev_rev = prev_doc.__revision__
             doc_rev = document.__revision__
             pull = (
@@ -343,7 +360,8 @@ class BaseStage(object):
                     document = self.session.pull(document)
                 document = self.session.merge(prev_doc, document, force=True)
         with self.lock:  # FIXME
-            bytearray = write(document, canonical_order=True, as_bytes=True)
+            bytearray = write(document, canonical_order=True, as_bytes=True,
+                              index=self.index, verbatim=True)
         repository.write(key, bytearray, _type_hint=type(document))
         return document
 
@@ -363,6 +381,9 @@ class DirtyBuffer(Repository):
     :type repository: :class:`~libearth.repository.Repository`
     :param lock: the common lock shared between dirty buffers of the same stage
     :type lock: :class:`threading.RLock`
+    :param index: whether to write merged documents with byte offsets of
+                  their children.  :const:`False` by default
+    :type index: :class:`bool`
 
     .. note::
 
@@ -374,10 +395,11 @@ class DirtyBuffer(Repository):
     #: the buffer will :meth:`flush` to.
     repository = None
 
-    def __init__(self, repository, lock):
+    def __init__(self, repository, lock, index=False):
         self.repository = repository
         self.dictionary = {}
         self.lock = lock
+        self.index = index
 
     def read(self, key):
         super(DirtyBuffer, self).read(key)
@@ -471,8 +493,9 @@ class DirtyBuffer(Repository):
                             if prev is not None and \
                                 (crev is None or crev[0] is None or
                                  not crev[1].contains(prev[0])):
-                                prev_doc = read(type_hint, prev_iterable)
-                                doc = read(type_hint, bytearray)
+                                prev_doc = read(type_hint, prev_iterable,
+                                                record=True)
+                                doc = read(type_hint, bytearray, record=True)
                                 merged_doc = prev[0].session.merge(
                                     doc,
                                     prev_doc,
@@ -481,7 +504,9 @@ class DirtyBuffer(Repository):
                                 bytearray = write(
                                     merged_doc,
                                     canonical_order=True,
-                                    as_bytes=True
+                                    as_bytes=True,
+                                    index=self.index,
+                                    verbatim=True
                                 )
                     write_to_repository(key, bytearray)
             _dictionary.clear()
@@ -15,7 +15,8 @@ import hashlib
 from .codecs import Boolean, Integer, Rfc822
 from .compat import string_type, text_type
 from .feed import Feed, Person
-from .schema import Attribute, Child, Codec, Element, Text
+from .schema import (Attribute, Child, Codec, Element, Text,
+                     inspect_attributes)
 from .session import MergeableDocumentElement
 from .tz import now
 
@@ -185,7 +186,8 @@ class SubscriptionSet(collections.MutableSet):
             raise TypeError('expected {0.__module__}.{0.__name__}, not '
                             '{1!r}'.format(Outline, outline))
         deleted_at = now()
-        if deleted_at <= outline.created_at:
+        if outline.created_at is not None and \
+           deleted_at <= outline.created_at:
             deleted_at = (outline.created_at +
                           datetime.timedelta(microseconds=1))  # FIXME
         for child in self.children:
@@ -237,6 +239,47 @@ class SubscriptionSet(collections.MutableSet):
         self.children.append(sub)
         return sub
 
+    def relocate(self, feed_uri, new_uri):
+        """Move subscriptions of the given ``feed_uri`` in the whole tree
+        to ``new_uri``, e.g. when the feed has permanently moved (see
+        :attr:`CrawlResult.permanent_url
+        <libearth.crawler.CrawlResult.permanent_url>`).  Each subscription
+        is replaced by a new one of ``new_uri`` in the same category, and
+        the old one is discarded so that the move is merged as well.
+        The :attr:`~Subscription.feed_id` is kept, so the new subscription
+        still refers to the same stored feed.
+
+        :param feed_uri: the feed url to relocate
+        :type feed_uri: :class:`str`
+        :param new_uri: the new feed url
+        :type new_uri: :class:`str`
+        :returns: the number of relocated subscriptions
+        :rtype: :class:`numbers.Integral`
+
+        .. versionadded:: 0.4.0
+
+        """
+        if not isinstance(new_uri, string_type):
+            raise TypeError('new_uri must be a string, not ' + repr(new_uri))
+        elif feed_uri == new_uri:
+            return 0
+        relocated = 0
+        for child in list(self):
+            if isinstance(child, Category):
+                relocated += child.relocate(feed_uri, new_uri)
+            elif child.feed_uri == feed_uri:
+                subscription = Subscription()
+                for name, _ in inspect_attributes(Subscription).values():
+                    # created_at is stamped by add()
+                    if name not in ('created_at', 'deleted_at', 'feed_uri'):
+                        setattr(subscription, name, getattr(child, name))
+                subscription.feed_id = child.feed_id
+                subscription.feed_uri = new_uri
+                self.discard(child)
+                self.add(subscription)
+                relocated += 1
+        return relocated
+
     @property
     def categories(self):
         """(:class:`collections.Mapping`) Label to :class:`Category` instance
@@ -337,7 +380,9 @@ class Outline(Element):
         .. versionadded:: 0.3.0
 
         """
-        return bool(self.deleted_at and self.deleted_at > self.created_at)
+        return bool(self.deleted_at and
+                    (self.created_at is None or
+                     self.deleted_at > self.created_at))
 
     @property
     def feed_id(self):
@@ -0,0 +1,270 @@
+import time
+
+from pytest import fixture, importorskip, raises
+
+from libearth.aiocrawler import async_crawl, fetch_feed, request
+from libearth.crawler import CrawlError, IconCache, MemoryValidatorStore
+from .crawler_test import (atom_xml, favicon_test_atom_xml, gzip_compress,
+                           rss_xml)
+
+asyncio = importorskip('asyncio')
+
+
+@fixture
+def fx_loop(request):
+    loop = asyncio.new_event_loop()
+    request.addfinalizer(loop.close)
+    return loop
+
+
+def chunked_response(handler):
+    handler.send_response(200)
+    handler.send_header('Content-Type', 'application/rss+xml')
+    handler.send_header('Transfer-Encoding', 'chunked')
+    handler.end_headers()
+    for i in range(0, len(rss_xml), 100):
+        chunk = rss_xml[i:i + 100]
+        handler.wfile.write('{0:x}\r\n'.format(len(chunk)).encode('ascii'))
+        handler.wfile.write(chunk + b'\r\n')
+    handler.wfile.write(b'0\r\n\r\n')
+
+
+def test_request(fx_loop, fx_http_server):
+    fx_http_server.routes['/atom.xml'] = 200, 'application/atom+xml', atom_xml
+    fx_http_server.routes['/redirect'] = 301, 'text/plain', b'', {
+        'Location': '/atom.xml'
+    }
+    response = fx_loop.run_until_complete(
+        request(fx_http_server.url('/redirect'), loop=fx_loop)
+    )
+    assert response.status == 200
+    assert response.headers['content-type'] == 'application/atom+xml'
+    assert response.body == atom_xml
+    assert response.url == fx_http_server.url('/atom.xml')
+    assert response.redirects == [fx_http_server.url('/atom.xml')]
+    assert response.redirect_statuses == [301]
+    response = fx_loop.run_until_complete(
+        request(fx_http_server.url('/atom.xml'), 'HEAD', loop=fx_loop)
+    )
+    assert response.status == 200
+    assert response.body == b''
+
+
+def test_fetch_feed(fx_loop, fx_http_server):
+    routes = fx_http_server.routes
+    routes['/favicon.xml'] = 200, 'application/atom+xml', \
+        favicon_test_atom_xml.replace(b'http://favicontest.com/',
+                                      fx_http_server.url('/').encode())
+    routes['/'] = 200, 'text/html', b'<html><head></head></html>'
+    routes['/favicon.ico'] = 200, 'image/x-icon', b'ico'
+    result = fx_loop.run_until_complete(
+        fetch_feed(fx_http_server.url('/favicon.xml'), loop=fx_loop)
+    )
+    assert result.feed.title.value == 'Favicon Test'
+    assert result.icon_url == fx_http_server.url('/favicon.ico')
+    assert [r[:2] for r in fx_http_server.requests] == [
+        ('GET', '/favicon.xml'), ('GET', '/'), ('HEAD', '/favicon.ico')
+    ]
+    assert result.metrics.status == 200
+    assert result.metrics.redirects == []
+    assert [p.name for p in result.metrics.phases] == [
+        'request', 'detect', 'parse', 'sort', 'favicon'
+    ]
+
+
+def test_fetch_feed_permanent_redirect(fx_loop, fx_http_server):
+    routes = fx_http_server.routes
+    routes['/old.xml'] = 301, 'text/plain', b'', {'Location': '/temp.xml'}
+    routes['/temp.xml'] = 307, 'text/plain', b'', {'Location': '/atom.xml'}
+    routes['/atom.xml'] = 200, 'application/atom+xml', atom_xml
+    result = fx_loop.run_until_complete(
+        fetch_feed(fx_http_server.url('/old.xml'), resolve_icon=False,
+                   loop=fx_loop)
+    )
+    assert result.final_url == fx_http_server.url('/atom.xml')
+    assert result.permanent_url == fx_http_server.url('/temp.xml')
+    result = fx_loop.run_until_complete(
+        fetch_feed(fx_http_server.url('/temp.xml'), resolve_icon=False,
+                   loop=fx_loop)
+    )
+    assert result.final_url == fx_http_server.url('/atom.xml')
+    assert result.permanent_url is None
+
+
+def test_fetch_feed_icon_cache(fx_loop, fx_http_server):
+    routes = fx_http_server.routes
+    routes['/favicon.xml'] = 200, 'application/atom+xml', \
+        favicon_test_atom_xml.replace(b'http://favicontest.com/',
+                                      fx_http_server.url('/').encode())
+    routes['/'] = 200, 'text/html', b'<html><head></head></html>'
+    cache = IconCache()
+    for _ in range(2):
+        result = fx_loop.run_until_complete(
+            fetch_feed(fx_http_server.url('/favicon.xml'), icon_cache=cache,
+                       loop=fx_loop)
+        )
+        assert result.icon_url is None
+    assert [r[:2] for r in fx_http_server.requests] == [
+        ('GET', '/favicon.xml'), ('GET', '/'), ('HEAD', '/favicon.ico'),
+        ('GET', '/favicon.xml')
+    ]
+    del fx_http_server.requests[:]
+    result = fx_loop.run_until_complete(
+        fetch_feed(fx_http_server.url('/favicon.xml'), resolve_icon=False,
+                   loop=fx_loop)
+    )
+    assert result.icon_url is None
+    assert len(fx_http_server.requests) == 1
+
+
+def test_fetch_feed_chunked(fx_loop, fx_http_server, fx_opener):
+    fx_http_server.routes['/rss.xml'] = chunked_response
+    fx_http_server.routes['/'] = 404, 'text/plain', b''
+    result = fx_loop.run_until_complete(
+        fetch_feed(fx_http_server.url('/rss.xml'), loop=fx_loop)
+    )
+    assert result.feed.title.value == 'Vio Blog'
+
+
+def test_fetch_feed_compressed(fx_loop, fx_http_server):
+    encoded = gzip_compress(atom_xml)
+    fx_http_server.routes['/atom.xml'] = 200, 'application/atom+xml', \
+        encoded, {'Content-Encoding': 'gzip'}
+    result = fx_loop.run_until_complete(
+        fetch_feed(fx_http_server.url('/atom.xml'), loop=fx_loop)
+    )
+    assert result.feed.title.value == 'Atom Test'
+    assert result.wire_bytes == len(encoded)
+    assert result.decoded_bytes == len(atom_xml)
+    assert fx_http_server.requests[0][2]['Accept-Encoding'] == 'gzip, deflate'
+
+
+def test_fetch_feed_parse_pool(fx_loop, fx_http_server, fx_parse_pool):
+    fx_http_server.routes['/atom.xml'] = 200, 'application/atom+xml', atom_xml
+    result = fx_loop.run_until_complete(
+        fetch_feed(fx_http_server.url('/atom.xml'), parse_pool=fx_parse_pool,
+                   loop=fx_loop)
+    )
+    assert result.feed.title.value == 'Atom Test'
+    assert len(result.feed.entries) == 2
+    assert result.icon_url == 'http://vio.atomtest.com/favicon.ico'
+    assert [p.name for p in result.metrics.phases] == [
+        'request', 'dispatch', 'detect', 'parse', 'sort', 'serialize'
+    ]
+
+
+def test_fetch_feed_conditional(fx_loop, fx_http_server):
+    def conditional(handler):
+        if handler.headers.get('If-None-Match') == '"v1"':
+            return 304, 'application/atom+xml', b''
+        return 200, 'application/atom+xml', atom_xml, {'ETag': '"v1"'}
+    fx_http_server.routes['/atom.xml'] = conditional
+    store = MemoryValidatorStore()
+    url = fx_http_server.url('/atom.xml')
+    result = fx_loop.run_until_complete(
+        fetch_feed(url, validator_store=store, loop=fx_loop)
+    )
+    assert not result.not_modified
+    assert store.get(url).etag == '"v1"'
+    result = fx_loop.run_until_complete(
+        fetch_feed(url, validator_store=store, loop=fx_loop)
+    )
+    assert result.not_modified
+    assert result.feed is None
+
+
+def test_fetch_feed_unchanged(fx_loop, fx_http_server):
+    fx_http_server.routes['/atom.xml'] = 200, 'application/atom+xml', atom_xml
+    store = MemoryValidatorStore()
+    url = fx_http_server.url('/atom.xml')
+    result = fx_loop.run_until_complete(
+        fetch_feed(url, validator_store=store, loop=fx_loop)
+    )
+    assert not result.unchanged
+    result = fx_loop.run_until_complete(
+        fetch_feed(url, validator_store=store, loop=fx_loop)
+    )
+    assert result.unchanged
+    assert result.feed is None
+
+
+def test_fetch_feed_error(fx_loop, fx_http_server):
+    url = fx_http_server.url('/not-found.xml')
+    with raises(CrawlError):
+        try:
+            fx_loop.run_until_complete(fetch_feed(url, loop=fx_loop))
+        except CrawlError as e:
+            assert e.feed_uri == url
+            assert e.metrics.status == 404
+            raise
+    fx_http_server.routes['/broken.xml'] = 200, 'text/xml', b'<broken'
+    with raises(CrawlError):
+        fx_loop.run_until_complete(
+            fetch_feed(fx_http_server.url('/broken.xml'), loop=fx_loop)
+        )
+
+
+def test_fetch_feed_timeout(fx_loop, fx_http_server):
+    def slow(handler):
+        time.sleep(1)
+        return 200, 'application/atom+xml', atom_xml
+    fx_http_server.routes['/slow.xml'] = slow
+    with raises(CrawlError):
+        fx_loop.run_until_complete(
+            fetch_feed(fx_http_server.url('/slow.xml'), timeout=0.2,
+                       loop=fx_loop)
+        )
+
+
+def test_async_crawl(fx_loop, fx_http_server):
+    routes = fx_http_server.routes
+    for i in range(20):
+        routes['/{0}.xml'.format(i)] = 200, 'application/atom+xml', atom_xml
+    urls = [fx_http_server.url('/{0}.xml'.format(i)) for i in range(20)]
+    urls.append(fx_http_server.url('/not-found.xml'))
+    crawler = async_crawl(urls, concurrency=4, loop=fx_loop)
+    results = []
+    errors = []
+    for future in crawler:
+        try:
+            results.append(fx_loop.run_until_complete(future))
+        except CrawlError as e:
+            errors.append(e.feed_uri)
+        assert crawler.in_flight <= 4
+    assert sorted(r.url for r in results) == sorted(urls[:-1])
+    assert errors == urls[-1:]
+    assert all(r.feed.title.value == 'Atom Test' for r in results)
+
+
+class BrokenValidatorStore(MemoryValidatorStore):
+
+    def get(self, feed_uri):
+        if feed_uri.endswith('/broken.xml'):
+            raise IOError('failed to load validators')
+        return super(BrokenValidatorStore, self).get(feed_uri)
+
+
+def test_async_crawl_validator_store_error(fx_loop, fx_http_server):
+    routes = fx_http_server.routes
+    for i in range(4):
+        routes['/{0}.xml'.format(i)] = 200, 'application/atom+xml', atom_xml
+    urls = [fx_http_server.url('/{0}.xml'.format(i)) for i in range(4)]
+    urls.insert(1, fx_http_server.url('/broken.xml'))
+    urls.append(fx_http_server.url('/broken.xml'))
+    crawler = async_crawl(urls, concurrency=2, loop=fx_loop,
+                          validator_store=BrokenValidatorStore())
+    results = []
+    errors = []
+    for future in crawler:
+        try:
+            results.append(fx_loop.run_until_complete(future))
+        except CrawlError as e:
+            errors.append(e.feed_uri)
+    assert sorted(r.url for r in results) == sorted(urls[:1] + urls[2:-1])
+    assert errors == [fx_http_server.url('/broken.xml')] * 2
+    assert crawler.in_flight == 0
+
+
+def test_async_crawl_concurrency(fx_loop):
+    with raises(ValueError):
+        async_crawl([], concurrency=0, loop=fx_loop)
@@ -0,0 +1,369 @@
+""":mod:`tests.benchmark` --- Crawler throughput benchmark
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Serves a generated corpus of RSS 1.0, RSS 2.0 and Atom feeds of various
+sizes from a local in-process HTTP server, and then runs
+:func:`~libearth.crawler.crawl()` on them at several pool sizes.
+It reports feeds per second, p50/p99 latency of each feed, and peak
+memory, so that crawler changes can be checked for regressions:
+
+.. code-block:: console
+
+   $ python -m tests.benchmark --feeds 300 --pool-sizes 1,4,16 \\
+                               --latency 0.05 --error-rate 0.05
+
+Latency is injected to every response, and errors (``503`` responses
+and broken feeds) to the given fraction of feeds.  Peak memory is
+measured by :mod:`tracemalloc` if it's available (Python 3.4+), or
+otherwise the maximum resident set size of the whole process is reported.
+
+"""
+import collections
+import logging
+import math
+import optparse
+import random
+import sys
+import threading
+import time
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from libearth.crawler import CrawlError, crawl
+from .conftest import MockHTTPServer
+
+
+#: (:class:`collections.Sequence`) The feed formats of the corpus.
+FORMATS = 'rss1', 'rss2', 'atom'
+
+#: (:class:`collections.Sequence`) The numbers of entries of feeds in
+#: the corpus.
+SIZES = 5, 50, 500
+
+#: (:class:`str`) Lorem ipsum text used for entry contents.
+LOREM = (
+    'Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod '
+    'tempor incididunt ut labore et dolore magna aliqua. Ut enim ad minim '
+    'veniam, quis nostrud exercitation ullamco laboris nisi ut aliquip ex ea '
+    'commodo consequat. '
+)
+
+RSS1_TEMPLATE = u'''<?xml version="1.0" encoding="utf-8"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns="http://purl.org/rss/1.0/"
+         xmlns:dc="http://purl.org/dc/elements/1.1/">
+  <channel rdf:about="{url}">
+    <title>Feed {id}</title>
+    <link>{url}</link>
+    <description>Benchmark feed {id}</description>
+    <dc:date>2014-11-03T12:00:00Z</dc:date>
+  </channel>
+{entries}</rdf:RDF>
+'''
+
+RSS1_ENTRY_TEMPLATE = u'''  <item rdf:about="{url}#{i}">
+    <title>Entry {i}</title>
+    <link>{url}#{i}</link>
+    <description>{content}</description>
+    <dc:creator>Author {i}</dc:creator>
+    <dc:date>2014-11-{day:02d}T{hour:02d}:00:00Z</dc:date>
+  </item>
+'''
+
+RSS2_TEMPLATE = u'''<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0">
+  <channel>
+    <title>Feed {id}</title>
+    <link>{url}</link>
+    <description>Benchmark feed {id}</description>
+    <lastBuildDate>Mon, 03 Nov 2014 12:00:00 GMT</lastBuildDate>
+    <ttl>60</ttl>
+{entries}  </channel>
+</rss>
+'''
+
+RSS2_ENTRY_TEMPLATE = u'''    <item>
+      <title>Entry {i}</title>
+      <link>{url}#{i}</link>
+      <guid>{url}#{i}</guid>
+      <description>{content}</description>
+      <pubDate>Sat, {day:02d} Nov 2014 {hour:02d}:00:00 GMT</pubDate>
+    </item>
+'''
+
+ATOM_TEMPLATE = u'''<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>Feed {id}</title>
+  <id>{url}</id>
+  <link rel="alternate" href="{url}" />
+  <link rel="icon" href="{url}favicon.ico" />
+  <updated>2014-11-03T12:00:00Z</updated>
+{entries}</feed>
+'''
+
+ATOM_ENTRY_TEMPLATE = u'''  <entry>
+    <title>Entry {i}</title>
+    <id>{url}#{i}</id>
+    <link rel="alternate" href="{url}#{i}" />
+    <author><name>Author {i}</name></author>
+    <updated>2014-11-{day:02d}T{hour:02d}:00:00Z</updated>
+    <content type="html">&lt;p&gt;{content}&lt;/p&gt;</content>
+  </entry>
+'''
+
+TEMPLATES = {
+    'rss1': (RSS1_TEMPLATE, RSS1_ENTRY_TEMPLATE, 'application/rdf+xml'),
+    'rss2': (RSS2_TEMPLATE, RSS2_ENTRY_TEMPLATE, 'application/rss+xml'),
+    'atom': (ATOM_TEMPLATE, ATOM_ENTRY_TEMPLATE, 'application/atom+xml'),
+}
+
+
+#: The measurement of a benchmark run.  See :func:`run_benchmark()`.
+BenchmarkResult = collections.namedtuple('BenchmarkResult', [
+    'pool_size', 'feeds', 'errors', 'seconds', 'throughput',
+    'p50', 'p99', 'peak_memory'
+])
+
+
+def generate_feed(feed_format, feed_id, url, entries):
+    """Generate a feed document.
+
+    :param feed_format: one of :const:`FORMATS`
+    :type feed_format: :class:`str`
+    :param feed_id: the number which identifies the feed
+    :type feed_id: :class:`numbers.Integral`
+    :param url: the url of the feed
+    :type url: :class:`str`
+    :param entries: the number of entries
+    :type entries: :class:`numbers.Integral`
+    :returns: a pair of (mimetype, document)
+    :rtype: :class:`tuple`
+
+    """
+    template, entry_template, mimetype = TEMPLATES[feed_format]
+    content = LOREM * (1 + feed_id % 4)
+    body = u''.join(
+        entry_template.format(url=url, i=i, content=content,
+                              day=1 + i % 28, hour=i % 24)
+        for i in range(entries)
+    )
+    document = template.format(id=feed_id, url=url, entries=body)
+    return mimetype, document.encode('utf-8')
+
+
+def generate_corpus(count, base_url='http://localhost/', seed=0):
+    """Generate a corpus of ``count`` feeds in :const:`FORMATS` and
+    :const:`SIZES`.
+
+    :param count: the number of feeds
+    :type count: :class:`numbers.Integral`
+    :param base_url: the url the corpus is served under
+    :type base_url: :class:`str`
+    :param seed: the random seed to shuffle sizes
+    :type seed: :class:`numbers.Hashable`
+    :returns: a mapping of paths to (mimetype, document) pairs
+    :rtype: :class:`collections.Mapping`
+
+    """
+    rng = random.Random(seed)
+    corpus = {}
+    for i in range(count):
+        feed_format = FORMATS[i % len(FORMATS)]
+        path = '/{0}/{1}.xml'.format(feed_format, i)
+        corpus[path] = generate_feed(feed_format, i,
+                                     base_url.rstrip('/') + path,
+                                     rng.choice(SIZES))
+    return corpus
+
+
+def serve_corpus(server, corpus, latency=0, error_rate=0, seed=0):
+    """Route the ``corpus`` on the ``server``, injecting ``latency`` to
+    every response and errors to ``error_rate`` of feeds.  Half of
+    errors are ``503 Service Unavailable``, and the rest are broken feeds.
+
+    :param server: the local http server
+    :type server: :class:`tests.conftest.MockHTTPServer`
+    :param corpus: the result of :func:`generate_corpus()`
+    :type corpus: :class:`collections.Mapping`
+    :param latency: the average number of seconds to delay each response.
+                    each delay varies from half to one and a half of it
+    :type latency: :class:`numbers.Real`
+    :param error_rate: the fraction of feeds to fail
+    :type error_rate: :class:`numbers.Real`
+    :param seed: the random seed to choose feeds to fail
+    :type seed: :class:`numbers.Hashable`
+    :returns: the set of paths to fail
+    :rtype: :class:`collections.Set`
+
+    """
+    rng = random.Random(seed)
+    paths = sorted(corpus)
+    failing = rng.sample(paths, int(len(paths) * error_rate))
+    unavailable = frozenset(failing[::2])
+    failing = frozenset(failing)
+    lock = threading.Lock()
+
+    def route(path, mimetype, document):
+        def respond(handler):
+            if latency:
+                with lock:
+                    delay = latency * rng.uniform(0.5, 1.5)
+                time.sleep(delay)
+            if path not in failing:
+                return 200, mimetype, document
+            elif path in unavailable:
+                return 503, 'text/plain', b'unavailable'
+            return 200, mimetype, document[:len(document) // 2]
+        return respond
+    for path in paths:
+        mimetype, document = corpus[path]
+        server.routes[path] = route(path, mimetype, document)
+    server.routes['/favicon.ico'] = 200, 'image/x-icon', b''
+    return failing
+
+
+def percentile(values, p):
+    """Get the ``p``-th percentile of the ``values`` by the nearest-rank
+    method.
+
+    :param values: the values
+    :type values: :class:`collections.Sequence`
+    :param p: the percentile between 0 and 100
+    :type p: :class:`numbers.Real`
+    :returns: the percentile, or :const:`None` if ``values`` is empty
+    :rtype: :class:`numbers.Real`
+
+    """
+    if not values:
+        return
+    values = sorted(values)
+    rank = int(math.ceil(p / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def run_benchmark(feed_urls, pool_size, **options):
+    r"""Crawl the ``feed_urls`` and measure it.
+
+    :param feed_urls: feed urls to crawl
+    :type feed_urls: :class:`collections.Sequence`
+    :param pool_size: the number of workers
+    :type pool_size: :class:`numbers.Integral`
+    :param \*\*options: other options to :func:`~libearth.crawler.crawl()`
+    :returns: the measurement
+    :rtype: :class:`BenchmarkResult`
+
+    """
+    latencies = []
+    if tracemalloc is not None:
+        tracemalloc.start()
+    started_at = time.time()
+    try:
+        for result in crawl(feed_urls, pool_size, **options):
+            latencies.append(result.metrics.seconds)
+    except CrawlError:
+        pass
+    seconds = time.time() - started_at
+    if tracemalloc is not None:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    elif resource is not None:
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':  # it's in kilobytes except for OS X
+            peak_memory *= 1024
+    else:
+        peak_memory = None
+    return BenchmarkResult(
+        pool_size=pool_size,
+        feeds=len(latencies),
+        errors=len(feed_urls) - len(latencies),
+        seconds=seconds,
+        throughput=len(latencies) / seconds if seconds else None,
+        p50=percentile(latencies, 50),
+        p99=percentile(latencies, 99),
+        peak_memory=peak_memory
+    )
+
+
+#: (:class:`str`) The format of each row of the report.
+ROW_FORMAT = '{0:>5} {1:>6} {2:>6} {3:>8} {4:>8} {5:>8} {6:>8} {7:>9}'
+
+
+def format_result(result):
+    """Format the ``result`` as a row of the report.
+
+    :param result: the result of :func:`run_benchmark()`
+    :type result: :class:`BenchmarkResult`
+    :returns: the formatted row
+    :rtype: :class:`str`
+
+    """
+    def number(value, scale):
+        return '-' if value is None else '{0:.1f}'.format(value * scale)
+    return ROW_FORMAT.format(
+        result.pool_size, result.feeds, result.errors,
+        number(result.seconds, 1), number(result.throughput, 1),
+        number(result.p50, 1000), number(result.p99, 1000),
+        number(result.peak_memory, 1 / 1024.0 / 1024)
+    )
+
+
+def main(args=None):
+    """The command line entry point.
+
+    :param args: command line arguments.  :data:`sys.argv` by default
+    :type args: :class:`collections.Sequence`
+
+    """
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--feeds', type='int', default=300,
+                      help='the number of feeds [%default]')
+    parser.add_option('--pool-sizes', default='1,4,16',
+                      help='comma-separated pool sizes to run [%default]')
+    parser.add_option('--latency', type='float', default=0.02,
+                      help='the average seconds of latency to inject to '
+                           'each response [%default]')
+    parser.add_option('--error-rate', type='float', default=0.05,
+                      help='the fraction of feeds to fail [%default]')
+    parser.add_option('--resolve-icon', action='store_true', default=False,
+                      help='discover favicons of feeds as well')
+    parser.add_option('--seed', type='int', default=0,
+                      help='the random seed [%default]')
+    parser.add_option('-v', '--verbose', action='store_true', default=False,
+                      help='print logs of the crawler as well')
+    options, _ = parser.parse_args(args)
+    if not options.verbose:
+        # Injected errors are logged by the crawler
+        logging.getLogger('libearth').setLevel(logging.CRITICAL)
+    server = MockHTTPServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        corpus = generate_corpus(options.feeds, server.url('/'), options.seed)
+        serve_corpus(server, corpus, options.latency, options.error_rate,
+                     options.seed)
+        feed_urls = [server.url(path) for path in sorted(corpus)]
+        size = sum(len(document) for _, document in corpus.values())
+        print('{0} feeds, {1:.1f} MiB in total'.format(
+            len(feed_urls), size / 1024.0 / 1024
+        ))
+        print(ROW_FORMAT.format('pool', 'feeds', 'errors', 'seconds',
+                                'feeds/s', 'p50 ms', 'p99 ms', 'peak MiB'))
+        for pool_size in options.pool_sizes.split(','):
+            result = run_benchmark(feed_urls, int(pool_size),
+                                   resolve_icon=options.resolve_icon)
+            print(format_result(result))
+            sys.stdout.flush()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
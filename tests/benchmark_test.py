@@ -0,0 +1,38 @@
+from libearth.crawler import parse_feed
+from .benchmark import (FORMATS, generate_corpus, percentile, run_benchmark,
+                        serve_corpus)
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([3, 1, 2], 0) == 1
+    assert percentile([], 50) is None
+
+
+def test_generate_corpus():
+    corpus = generate_corpus(6, 'http://example.com/')
+    assert len(corpus) == 6
+    for path, (mimetype, document) in corpus.items():
+        assert path.split('/')[1] in FORMATS
+        feed, _ = parse_feed('http://example.com' + path, document, mimetype)
+        assert feed.title.value.startswith('Feed ')
+        assert feed.entries
+    assert generate_corpus(6, 'http://example.com/') == corpus
+
+
+def test_run_benchmark(fx_http_server, fx_opener):
+    corpus = generate_corpus(10, fx_http_server.url('/'))
+    failing = serve_corpus(fx_http_server, corpus, latency=0.001,
+                           error_rate=0.2)
+    assert len(failing) == 2
+    urls = [fx_http_server.url(path) for path in sorted(corpus)]
+    for pool_size in 1, 3:
+        result = run_benchmark(urls, pool_size, resolve_icon=False)
+        assert result.pool_size == pool_size
+        assert result.feeds == 8
+        assert result.errors == 2
+        assert result.throughput > 0
+        assert 0 < result.p50 <= result.p99
@@ -0,0 +1,105 @@
+import xml.sax
+import xml.sax.handler
+
+from pytest import mark, raises
+
+from libearth.compat import IRON_PYTHON
+from libearth.schema import PARSER_LIST
+if not IRON_PYTHON:
+    from libearth.compat.expatreader import ExpatReader
+
+
+cpython_only = mark.skipif('IRON_PYTHON', reason='Test only for CPython')
+
+
+class RecordingHandler(xml.sax.handler.ContentHandler):
+
+    def __init__(self):
+        xml.sax.handler.ContentHandler.__init__(self)
+        self.events = []
+
+    def startDocument(self):
+        self.events.append('start')
+
+    def endDocument(self):
+        self.events.append('end')
+
+    def startElementNS(self, tag, qname, attrs):
+        self.events.append(('start', tag, dict(attrs.items())))
+
+    def endElementNS(self, tag, qname):
+        self.events.append(('end', tag))
+
+    def characters(self, content):
+        self.events.append(content)
+
+
+@cpython_only
+def test_parser_list():
+    parser = xml.sax.make_parser(PARSER_LIST)
+    assert isinstance(parser, ExpatReader)
+
+
+@cpython_only
+def test_expat_reader():
+    parser = ExpatReader()
+    handler = RecordingHandler()
+    parser.setContentHandler(handler)
+    parser.setFeature(xml.sax.handler.feature_namespaces, True)
+    parser.prepareParser([
+        b'<root xmlns="http://example.com/" xmlns:x="http://test.com/">',
+        b'<tag a="1" x:b="2">hel', b'lo</tag><x:empty />',
+        b'</root>'
+    ])
+    assert parser.feed()
+    assert handler.events == [
+        'start',
+        ('start', ('http://example.com/', 'root'), {})
+    ]
+    while parser.feed():
+        pass
+    parser.close()
+    assert handler.events[2:] == [
+        ('start', ('http://example.com/', 'tag'),
+         {(None, 'a'): '1', ('http://test.com/', 'b'): '2'}),
+        'hel', 'lo',  # character data are split at chunk boundaries
+        ('end', ('http://example.com/', 'tag')),
+        ('start', ('http://test.com/', 'empty'), {}),
+        ('end', ('http://test.com/', 'empty')),
+        ('end', ('http://example.com/', 'root')),
+        'end'
+    ]
+    with raises(xml.sax.SAXNotSupportedException):
+        parser.setFeature(xml.sax.handler.feature_namespaces, False)
+
+
+@cpython_only
+def test_expat_reader_error():
+    parser = ExpatReader()
+    parser.setContentHandler(RecordingHandler())
+    parser.prepareParser([b'<root><a></b></root>'])
+    with raises(xml.sax.SAXParseException) as e:
+        parser.feed()
+    assert e.value.getLineNumber() == 1
+
+
+@cpython_only
+def test_expat_reader_byte_index():
+    parser = ExpatReader()
+    handler = RecordingHandler()
+    offsets = []
+    handler.startElementNS = lambda tag, qname, attrs: offsets.append(
+        (tag[1], parser.getByteIndex())
+    )
+    handler.endElementNS = lambda tag, qname: offsets.append(
+        ('/' + tag[1], parser.getByteIndex())
+    )
+    parser.setContentHandler(handler)
+    assert parser.getByteIndex() is None
+    parser.prepareParser([b'<root>\n  <a>', u'\xe9</a><b/>'.encode('utf-8'),
+                          b'</root>'])
+    while parser.feed():
+        pass
+    parser.close()
+    assert offsets == [('root', 0), ('a', 9), ('/a', 14), ('b', 18),
+                       ('/b', 22), ('/root', 22)]
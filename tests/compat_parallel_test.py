@@ -1,6 +1,14 @@
+import itertools
+import multiprocessing
 import numbers
+import threading
+import time
 
-from libearth.compat.parallel import cpu_count, parallel_map
+from pytest import fixture, raises, skip
+
+from libearth.compat import parallel
+from libearth.compat.parallel import (SharedExecutor, cpu_count, parallel_map,
+                                      process_map)
 
 
 def test_cpu_count():
@@ -57,3 +65,151 @@ def test_parallel_map_errors_in_loop():
         except StopIteration:
             break
     assert len(results) == 3
+
+
+@fixture(params=['futures', 'threadpool'])
+def fx_backend(request, monkeypatch):
+    if request.param == 'threadpool':
+        monkeypatch.setattr(parallel, 'ThreadPoolExecutor', None)
+    elif parallel.ThreadPoolExecutor is None:
+        skip('concurrent.futures is unavailable')
+    return request.param
+
+
+def test_parallel_map_ordered(fx_backend):
+    def fn(n):
+        time.sleep(n / 100.0)
+        return n
+
+    input = [5, 1, 4, 0, 3, 2]
+    assert list(parallel_map(6, fn, input, ordered=True)) == input
+    assert list(parallel_map(2, fn, input, ordered=True,
+                             max_in_flight=3)) == input
+    result = parallel_map(4, lambda n: 1 // n, [1, 0, 1], ordered=True)
+    it = iter(result)
+    assert next(it) == 1
+    assert next(it) == 1
+    with raises(ZeroDivisionError):
+        next(it)
+
+
+def test_parallel_map_max_in_flight(fx_backend):
+    lock = threading.Lock()
+    state = {'running': 0, 'max_running': 0, 'taken': 0}
+
+    def generate():
+        for i in itertools.count():
+            state['taken'] += 1
+            yield i
+
+    def fn(n):
+        with lock:
+            state['running'] += 1
+            state['max_running'] = max(state['max_running'],
+                                       state['running'])
+        time.sleep(0.01)
+        with lock:
+            state['running'] -= 1
+        return n
+
+    result = parallel_map(8, fn, generate(), max_in_flight=3)
+    assert state['taken'] == 3
+    for n in result:
+        if n >= 20:
+            result.cancel()
+    assert state['max_running'] <= 3
+    assert state['taken'] < 30
+    with raises(ValueError):
+        parallel_map(4, fn, [1], max_in_flight=0)
+    with raises(TypeError):
+        parallel_map(4, fn, [1], unknown=True)
+
+
+def test_parallel_map_timeout(fx_backend):
+    def fn(n):
+        time.sleep(n)
+        return n
+
+    start = time.time()
+    result = parallel_map(4, fn, [0, 0.05, 2], timeout=0.5)
+    results = []
+    with raises(multiprocessing.TimeoutError):
+        for n in result:
+            results.append(n)
+    assert sorted(results) == [0, 0.05]
+    assert time.time() - start < 1.5
+
+
+def test_parallel_map_cancel(fx_backend):
+    started = []
+
+    def fn(n):
+        started.append(n)
+        time.sleep(0.05)
+        return n
+
+    result = parallel_map(2, fn, range(20))
+    for n in result:
+        result.cancel()
+    time.sleep(0.2)
+    assert len(started) < 20
+    assert list(result) == []
+
+
+def test_shared_executor(fx_backend):
+    threads = set()
+    lock = threading.Lock()
+    state = {'running': 0, 'max_running': 0}
+
+    def fn(n):
+        threads.add(threading.current_thread())
+        with lock:
+            state['running'] += 1
+            state['max_running'] = max(state['max_running'],
+                                       state['running'])
+        time.sleep(0.01)
+        with lock:
+            state['running'] -= 1
+        return n * 2
+
+    with SharedExecutor(8) as executor:
+        assert not executor.started
+        for _ in range(3):
+            result = parallel_map(2, fn, range(10), executor=executor)
+            assert sorted(result) == [n * 2 for n in range(10)]
+        assert executor.started
+        assert len(threads) <= 8
+        assert state['max_running'] <= 2
+        result = parallel_map(4, lambda n: 1 // n, [1, 0], executor=executor)
+        with raises(ZeroDivisionError):
+            list(result)
+    with raises(RuntimeError):
+        executor.submit(fn, 1)
+    with raises(ValueError):
+        SharedExecutor(0)
+    with raises(TypeError):
+        parallel_map(2, fn, [1], executor=object())
+
+
+def multiply(n, m=2):
+    if n == 0:
+        raise ValueError(n)
+    return n * m
+
+
+def test_process_map():
+    result = process_map(2, multiply, range(1, 20))
+    assert sorted(result) == [n * 2 for n in range(1, 20)]
+    result = process_map(2, multiply, range(1, 20), range(20), ordered=True,
+                         chunksize=4)
+    assert list(result) == [n * m for n, m in zip(range(1, 20), range(20))]
+    result = process_map(2, multiply, [1, 0, 2], ordered=True)
+    iterator = iter(result)
+    assert next(iterator) == 2
+    assert next(iterator) == 4
+    with raises(ValueError):
+        next(iterator)
+    with raises(TypeError):
+        process_map(2, lambda n: n, [1])
+    with raises(ValueError):
+        process_map(2, multiply, [1], chunksize=0)
@@ -3,7 +3,17 @@ try:
     import httplib
 except ImportError:
     from http import client as httplib
+try:
+    import BaseHTTPServer
+except ImportError:
+    from http import server as BaseHTTPServer
 import io
+import multiprocessing
+try:
+    import SocketServer
+except ImportError:
+    import socketserver as SocketServer
+import threading
 try:
     import urllib2
 except ImportError:
@@ -11,7 +21,9 @@ except ImportError:
 
 from pytest import fixture
 
+from libearth import crawler
 from libearth.compat import IRON_PYTHON, text_type
+from libearth.connection import RedirectHandler
 from libearth.session import RevisionSet
 
 
@@ -53,9 +65,15 @@ class TestHTTPHandler(urllib2.HTTPHandler):
     def http_open(self, req):
         url = req.get_full_url()
         try:
-            status_code, mimetype, content = MOCK_URLS[url]
+            mock = MOCK_URLS[url]
         except KeyError:
             return urllib2.HTTPHandler.http_open(self, req)
+        if callable(mock):
+            mock = mock(req)
+        status_code, mimetype, content = mock[:3]
+        headers = {'content-type': mimetype}
+        if len(mock) > 3:
+            headers.update((k.lower(), v) for k, v in mock[3].items())
         if IRON_PYTHON:
             from StringIO import StringIO
             buffer_ = StringIO(content)
@@ -63,7 +81,7 @@ class TestHTTPHandler(urllib2.HTTPHandler):
             buffer_ = io.StringIO(content)
         else:
             buffer_ = io.BytesIO(content)
-        resp = urllib2.addinfourl(buffer_, {'content-type': mimetype}, url)
+        resp = urllib2.addinfourl(buffer_, headers, url)
         resp.code = status_code
         resp.msg = httplib.responses[status_code]
         return resp
@@ -74,6 +92,95 @@ def fx_opener(request):
     request.addfinalizer(
         functools.partial(setattr, urllib2, '_opener', urllib2._opener)
     )
-    opener = urllib2.build_opener(TestHTTPHandler)
+    request.addfinalizer(
+        functools.partial(setattr, crawler, 'OPENER', crawler.OPENER)
+    )
+    opener = urllib2.build_opener(TestHTTPHandler, RedirectHandler)
     urllib2.install_opener(opener)
+    crawler.OPENER = opener
     return opener
+
+
+class MockHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Local HTTP server which serves :data:`routes` (path to the same
+    tuples to :data:`MOCK_URLS`).
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           MockHTTPRequestHandler)
+        self.routes = {}
+        self.connections = 0
+        self.requests = []
+
+    def url(self, path):
+        return 'http://127.0.0.1:{0}{1}'.format(self.server_port, path)
+
+
+class MockHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self, body=True):
+        self.server.requests.append((self.command, self.path, self.headers))
+        try:
+            mock = self.server.routes[self.path]
+        except KeyError:
+            mock = 404, 'text/plain', b'not found'
+        if callable(mock):
+            mock = mock(self)
+            if mock is None:  # the callable already responded by itself
+                return
+        status_code, mimetype, content = mock[:3]
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', mimetype)
+        self.send_header('Content-Length', str(len(content)))
+        if len(mock) > 3:
+            for name, value in mock[3].items():
+                self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(content)
+
+    def do_GET(self):
+        self.respond()
+
+    def do_HEAD(self):
+        self.respond(body=False)
+
+
+@fixture
+def fx_http_server(request):
+    server = MockHTTPServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    def shutdown():
+        server.shutdown()
+        server.server_close()
+    request.addfinalizer(shutdown)
+    return server
+
+
+@fixture
+def fx_parse_pool(request):
+    pool = multiprocessing.Pool(2)
+
+    def terminate():
+        pool.close()
+        pool.join()
+    request.addfinalizer(terminate)
+    return pool
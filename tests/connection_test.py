@@ -0,0 +1,155 @@
+import threading
+import time
+
+try:
+    import urllib.request as urllib2
+except ImportError:
+    import urllib2
+
+from pytest import raises
+
+from libearth.connection import ConnectionPool
+from libearth.crawler import get_feed
+from .crawler_test import atom_xml, favicon_test_atom_xml
+
+
+def test_connection_pool_reuse(fx_http_server):
+    fx_http_server.routes['/atom.xml'] = 200, 'application/atom+xml', atom_xml
+    pool = ConnectionPool()
+    for _ in range(5):
+        f = pool.open(fx_http_server.url('/atom.xml'))
+        assert f.getcode() == 200
+        assert f.info()['content-type'] == 'application/atom+xml'
+        assert f.read() == atom_xml
+        f.close()
+    assert fx_http_server.connections == 1
+    stats = pool.stats()
+    assert stats.requests == 5
+    assert stats.created == 1
+    assert stats.reused == 4
+    assert stats.idle == 1
+    assert stats.active == 0
+    pool.close()
+    assert pool.stats().idle == 0
+
+
+def test_connection_pool_drain(fx_http_server):
+    fx_http_server.routes['/atom.xml'] = 200, 'application/atom+xml', atom_xml
+    pool = ConnectionPool()
+    f = pool.open(fx_http_server.url('/atom.xml'))
+    f.read(10)
+    f.close()
+    f = pool.open(fx_http_server.url('/atom.xml'))
+    assert f.read() == atom_xml
+    f.close()
+    assert fx_http_server.connections == 1
+
+
+def test_connection_pool_http_error(fx_http_server):
+    pool = ConnectionPool()
+    with raises(urllib2.HTTPError):
+        try:
+            pool.open(fx_http_server.url('/not-found'))
+        except urllib2.HTTPError as e:
+            assert e.code == 404
+            e.close()
+            raise
+    assert pool.stats().active == 0
+    assert pool.stats().idle == 1
+
+
+def test_connection_pool_max_idle(fx_http_server):
+    fx_http_server.routes['/a'] = 200, 'text/plain', b'a'
+    pool = ConnectionPool(max_idle=1)
+    a = pool.open(fx_http_server.url('/a'))
+    b = pool.open(fx_http_server.url('/a'))
+    assert pool.stats().active == 2
+    a.read()
+    a.close()
+    b.read()
+    b.close()
+    stats = pool.stats()
+    assert stats.idle == 1
+    assert stats.discarded == 1
+
+
+def test_connection_pool_max_per_host(fx_http_server):
+    fx_http_server.routes['/a'] = 200, 'text/plain', b'a'
+    pool = ConnectionPool(max_per_host=1)
+    first = pool.open(fx_http_server.url('/a'))
+    opened = []
+
+    def open_second():
+        f = pool.open(fx_http_server.url('/a'))
+        opened.append(f.read())
+        f.close()
+    thread = threading.Thread(target=open_second)
+    thread.start()
+    time.sleep(0.2)
+    assert not opened
+    first.read()
+    first.close()
+    thread.join(5)
+    assert opened == [b'a']
+    assert fx_http_server.connections == 1
+
+
+def test_connection_pool_server_closed(fx_http_server):
+    fx_http_server.routes['/a'] = 200, 'text/plain', b'a'
+    pool = ConnectionPool()
+    f = pool.open(fx_http_server.url('/a'))
+    f.read()
+    f.close()
+    # Kill the kept-alive connection behind the pool's back
+    for connections in pool.idle.values():
+        for connection, _ in connections:
+            connection.sock.close()
+    f = pool.open(fx_http_server.url('/a'))
+    assert f.read() == b'a'
+    f.close()
+
+
+def test_connection_pool_server_closed_all(fx_http_server):
+    def hang_up(handler):
+        # Respond, and then close the connection without telling the client
+        handler.close_connection = True
+        return 200, 'text/plain', b'a'
+    fx_http_server.routes['/a'] = hang_up
+    pool = ConnectionPool()
+    a = pool.open(fx_http_server.url('/a'))
+    b = pool.open(fx_http_server.url('/a'))
+    for f in a, b:
+        f.read()
+        f.close()
+    assert pool.stats().idle == 2
+    time.sleep(0.1)
+    f = pool.open(fx_http_server.url('/a'))
+    assert f.read() == b'a'
+    f.close()
+    stats = pool.stats()
+    assert stats.reused == 1
+    assert stats.created == 3
+    assert stats.active == 0
+
+
+def test_connection_pool_value_error():
+    with raises(ValueError):
+        ConnectionPool(max_idle=-1)
+    with raises(ValueError):
+        ConnectionPool(max_per_host=0)
+
+
+def test_get_feed_connection_pool(fx_http_server):
+    routes = fx_http_server.routes
+    routes['/favicon.xml'] = 200, 'application/atom+xml', \
+        favicon_test_atom_xml.replace(b'http://favicontest.com/',
+                                      fx_http_server.url('/').encode())
+    routes['/'] = 200, 'text/html', b'<html><head></head></html>'
+    routes['/favicon.ico'] = 200, 'image/x-icon', b'ico'
+    pool = ConnectionPool()
+    result = get_feed(fx_http_server.url('/favicon.xml'),
+                      connection_pool=pool)
+    assert result.icon_url == fx_http_server.url('/favicon.ico')
+    assert len(fx_http_server.requests) == 3
+    assert fx_http_server.connections == 1
+    assert pool.stats().reused == 2
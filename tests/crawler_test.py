@@ -1,12 +1,38 @@
+import gzip
+import io
 import os.path
+import pickle
+import socket
 import time
+try:
+    import urllib.request as urllib2
+except ImportError:
+    import urllib2
+import zlib
 
 from pytest import mark, raises
 
-from libearth.crawler import CrawlError, CrawlResult, crawl, get_feed
+from libearth.compat.parallel import SharedExecutor
+from libearth.connection import ConnectionPool
+from libearth.crawler import (CLIENT_FAILURE, DNS_FAILURE, NETWORK_FAILURE,
+                              OVERSIZE_TRUNCATE, PARSE_FAILURE,
+                              SERVER_FAILURE, SIZE_FAILURE,
+                              THROTTLED_FAILURE, TIMEOUT_FAILURE,
+                              ContentDecoder, CrawlError, CrawlMetrics,
+                              CrawlResult, DecodedResponse, IconCache,
+                              MemoryValidatorStore, RepositoryValidatorStore,
+                              Validators, classify_error, crawl,
+                              crawl_into_stage, get_feed, parse_feed,
+                              parse_feed_serialized, truncate_feed)
 from libearth.feed import Feed, Link, Text
-from libearth.subscribe import Category, SubscriptionList
+from libearth.politeness import HostThrottledError
+from libearth.repository import FileSystemRepository
+from libearth.schema import read
+from libearth.session import Session
+from libearth.stage import Stage
+from libearth.subscribe import Category, Subscription, SubscriptionList
 from .conftest import MOCK_URLS
+from .stage_test import MemoryRepository
 
 
 atom_xml = b"""
@@ -184,7 +210,17 @@ broken_rss = b"""
 """
 
 
+def conditional_atom(req):
+    if req.get_header('If-none-match') == '"atom-v1"':
+        return 304, 'application/atom+xml', b''
+    return 200, 'application/atom+xml', atom_xml, {
+        'ETag': '"atom-v1"',
+        'Last-Modified': 'Mon, 19 Aug 2013 00:49:20 GMT'
+    }
+
+
 MOCK_URLS.update({
+    'http://conditional.com/atom.xml': conditional_atom,
     'http://vio.atomtest.com/feed/atom': (200, 'application/atom+xml',
                                           atom_xml),
     'http://reversedentries.com/feed/atom': (200, 'application/atom+xml',
@@ -262,6 +298,68 @@ def test_get_feed_timeout(fx_opener):
     assert time.time() - start < 2
 
 
+class CountingStage(Stage):
+
+    commits = 0
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.commits += 1
+        return Stage.__exit__(self, exc_type, exc_val, exc_tb)
+
+
+def test_crawl_into_stage(fx_opener):
+    stage = CountingStage(Session('SESSID'), MemoryRepository())
+    subscriptions = SubscriptionList()
+    urls = ['http://rsstest.com/rss.xml', 'http://vio.atomtest.com/feed/atom']
+    for i, url in enumerate(urls):
+        subscriptions.add(Subscription(label=url, feed_uri=url,
+                                       feed_id='feed{0}'.format(i)))
+    category = Category(label='Category')
+    category.add(Subscription(label='atom', feed_uri=urls[1],
+                              feed_id='feed1'))
+    subscriptions.add(category)
+    store = MemoryValidatorStore()
+    results = list(crawl_into_stage(stage, subscriptions, 2, batch_size=1,
+                                    validator_store=store))
+    assert sorted(r.url for r in results) == urls
+    assert stage.commits == 2
+    with stage:
+        assert stage.feeds['feed0'].title.value == 'Vio Blog'
+        assert stage.feeds['feed1'].title.value == 'Atom Test'
+    # Unchanged feeds aren't merged
+    stage.commits = 0
+    results = list(crawl_into_stage(stage, subscriptions, 2,
+                                    validator_store=store))
+    assert all(r.unchanged for r in results)
+    assert stage.commits == 0
+    # Other feeds are merged before the error is raised
+    subscriptions.add(Subscription(label='broken',
+                                   feed_uri='http://brokenrss.com/rss',
+                                   feed_id='broken'))
+    stage = CountingStage(Session('SESSID'), MemoryRepository())
+    results = []
+    with raises(CrawlError):
+        for result in crawl_into_stage(stage, subscriptions, 2,
+                                       queue_size=1):
+            results.append(result.url)
+    assert sorted(results) == urls
+    with stage:
+        assert stage.feeds['feed1'].title.value == 'Atom Test'
+    with raises(TypeError):
+        crawl_into_stage(object(), subscriptions, 2)
+    with raises(ValueError):
+        crawl_into_stage(stage, subscriptions, 2, batch_size=0)
+
+
+def test_crawl_executor(fx_opener):
+    feeds = ['http://vio.atomtest.com/feed/atom',
+             'http://rsstest.com/rss.xml']
+    with SharedExecutor(4) as executor:
+        for _ in range(2):
+            results = crawl(feeds, 2, resolve_icon=False, executor=executor)
+            assert sorted(r.url for r in results) == sorted(feeds)
+
+
 def test_crawl_error(fx_opener):
     # broken feed
     feeds = ['http://brokenrss.com/rss']
@@ -281,6 +379,34 @@ def test_crawl_error(fx_opener):
         except CrawlError as e:
             assert e.feed_uri == feeds[0]
             raise
+    # results of other feeds are yielded before the error
+    feeds = ['http://brokenrss.com/rss', 'http://vio.atomtest.com/feed/atom']
+    for pool_size in 1, 2:
+        results = []
+        with raises(CrawlError):
+            for result in crawl(feeds, pool_size):
+                results.append(result.url)
+        assert results == feeds[1:]
+
+
+def test_crawl_serially_streams(fx_opener):
+    feeds = ['http://rsstest.com/rss.xml', 'http://vio.atomtest.com/feed/atom']
+    originals = dict((url, MOCK_URLS[url]) for url in feeds)
+    fetched = []
+
+    def fetch(request):
+        fetched.append(request.get_full_url())
+        return originals[request.get_full_url()]
+    MOCK_URLS.update(dict.fromkeys(feeds, fetch))
+    try:
+        generator = crawl(feeds, 1)
+        assert not fetched
+        assert next(generator).url == feeds[0]
+        assert fetched == feeds[:1]
+        assert [r.url for r in generator] == feeds[1:]
+        assert fetched == feeds
+    finally:
+        MOCK_URLS.update(originals)
 
 
 @mark.parametrize('subs', [
@@ -311,3 +437,434 @@ def test_add_as_subscription(subs):
     assert sub.feed_uri == result.url
     assert sub.label == feed.title.value
     assert sub.icon_uri == result.icon_url
+
+
+@mark.parametrize('store_type', ['memory', 'repository'])
+def test_get_feed_conditional(fx_opener, store_type, tmpdir):
+    url = 'http://conditional.com/atom.xml'
+    if store_type == 'memory':
+        store = MemoryValidatorStore()
+    else:
+        store = RepositoryValidatorStore(FileSystemRepository(str(tmpdir)))
+    assert store.get(url) is None
+    result = get_feed(url, validator_store=store)
+    assert not result.not_modified
+    assert result.feed.title.value == 'Atom Test'
+    validators = store.get(url)
+    assert isinstance(validators, Validators)
+    assert validators.url == url
+    assert validators.etag == '"atom-v1"'
+    assert validators.last_modified == 'Mon, 19 Aug 2013 00:49:20 GMT'
+    result = get_feed(url, validator_store=store)
+    assert result.not_modified
+    assert result.unchanged
+    assert result.url == url
+    assert result.feed is None
+    assert result.hints is None
+    # without validators it's an unconditional request
+    assert not get_feed(url).not_modified
+
+
+def test_repository_validator_store_survives(fx_opener, tmpdir):
+    url = 'http://conditional.com/atom.xml'
+    store = RepositoryValidatorStore(FileSystemRepository(str(tmpdir)))
+    get_feed(url, validator_store=store)
+    store = RepositoryValidatorStore(FileSystemRepository(str(tmpdir)))
+    assert store.get(url).etag == '"atom-v1"'
+    assert store.get('http://conditional.com/other.xml') is None
+
+
+def test_crawl_conditional(fx_opener):
+    store = MemoryValidatorStore()
+    feeds = ['http://conditional.com/atom.xml', 'http://rsstest.com/rss.xml']
+    results = list(crawl(feeds, 2, validator_store=store))
+    assert not any(r.not_modified for r in results)
+    results = dict((r.url, r) for r in crawl(feeds, 2, validator_store=store))
+    assert results['http://conditional.com/atom.xml'].not_modified
+    assert not results['http://rsstest.com/rss.xml'].not_modified
+
+
+def test_add_not_modified_as_subscription():
+    result = CrawlResult('http://example.com/atom.xml', None, None,
+                         not_modified=True)
+    with raises(ValueError):
+        result.add_as_subscription(SubscriptionList())
+
+
+def test_icon_cache():
+    cache = IconCache(negative_ttl=0)
+    with raises(KeyError):
+        cache.get('http://example.com/')
+    cache.set('http://example.com/blog/', 'http://example.com/icon.png')
+    assert cache.get('HTTP://Example.com/other/') == \
+        'http://example.com/icon.png'
+    with raises(KeyError):
+        cache.get('https://example.com/')
+    with raises(KeyError):
+        cache.get('http://example.com:8080/')
+    cache.set('http://noicon.com/', None)
+    with raises(KeyError):  # negative entries expired immediately
+        cache.get('http://noicon.com/')
+    cache = IconCache()
+    cache.set('http://noicon.com/', None)
+    assert cache.get('http://noicon.com/') is None
+
+
+def test_get_feed_icon_cache(fx_http_server):
+    routes = fx_http_server.routes
+    feed_xml = favicon_test_atom_xml.replace(
+        b'http://favicontest.com/',
+        fx_http_server.url('/').encode()
+    )
+    routes['/a.xml'] = routes['/b.xml'] = 200, 'application/atom+xml', feed_xml
+    routes['/'] = 200, 'text/html', b'<html><head></head></html>'
+    routes['/favicon.ico'] = 200, 'image/x-icon', b'ico'
+    cache = IconCache()
+    result = get_feed(fx_http_server.url('/a.xml'), icon_cache=cache)
+    assert result.icon_url == fx_http_server.url('/favicon.ico')
+    assert len(fx_http_server.requests) == 3
+    result = get_feed(fx_http_server.url('/b.xml'), icon_cache=cache)
+    assert result.icon_url == fx_http_server.url('/favicon.ico')
+    assert [r[1] for r in fx_http_server.requests[3:]] == ['/b.xml']
+    # negative caching
+    del routes['/favicon.ico']
+    cache = IconCache()
+    del fx_http_server.requests[:]
+    assert get_feed(fx_http_server.url('/a.xml'),
+                    icon_cache=cache).icon_url is None
+    assert len(fx_http_server.requests) == 3
+    assert get_feed(fx_http_server.url('/b.xml'),
+                    icon_cache=cache).icon_url is None
+    assert len(fx_http_server.requests) == 4
+
+
+def test_get_feed_without_resolving_icon(fx_http_server):
+    routes = fx_http_server.routes
+    routes['/a.xml'] = 200, 'application/atom+xml', \
+        favicon_test_atom_xml.replace(b'http://favicontest.com/',
+                                      fx_http_server.url('/').encode())
+    result = get_feed(fx_http_server.url('/a.xml'), resolve_icon=False)
+    assert result.feed.title.value == 'Favicon Test'
+    assert result.icon_url is None
+    assert [r[1] for r in fx_http_server.requests] == ['/a.xml']
+    cache = IconCache()
+    cache.set(fx_http_server.url('/'), fx_http_server.url('/icon.png'))
+    result = get_feed(fx_http_server.url('/a.xml'), icon_cache=cache,
+                      resolve_icon=False)
+    assert result.icon_url == fx_http_server.url('/icon.png')
+    assert len(fx_http_server.requests) == 2
+
+
+def gzip_compress(data):
+    buffer_ = io.BytesIO()
+    f = gzip.GzipFile(fileobj=buffer_, mode='wb')
+    f.write(data)
+    f.close()
+    return buffer_.getvalue()
+
+
+def raw_deflate_compress(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+@mark.parametrize(('encoding', 'compress'), [
+    ('gzip', gzip_compress),
+    ('deflate', zlib.compress),
+    ('deflate', raw_deflate_compress),
+    ('identity', lambda data: data),
+])
+def test_content_decoder(encoding, compress):
+    encoded = compress(atom_xml)
+    decoder = ContentDecoder(encoding)
+    decoded = b''.join(decoder.decode(encoded[i:i + 7])
+                       for i in range(0, len(encoded), 7))
+    assert decoded + decoder.flush() == atom_xml
+
+
+def test_content_decoder_unsupported():
+    with raises(ValueError):
+        ContentDecoder('br')
+
+
+def test_decoded_response():
+    class MockResponse(io.BytesIO):
+        def info(self):
+            return {'content-encoding': 'gzip'}
+    encoded = gzip_compress(atom_xml)
+    f = DecodedResponse(MockResponse(encoded), chunk_size=10)
+    assert f.read(5) == atom_xml[:5]
+    assert f.read(100) == atom_xml[5:105]
+    assert f.read() == atom_xml[105:]
+    assert f.read() == b''
+    assert f.wire_bytes == len(encoded)
+    assert f.decoded_bytes == len(atom_xml)
+
+
+def test_decoded_response_bomb():
+    class MockResponse(io.BytesIO):
+        def info(self):
+            return {'content-encoding': 'gzip'}
+    size = 16 * 1024 * 1024
+    encoded = gzip_compress(b'\0' * size)
+    assert len(encoded) < 64 * 1024
+    f = DecodedResponse(MockResponse(encoded), chunk_size=len(encoded))
+    assert f.read(1025) == b'\0' * 1025
+    # The rest of the compressed chunk isn't decoded until it's read
+    assert f.decoder.pending
+    assert not f.buffered
+    assert len(f.read(1024)) == 1024
+    assert len(f.read()) == size - 2049
+    assert f.decoded_bytes == size
+
+
+def test_get_feed_compressed(fx_http_server):
+    encoded = gzip_compress(atom_xml)
+    fx_http_server.routes['/atom.xml'] = 200, 'application/atom+xml', \
+        encoded, {'Content-Encoding': 'gzip'}
+    result = get_feed(fx_http_server.url('/atom.xml'))
+    assert result.feed.title.value == 'Atom Test'
+    assert result.wire_bytes == len(encoded)
+    assert result.decoded_bytes == len(atom_xml)
+    headers = fx_http_server.requests[0][2]
+    assert headers['Accept-Encoding'] == 'gzip, deflate'
+
+
+def test_get_feed_unchanged(fx_http_server, tmpdir):
+    fx_http_server.routes['/atom.xml'] = 200, 'application/atom+xml', atom_xml
+    url = fx_http_server.url('/atom.xml')
+    store = RepositoryValidatorStore(FileSystemRepository(str(tmpdir)))
+    result = get_feed(url, validator_store=store)
+    assert not result.unchanged
+    assert result.feed.title.value == 'Atom Test'
+    assert store.get(url).digest
+    assert store.get(url).etag is None
+    result = get_feed(url, validator_store=store)
+    assert result.unchanged
+    assert not result.not_modified
+    assert result.feed is None
+    assert result.decoded_bytes == len(atom_xml)
+    with raises(ValueError):
+        result.add_as_subscription(SubscriptionList())
+    fx_http_server.routes['/atom.xml'] = \
+        200, 'application/atom+xml', atom_xml.replace(b'Atom Test', b'Changed')
+    result = get_feed(url, validator_store=store)
+    assert not result.unchanged
+    assert result.feed.title.value == 'Changed'
+    # without validator store it's always parsed
+    assert not get_feed(url).unchanged
+
+
+def test_crawl_metrics():
+    metrics = CrawlMetrics('http://example.com/')
+    with metrics.measure('download') as phase:
+        phase.size = 123
+    with raises(ValueError):
+        with metrics.measure('parse', 456):
+            raise ValueError()
+    assert [p.name for p in metrics.phases] == ['download', 'parse']
+    assert [p.size for p in metrics.phases] == [123, 456]
+    assert metrics.get('download') >= 0
+    assert metrics.get('favicon') is None
+    assert metrics.seconds == sum(p.seconds for p in metrics.phases)
+
+
+def test_get_feed_metrics(fx_http_server):
+    routes = fx_http_server.routes
+    routes['/old.xml'] = 301, 'text/plain', b'', {'Location': '/new.xml'}
+    routes['/new.xml'] = 302, 'text/plain', b'', {'Location': '/atom.xml'}
+    routes['/atom.xml'] = 200, 'application/atom+xml', atom_xml
+    result = get_feed(fx_http_server.url('/old.xml'), resolve_icon=False)
+    metrics = result.metrics
+    assert metrics.url == fx_http_server.url('/old.xml')
+    assert metrics.status == 200
+    assert metrics.redirects == [fx_http_server.url('/new.xml'),
+                                 fx_http_server.url('/atom.xml')]
+    assert [p.name for p in metrics.phases] == [
+        'request', 'download', 'detect', 'parse', 'sort'
+    ]
+    assert metrics.phases[1].size == len(atom_xml)
+    assert metrics.phases[-1].size == len(result.feed.entries)
+    assert all(p.seconds >= 0 for p in metrics.phases)
+    result = get_feed(fx_http_server.url('/atom.xml'), resolve_icon=False)
+    assert result.metrics.redirects == []
+    with raises(CrawlError) as e:
+        get_feed(fx_http_server.url('/not-found'))
+    assert e.value.metrics.status == 404
+    assert [p.name for p in e.value.metrics.phases] == ['request']
+
+
+def test_get_feed_permanent_redirect(fx_http_server):
+    routes = fx_http_server.routes
+    routes['/old.xml'] = 308, 'text/plain', b'', {'Location': '/new.xml'}
+    routes['/new.xml'] = 301, 'text/plain', b'', {'Location': '/newer.xml'}
+    routes['/newer.xml'] = 302, 'text/plain', b'', {'Location': '/atom.xml'}
+    routes['/atom.xml'] = 200, 'application/atom+xml', atom_xml
+    old_url = fx_http_server.url('/old.xml')
+    result = get_feed(old_url, resolve_icon=False,
+                      connection_pool=ConnectionPool())
+    assert result.url == old_url
+    assert result.final_url == fx_http_server.url('/atom.xml')
+    assert result.permanent_url == fx_http_server.url('/newer.xml')
+    assert result.permanent_redirect
+    subscriptions = SubscriptionList()
+    subscriptions.add(Subscription(label='Atom Test', feed_uri=old_url,
+                                   feed_id='atom'))
+    assert result.relocate_subscription(subscriptions) == 1
+    subscription, = subscriptions
+    assert subscription.feed_uri == fx_http_server.url('/newer.xml')
+    assert subscription.feed_id == 'atom'
+    # Temporary redirects
+    result = get_feed(fx_http_server.url('/newer.xml'), resolve_icon=False,
+                      connection_pool=ConnectionPool())
+    assert result.final_url == fx_http_server.url('/atom.xml')
+    assert result.permanent_url is None
+    assert not result.permanent_redirect
+    assert result.relocate_subscription(subscriptions) == 0
+    # Not redirected
+    result = get_feed(fx_http_server.url('/atom.xml'), resolve_icon=False,
+                      connection_pool=ConnectionPool())
+    assert result.final_url == result.url
+    assert result.permanent_url is None
+    # Without a pool
+    result = get_feed(old_url, resolve_icon=False)
+    assert result.final_url == fx_http_server.url('/atom.xml')
+    assert result.permanent_url == fx_http_server.url('/newer.xml')
+    result = get_feed(fx_http_server.url('/new.xml'), resolve_icon=False)
+    assert result.permanent_url == fx_http_server.url('/newer.xml')
+    result = get_feed(fx_http_server.url('/newer.xml'), resolve_icon=False)
+    assert result.permanent_url is None
+
+
+def test_parse_feed_serialized():
+    serialized, hints, phases = parse_feed_serialized(
+        'http://vio.atomtest.com/feed/atom', atom_xml
+    )
+    assert isinstance(serialized, bytes)
+    assert hints is None
+    assert [p.name for p in phases] == ['detect', 'parse', 'sort', 'serialize']
+    feed = read(Feed, [serialized])
+    assert feed.title.value == 'Atom Test'
+    assert [e.title.value for e in feed.entries] == [
+        'xml base test', 'Title One'
+    ]
+    with raises(CrawlError):
+        parse_feed_serialized('http://example.com/', b'<unknown />')
+
+
+def test_crawl_parse_pool(fx_opener, fx_parse_pool):
+    feeds = ['http://vio.atomtest.com/feed/atom',
+             'http://rsstest.com/rss.xml']
+    results = dict((result.url, result)
+                   for result in crawl(feeds, 2, parse_pool=fx_parse_pool))
+    atom = results['http://vio.atomtest.com/feed/atom']
+    assert atom.feed.title.value == 'Atom Test'
+    assert atom.feed.entries[0].title.value == 'xml base test'
+    assert atom.icon_url == 'http://vio.atomtest.com/favicon.ico'
+    assert 'dispatch' in [p.name for p in atom.metrics.phases]
+    rss = results['http://rsstest.com/rss.xml']
+    assert rss.feed.title.value == 'Vio Blog'
+    assert rss.hints == get_feed('http://rsstest.com/rss.xml').hints
+
+
+def test_classify_error():
+    def http_error(code):
+        return urllib2.HTTPError('http://a.com/', code, 'error', {}, None)
+    assert classify_error(http_error(404)) == CLIENT_FAILURE
+    assert classify_error(http_error(429)) == SERVER_FAILURE
+    assert classify_error(http_error(503)) == SERVER_FAILURE
+    assert classify_error(IOError('HTTP Error'), 410) == CLIENT_FAILURE
+    assert classify_error(socket.timeout()) == TIMEOUT_FAILURE
+    assert classify_error(urllib2.URLError(socket.timeout())) == \
+        TIMEOUT_FAILURE
+    assert classify_error(urllib2.URLError(socket.gaierror())) == DNS_FAILURE
+    assert classify_error(urllib2.URLError('refused')) == NETWORK_FAILURE
+    assert classify_error(socket.error()) == NETWORK_FAILURE
+    assert classify_error(zlib.error()) == NETWORK_FAILURE
+    assert classify_error(HostThrottledError('a.com', 60)) == THROTTLED_FAILURE
+    assert classify_error(ValueError()) == PARSE_FAILURE
+    assert classify_error(CrawlError('http://a.com/', kind='x')) == 'x'
+
+
+def test_crawl_error_pickle():
+    error = pickle.loads(pickle.dumps(
+        CrawlError('http://a.com/', 'failed', kind=CLIENT_FAILURE)
+    ))
+    assert error.feed_uri == 'http://a.com/'
+    assert error.kind == CLIENT_FAILURE
+    assert str(error) == 'failed'
+
+
+def test_get_feed_error_kind(fx_http_server):
+    fx_http_server.routes['/broken.xml'] = 200, 'text/xml', b'<broken'
+    fx_http_server.routes['/unknown.xml'] = 200, 'text/xml', b'<unknown />'
+    fx_http_server.routes['/corrupt.xml'] = 200, 'text/xml', \
+        gzip_compress(atom_xml)[:10] + b'\xff' * 32, \
+        {'Content-Encoding': 'gzip'}
+    for path, kind in [('/not-found', CLIENT_FAILURE),
+                       ('/corrupt.xml', NETWORK_FAILURE),
+                       ('/broken.xml', PARSE_FAILURE),
+                       ('/unknown.xml', PARSE_FAILURE)]:
+        with raises(CrawlError) as e:
+            get_feed(fx_http_server.url(path))
+        assert e.value.kind == kind
+
+
+def test_truncate_feed():
+    second_entry = atom_xml.index(b'<entry>')
+    truncated = truncate_feed(atom_xml[:second_entry + 30])
+    assert truncated.endswith(b'</entry></feed>')
+    feed, _ = parse_feed('http://vio.atomtest.com/feed/atom', truncated)
+    assert [e.title.value for e in feed.entries] == ['xml base test']
+    assert truncate_feed(atom_xml[:atom_xml.index(b'<entry')]) is None
+    rss = (b'<rss version="2.0"><channel><title>T</title>'
+           b'<item><title>1</title></item><item><title>2</ti')
+    assert truncate_feed(rss) == (b'<rss version="2.0"><channel>'
+                                  b'<title>T</title><item><title>1</title>'
+                                  b'</item></channel></rss>')
+    # '>' in attribute values of an empty entry tag
+    rss = (b'<rss version="2.0"><channel><item title="a>b"/>'
+           b'<item><title>2</ti')
+    assert truncate_feed(rss) == (b'<rss version="2.0"><channel>'
+                                  b'<item title="a>b"/></channel></rss>')
+    # Closing tags are encoded in the declared encoding
+    rss = (b'<?xml version="1.0" encoding="iso-8859-1"?>'
+           b'<rss><caf\xe9><item>1</item><item>2</it')
+    assert truncate_feed(rss) == (
+        b'<?xml version="1.0" encoding="iso-8859-1"?>'
+        b'<rss><caf\xe9><item>1</item></caf\xe9></rss>'
+    )
+
+
+def test_truncate_feed_utf16():
+    utf16_xml = atom_xml.decode('utf-8').encode('utf-16')
+    assert utf16_xml[:2] in (b'\xfe\xff', b'\xff\xfe')
+    assert truncate_feed(utf16_xml[:len(utf16_xml) - 30]) is None
+    assert truncate_feed(utf16_xml[2:len(utf16_xml) - 30]) is None
+
+
+def test_get_feed_max_size(fx_http_server):
+    fx_http_server.routes['/atom.xml'] = 200, 'application/atom+xml', atom_xml
+    url = fx_http_server.url('/atom.xml')
+    result = get_feed(url, max_size=len(atom_xml), resolve_icon=False)
+    assert not result.truncated
+    assert len(result.feed.entries) == 2
+    max_size = atom_xml.index(b'<entry>') + 30
+    with raises(CrawlError) as e:
+        get_feed(url, max_size=max_size)
+    assert e.value.kind == SIZE_FAILURE
+    result = get_feed(url, max_size=max_size, oversize=OVERSIZE_TRUNCATE)
+    assert result.truncated
+    assert [e.title.value for e in result.feed.entries] == ['xml base test']
+    with raises(CrawlError) as e:
+        get_feed(url, max_size=100, oversize=OVERSIZE_TRUNCATE)
+    assert e.value.kind == SIZE_FAILURE
+    with raises(ValueError):
+        get_feed(url, max_size=100, oversize='ignore')
+    # Rejected if it can't be truncated safely
+    fx_http_server.routes['/utf16.xml'] = \
+        200, 'application/atom+xml', atom_xml.decode('utf-8').encode('utf-16')
+    with raises(CrawlError) as e:
+        get_feed(fx_http_server.url('/utf16.xml'), max_size=max_size * 2,
+                 oversize=OVERSIZE_TRUNCATE)
+    assert e.value.kind == SIZE_FAILURE
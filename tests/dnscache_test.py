@@ -0,0 +1,84 @@
+import socket
+import time
+
+from pytest import fixture, raises
+
+from libearth.connection import ConnectionPool
+from libearth.dnscache import DNSCache
+from .crawler_test import atom_xml
+
+
+@fixture
+def fx_getaddrinfo(request, monkeypatch):
+    lookups = []
+    getaddrinfo = socket.getaddrinfo
+
+    def fake_getaddrinfo(host, port, *args):
+        lookups.append(host)
+        if host.endswith('.invalid'):
+            raise socket.gaierror(socket.EAI_NONAME, 'Name not known')
+        return getaddrinfo('127.0.0.1', port, *args)
+    monkeypatch.setattr(socket, 'getaddrinfo', fake_getaddrinfo)
+    return lookups
+
+
+def test_dns_cache(fx_getaddrinfo):
+    cache = DNSCache(ttl=0.2)
+    addresses = cache.getaddrinfo('example.com', 80)
+    assert addresses
+    assert cache.getaddrinfo('Example.com', 80) == addresses
+    assert fx_getaddrinfo == ['example.com']
+    stats = cache.stats()
+    assert stats.hits == 1
+    assert stats.misses == 1
+    assert stats.size == 1
+    time.sleep(0.2)
+    cache.getaddrinfo('example.com', 80)
+    assert fx_getaddrinfo == ['example.com'] * 2
+    assert cache.stats().misses == 2
+    cache.clear()
+    assert cache.stats().size == 0
+
+
+def test_dns_cache_negative(fx_getaddrinfo):
+    cache = DNSCache(negative_ttl=60)
+    for _ in range(3):
+        with raises(socket.gaierror):
+            cache.getaddrinfo('dead.invalid', 80)
+    assert fx_getaddrinfo == ['dead.invalid']
+    stats = cache.stats()
+    assert stats.misses == 1
+    assert stats.negative_hits == 2
+    cache = DNSCache(negative_ttl=0)
+    for _ in range(2):
+        with raises(socket.gaierror):
+            cache.getaddrinfo('dead.invalid', 80)
+    assert cache.stats().size == 0
+
+
+def test_dns_cache_max_size(fx_getaddrinfo):
+    cache = DNSCache(max_size=2)
+    for host in 'a.com', 'b.com', 'c.com':
+        cache.getaddrinfo(host, 80)
+    stats = cache.stats()
+    assert stats.size == 2
+    assert stats.evictions == 1
+    cache.getaddrinfo('c.com', 80)
+    cache.getaddrinfo('a.com', 80)
+    assert fx_getaddrinfo == ['a.com', 'b.com', 'c.com', 'a.com']
+    with raises(ValueError):
+        DNSCache(max_size=0)
+
+
+def test_connection_pool_dns_cache(fx_http_server, fx_getaddrinfo):
+    fx_http_server.routes['/atom.xml'] = 200, 'application/atom+xml', atom_xml
+    cache = DNSCache()
+    pool = ConnectionPool(max_idle=0, dns_cache=cache)
+    url = fx_http_server.url('/atom.xml').replace('127.0.0.1', 'feed.test')
+    for _ in range(3):
+        f = pool.open(url)
+        assert f.read() == atom_xml
+        f.close()
+    assert fx_http_server.connections == 3
+    assert fx_getaddrinfo == ['feed.test']
+    assert cache.stats().hits == 2
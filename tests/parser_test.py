@@ -13,6 +13,7 @@ except ImportError:
 
 from pytest import raises, mark
 
+from libearth import crawler
 from libearth.compat import UNICODE_BY_DEFAULT, text_type
 from libearth.feed import Feed
 from libearth.parser.atom import parse_atom
@@ -477,9 +478,9 @@ class TestHTTPHandler(urllib2.HTTPHandler):
         return mock_response(req)
 
 
-def test_rss_parser():
+def test_rss_parser(monkeypatch):
     my_opener = urllib2.build_opener(TestHTTPHandler)
-    urllib2.install_opener(my_opener)
+    monkeypatch.setattr(crawler, 'OPENER', my_opener)
     crawled_feed, data_for_crawl = parse_rss2(
         rss_xml,
         'http://sourcetest.com/rss.xml'
@@ -629,6 +630,31 @@ def test_rss_without_title():
             'only description')
 
 
+rss_with_crawler_hints = '''
+<rss version="2.0">
+  <channel>
+    <title>Hints Test</title>
+    <ttl>60</ttl>
+    <skipHours><hour>0</hour><hour>24</hour><hour>3</hour><hour>x</hour>
+    </skipHours>
+    <skipDays><day>Saturday</day><day>sunday</day><day>Caturday</day>
+    </skipDays>
+  </channel>
+</rss>
+'''
+
+
+def test_rss_crawler_hints():
+    _, crawler_hints = parse_rss2(rss_with_crawler_hints, None)
+    assert crawler_hints == {
+        'ttl': 60,
+        'skipHours': frozenset([0, 3]),
+        'skipDays': frozenset(['Saturday', 'Sunday'])
+    }
+    _, crawler_hints = parse_rss2(rss_without_title, None)
+    assert crawler_hints is None
+
+
 def test_normalize_xml_encoding():
     assert normalize_xml_encoding(b'''
         <?xml version="1.0" encoding="euc-kr" ?>
@@ -0,0 +1,138 @@
+import threading
+import time
+
+from pytest import raises
+
+from libearth.crawler import THROTTLED_FAILURE, CrawlError, crawl, get_feed
+from libearth.politeness import (HostLimiter, HostThrottledError, get_host,
+                                 interleave_by_host, parse_retry_after)
+from .crawler_test import atom_xml
+
+
+def test_get_host():
+    assert get_host('http://Example.com/feed') == 'example.com'
+    assert get_host('https://user@example.com:8080/') == 'example.com:8080'
+
+
+def test_interleave_by_host():
+    urls = ['http://a.com/1', 'http://a.com/2', 'http://a.com/3',
+            'http://b.com/1', 'http://c.com/1', 'http://b.com/2']
+    assert interleave_by_host(urls) == [
+        'http://a.com/1', 'http://b.com/1', 'http://c.com/1',
+        'http://a.com/2', 'http://b.com/2', 'http://a.com/3'
+    ]
+    assert interleave_by_host([]) == []
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after(' 0 ') == 0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after('Mon, 03 Nov 2014 12:02:00 GMT',
+                             now=1415016000) == 120
+
+
+def test_host_limiter_max_per_host():
+    limiter = HostLimiter(max_per_host=1, min_delay=0)
+    limiter.acquire('http://a.com/1')
+    limiter.acquire('http://b.com/1')  # other hosts are not blocked
+    acquired = []
+
+    def acquire():
+        limiter.acquire('http://a.com/2')
+        acquired.append(True)
+        limiter.release('http://a.com/2')
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    time.sleep(0.1)
+    assert not acquired
+    limiter.release('http://a.com/1')
+    thread.join(5)
+    assert acquired
+    limiter.release('http://b.com/1')
+
+
+def test_host_limiter_min_delay():
+    limiter = HostLimiter(max_per_host=4, min_delay=0.2)
+    start = time.time()
+    for _ in range(3):
+        limiter.acquire('http://a.com/')
+        limiter.release('http://a.com/')
+    assert time.time() - start >= 0.4
+    start = time.time()
+    limiter.acquire('http://b.com/')
+    assert time.time() - start < 0.2
+    limiter.release('http://b.com/')
+
+
+def test_host_limiter_feedback():
+    limiter = HostLimiter(min_delay=0, throttle_delay=30)
+    assert limiter.feedback('http://a.com/', 200, {}) is None
+    assert limiter.get_wait('http://a.com/') == 0
+    assert limiter.feedback('http://a.com/', 429, {'retry-after': '10'}) == 10
+    assert 9 < limiter.get_wait('http://a.com/x') <= 10
+    assert limiter.feedback('http://b.com/', 503, {}) == 30
+    assert 29 < limiter.get_wait('http://b.com/') <= 30
+    assert limiter.get_wait('http://c.com/') == 0
+    limiter = HostLimiter(max_retry_after=5)
+    limiter.feedback('http://a.com/', 429, {'retry-after': '86400'})
+    assert limiter.get_wait('http://a.com/') <= 5
+    with raises(ValueError):
+        HostLimiter(max_per_host=0)
+
+
+def test_get_feed_throttled(fx_http_server, fx_opener):
+    fx_http_server.routes['/atom.xml'] = 429, 'text/plain', b'', {
+        'Retry-After': '60'
+    }
+    limiter = HostLimiter(min_delay=0)
+    with raises(CrawlError):
+        get_feed(fx_http_server.url('/atom.xml'), host_limiter=limiter)
+    assert limiter.get_wait(fx_http_server.url('/')) > 50
+    assert not limiter.active
+
+
+def test_host_limiter_acquire_timeout():
+    limiter = HostLimiter(min_delay=0)
+    limiter.defer('http://a.com/', 600)
+    start = time.time()
+    with raises(HostThrottledError) as e:
+        limiter.acquire('http://a.com/1', timeout=10)
+    assert time.time() - start < 1
+    assert e.value.host == 'a.com'
+    assert e.value.wait > 590
+    assert not limiter.active
+    limiter.acquire('http://b.com/1', timeout=10)
+    limiter.release('http://b.com/1')
+
+
+def test_get_feed_throttled_long_retry_after(fx_http_server, fx_opener):
+    fx_http_server.routes['/atom.xml'] = 429, 'text/plain', b'', {
+        'Retry-After': '3600'
+    }
+    fx_http_server.routes['/other.xml'] = 200, 'application/atom+xml', atom_xml
+    limiter = HostLimiter(min_delay=0)
+    with raises(CrawlError):
+        get_feed(fx_http_server.url('/atom.xml'), host_limiter=limiter)
+    start = time.time()
+    with raises(CrawlError) as e:
+        get_feed(fx_http_server.url('/other.xml'), timeout=5,
+                 host_limiter=limiter)
+    assert time.time() - start < 1
+    assert e.value.kind == THROTTLED_FAILURE
+    assert len(fx_http_server.requests) == 1
+    assert not limiter.active
+
+
+def test_crawl_host_limiter(fx_http_server, fx_opener):
+    for i in range(4):
+        fx_http_server.routes['/{0}.xml'.format(i)] = \
+            200, 'application/atom+xml', atom_xml
+    limiter = HostLimiter(max_per_host=1, min_delay=0.1)
+    urls = [fx_http_server.url('/{0}.xml'.format(i)) for i in range(4)]
+    start = time.time()
+    results = list(crawl(urls, 4, host_limiter=limiter))
+    assert time.time() - start >= 0.3
+    assert sorted(r.url for r in results) == urls
+    assert not limiter.active
@@ -0,0 +1,134 @@
+import datetime
+
+from pytest import raises
+
+from libearth.crawler import (CLIENT_FAILURE, PARSE_FAILURE, SERVER_FAILURE,
+                              THROTTLED_FAILURE, TIMEOUT_FAILURE, CrawlError,
+                              crawl)
+from libearth.repository import FileSystemRepository
+from libearth.retry import Circuit, CircuitBreaker, RetryPolicy
+from libearth.tz import utc
+from .crawler_test import atom_xml
+
+
+NOW = datetime.datetime(2014, 11, 3, 12, 0, tzinfo=utc)
+
+
+def flaky(kinds):
+    calls = []
+
+    def function(url):
+        calls.append(url)
+        if len(calls) <= len(kinds):
+            raise CrawlError(url, 'failed', kind=kinds[len(calls) - 1])
+        return url
+    return function, calls
+
+
+def test_retry_policy_delay():
+    policy = RetryPolicy(base_delay=1, max_delay=5, jitter=0)
+    assert [policy.get_delay(i) for i in range(1, 6)] == [1, 2, 4, 5, 5]
+    policy = RetryPolicy(base_delay=4, jitter=0.5)
+    assert all(2 <= policy.get_delay(1) <= 4 for _ in range(20))
+    with raises(ValueError):
+        RetryPolicy(max_attempts=0)
+    with raises(ValueError):
+        RetryPolicy(jitter=2)
+
+
+def test_retry_policy_call():
+    policy = RetryPolicy(max_attempts=3, base_delay=0)
+    function, calls = flaky([TIMEOUT_FAILURE, SERVER_FAILURE])
+    assert policy.call(function, 'http://a.com/') == 'http://a.com/'
+    assert len(calls) == 3
+    function, calls = flaky([TIMEOUT_FAILURE] * 3)
+    with raises(CrawlError) as e:
+        policy.call(function, 'http://a.com/')
+    assert e.value.attempts == 3
+    assert len(calls) == 3
+    # Client errors, parse errors and throttled hosts are not retried
+    for kind in CLIENT_FAILURE, PARSE_FAILURE, THROTTLED_FAILURE:
+        function, calls = flaky([kind])
+        with raises(CrawlError) as e:
+            policy.call(function, 'http://a.com/')
+        assert e.value.attempts == 1
+        assert len(calls) == 1
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(threshold=2, probe_delay=60,
+                             max_probe_delay=200)
+    url = 'http://a.com/'
+    error = CrawlError(url, 'failed', kind=TIMEOUT_FAILURE)
+    circuit = breaker.record_failure(url, error, NOW)
+    assert isinstance(circuit, Circuit)
+    assert circuit.failures == 1
+    assert circuit.kind == TIMEOUT_FAILURE
+    assert circuit.next_probe is None
+    assert not breaker.is_open(url, NOW)
+    circuit = breaker.record_failure(url, error, NOW)
+    assert circuit.next_probe == NOW + datetime.timedelta(seconds=60)
+    assert breaker.is_open(url, NOW)
+    assert breaker.allowed([url, 'http://b.com/'], NOW) == ['http://b.com/']
+    later = NOW + datetime.timedelta(seconds=60)
+    assert not breaker.is_open(url, later)
+    circuit = breaker.record_failure(url, error, later)
+    assert circuit.next_probe == later + datetime.timedelta(seconds=120)
+    circuit = breaker.record_failure(url, error, later)
+    assert circuit.next_probe == later + datetime.timedelta(seconds=200)
+    breaker.record_success(url)
+    assert breaker.get(url).failures == 0
+    assert not breaker.is_open(url, later)
+    with raises(ValueError):
+        CircuitBreaker(threshold=0)
+
+
+def test_circuit_breaker_call_throttled():
+    breaker = CircuitBreaker(threshold=1)
+    function, calls = flaky([THROTTLED_FAILURE])
+    with raises(CrawlError):
+        breaker.call(function, 'http://a.com/')
+    assert breaker.get('http://a.com/') is None
+    assert not breaker.is_open('http://a.com/')
+    function, calls = flaky([SERVER_FAILURE])
+    with raises(CrawlError):
+        breaker.call(function, 'http://a.com/')
+    assert breaker.is_open('http://a.com/')
+
+
+def test_circuit_breaker_persistence(tmpdir):
+    url = 'http://a.com/'
+    breaker = CircuitBreaker(FileSystemRepository(str(tmpdir)), threshold=1)
+    breaker.record_failure(url, CrawlError(url, kind=CLIENT_FAILURE), NOW)
+    breaker = CircuitBreaker(FileSystemRepository(str(tmpdir)), threshold=1)
+    circuit = breaker.get(url)
+    assert circuit.failures == 1
+    assert circuit.kind == CLIENT_FAILURE
+    assert breaker.is_open(url, NOW)
+    assert breaker.get('http://b.com/') is None
+    with raises(TypeError):
+        CircuitBreaker('not a repository')
+
+
+def test_crawl_retry_and_circuit_breaker(fx_http_server, fx_opener):
+    fx_http_server.routes['/atom.xml'] = 200, 'application/atom+xml', atom_xml
+    fx_http_server.routes['/dead.xml'] = 500, 'text/plain', b''
+    urls = [fx_http_server.url('/atom.xml'), fx_http_server.url('/dead.xml')]
+    policy = RetryPolicy(max_attempts=2, base_delay=0)
+    breaker = CircuitBreaker(threshold=1)
+    results = []
+    with raises(CrawlError):
+        for result in crawl(urls, 2, resolve_icon=False,
+                            retry_policy=policy, circuit_breaker=breaker):
+            results.append(result)
+    assert [r.url for r in results] == urls[:1]
+    paths = [path for _, path, _ in fx_http_server.requests]
+    assert paths.count('/dead.xml') == 2
+    assert breaker.get(urls[1]).kind == SERVER_FAILURE
+    assert breaker.is_open(urls[1])
+    assert not breaker.is_open(urls[0])
+    del fx_http_server.requests[:]
+    results = list(crawl(urls, 2, resolve_icon=False,
+                         retry_policy=policy, circuit_breaker=breaker))
+    assert [r.url for r in results] == urls[:1]
+    assert [path for _, path, _ in fx_http_server.requests] == ['/atom.xml']
@@ -0,0 +1,158 @@
+import datetime
+
+from pytest import fixture, raises
+
+from libearth.crawler import CrawlResult, crawl
+from libearth.feed import Entry, Feed, Text
+from libearth.repository import FileSystemRepository
+from libearth.scheduler import (Schedule, Scheduler, get_cache_lifetime,
+                                get_entry_interval)
+from libearth.tz import utc
+
+
+NOW = datetime.datetime(2014, 11, 3, 12, 0, tzinfo=utc)  # Monday
+
+
+def make_feed(*hours_ago):
+    feed = Feed(id='http://example.com/', title=Text(value='Example'),
+                updated_at=NOW)
+    for i, hours in enumerate(hours_ago):
+        feed.entries.append(Entry(
+            id='http://example.com/{0}'.format(i),
+            title=Text(value='Entry {0}'.format(i)),
+            updated_at=NOW - datetime.timedelta(hours=hours)
+        ))
+    return feed
+
+
+def make_result(feed=None, hints=None, headers=None):
+    return CrawlResult('http://example.com/feed', feed, hints,
+                       not_modified=feed is None, headers=headers)
+
+
+@fixture
+def fx_scheduler():
+    return Scheduler(min_interval=60, max_interval=7 * 24 * 60 * 60)
+
+
+def test_get_entry_interval():
+    assert get_entry_interval(make_feed(0, 2, 4, 6)) == 2 * 60 * 60
+    assert get_entry_interval(make_feed(1)) is None
+
+
+def test_get_cache_lifetime():
+    assert get_cache_lifetime(None) is None
+    assert get_cache_lifetime({}) is None
+    assert get_cache_lifetime({'cache-control': 'public, max-age=3600'}) == \
+        3600
+    assert get_cache_lifetime({'cache-control': 'no-cache'}) == 0
+    assert get_cache_lifetime({
+        'date': 'Mon, 03 Nov 2014 12:00:00 GMT',
+        'expires': 'Mon, 03 Nov 2014 14:00:00 GMT'
+    }) == 2 * 60 * 60
+    assert get_cache_lifetime(
+        {'expires': 'Mon, 03 Nov 2014 12:30:00 GMT'},
+        now=NOW
+    ) == 30 * 60
+    assert get_cache_lifetime({'expires': '0'}) is None
+
+
+def test_scheduler_observed_interval(fx_scheduler):
+    assert fx_scheduler.is_due('http://example.com/feed', NOW)
+    schedule = fx_scheduler.update(make_result(make_feed(0, 2, 4)), NOW)
+    assert isinstance(schedule, Schedule)
+    assert schedule.interval == 2 * 60 * 60
+    assert schedule.next_due == NOW + datetime.timedelta(hours=2)
+    assert schedule.idle_crawls == 0
+    assert not fx_scheduler.is_due('http://example.com/feed', NOW)
+    later = NOW + datetime.timedelta(hours=2)
+    assert fx_scheduler.is_due('http://example.com/feed', later)
+    assert fx_scheduler.due(['http://example.com/feed', 'http://new.com/'],
+                            NOW) == ['http://new.com/']
+
+
+def test_scheduler_backoff(fx_scheduler):
+    fx_scheduler.update(make_result(make_feed(0, 1)), NOW)
+    schedule = fx_scheduler.update(make_result(make_feed(0, 1)), NOW)
+    assert schedule.idle_crawls == 1
+    assert schedule.interval == 2 * 60 * 60
+    schedule = fx_scheduler.update(make_result(), NOW)  # not modified
+    assert schedule.idle_crawls == 2
+    assert schedule.interval == 4 * 60 * 60
+    # new entry resets the backoff
+    schedule = fx_scheduler.update(make_result(make_feed(-1, 0)), NOW)
+    assert schedule.idle_crawls == 0
+    assert schedule.interval == 60 * 60
+
+
+def test_scheduler_backoff_overflow():
+    scheduler = Scheduler(max_interval=3600, backoff=2.0)
+    schedule = Schedule(idle_crawls=10000)
+    interval = scheduler.get_interval(make_result(make_feed(0, 0.1)),
+                                      schedule, NOW)
+    assert interval == 3600
+
+
+def test_scheduler_bounds():
+    scheduler = Scheduler(min_interval=600, max_interval=3600)
+    schedule = scheduler.update(make_result(make_feed(0, 0.01)), NOW)
+    assert schedule.interval == 600
+    schedule = scheduler.update(make_result(make_feed(0, 100)), NOW)
+    assert schedule.interval == 3600
+    with raises(ValueError):
+        Scheduler(min_interval=3600, max_interval=600)
+
+
+def test_scheduler_hints(fx_scheduler):
+    schedule = fx_scheduler.update(
+        make_result(make_feed(0, 1), hints={'ttl': 180}),
+        NOW
+    )
+    assert schedule.interval == 3 * 60 * 60
+    schedule = fx_scheduler.update(
+        make_result(make_feed(-1, 0), headers={'cache-control': 'max-age=1'}),
+        NOW
+    )
+    assert schedule.interval == 60 * 60
+    schedule = fx_scheduler.update(
+        make_result(make_feed(-2, 0),
+                    headers={'cache-control': 'max-age=36000'}),
+        NOW
+    )
+    assert schedule.interval == 10 * 60 * 60
+    schedule = fx_scheduler.update(
+        make_result(make_feed(-3, 0),
+                    hints={'skipHours': frozenset([13, 14]),
+                           'skipDays': frozenset(['Tuesday'])}),
+        NOW
+    )
+    assert schedule.next_due == NOW + datetime.timedelta(hours=3)
+    schedule = fx_scheduler.update(
+        make_result(make_feed(-4, -2),
+                    hints={'skipDays': frozenset(['Monday'])}),
+        NOW
+    )
+    assert schedule.next_due == datetime.datetime(2014, 11, 4, tzinfo=utc)
+
+
+def test_scheduler_persistence(tmpdir):
+    repo = FileSystemRepository(str(tmpdir))
+    scheduler = Scheduler(repo)
+    schedule = scheduler.update(make_result(make_feed(0, 2)), NOW)
+    scheduler = Scheduler(FileSystemRepository(str(tmpdir)))
+    loaded = scheduler.get('http://example.com/feed')
+    assert loaded.next_due == schedule.next_due
+    assert loaded.interval == schedule.interval
+    assert loaded.latest_entry_at == NOW
+    assert scheduler.get('http://example.com/other') is None
+    with raises(TypeError):
+        Scheduler('not a repository')
+
+
+def test_crawl_scheduler(fx_opener):
+    scheduler = Scheduler()
+    feeds = ['http://vio.atomtest.com/feed/atom', 'http://rsstest.com/rss.xml']
+    results = list(crawl(feeds, 2, scheduler=scheduler))
+    assert sorted(r.url for r in results) == sorted(feeds)
+    assert all(scheduler.get(url) is not None for url in feeds)
+    assert not list(crawl(feeds, 2, scheduler=scheduler))
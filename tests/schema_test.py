@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import collections
 import io
+import re
 
 from pytest import fixture, mark, raises
 
@@ -9,14 +10,16 @@ from libearth.compat import (IRON_PYTHON, binary_type, text, text_type,
                              string_type)
 from libearth.compat.etree import fromstringlist, tostring
 from libearth.parser.rss2 import parse_rss2
+from libearth.repository import FileIterator
 from libearth.schema import (SCHEMA_XMLNS,
                              Attribute, Child, Codec, Content,
                              DescriptorConflictError, DocumentElement,
                              Element, ElementList, EncodeError, IntegrityError,
-                             Text,
+                             ProjectionError, Text,
                              complete, element_list_for, index_descriptors,
                              inspect_attributes, inspect_child_tags,
-                             inspect_content_tag, inspect_xmlns_set,
+                             inspect_content_tag, inspect_dispatch_table,
+                             inspect_write_plan, inspect_xmlns_set,
                              is_partially_loaded, read, validate, write)
 from libearth.subscribe import SubscriptionList
 
@@ -570,6 +573,47 @@ def test_inspect_content_tag(fx_adhoc_element_type):
     assert content_tag == ('value', element_type.value)
 
 
+def test_inspect_dispatch_table(fx_adhoc_element_type):
+    element_type, text_element_type = fx_adhoc_element_type
+    table = inspect_dispatch_table(element_type)
+    assert len(table) == 3
+    assert table[None, 'name-e'] == (
+        'name', element_type.name, inspect_attributes(element_type)
+    )
+    assert table[None, 'url-e'] == (
+        'url', element_type.url, inspect_attributes(text_element_type)
+    )
+    assert table['http://example.com/', 'dob-e'][:2] == ('dob',
+                                                         element_type.dob)
+    assert inspect_dispatch_table(element_type) is table
+    assert inspect_dispatch_table(text_element_type) == {}
+
+
+def test_inspect_write_plan(fx_adhoc_element_type):
+    element_type, text_element_type = fx_adhoc_element_type
+    required, attributes, content, children = \
+        inspect_write_plan(element_type)
+    assert required == ()
+    assert attributes == (('format_version', element_type.format_version),)
+    assert content is None
+    assert children == (
+        ('name', element_type.name, True),
+        ('url', element_type.url, False),
+        ('dob', element_type.dob, False)
+    )
+    assert inspect_write_plan(element_type) is \
+        inspect_write_plan(element_type)
+    plan = inspect_write_plan(text_element_type)
+    assert plan == ((), (), ('value', text_element_type.value), ())
+
+    class SubElement(element_type):
+        title = Text('title-e', required=True)
+    required, _, _, children = inspect_write_plan(SubElement)
+    assert required == ('title',)
+    assert [attr for attr, _, _ in children] == ['name', 'url', 'dob',
+                                                 'title']
+
+
 class ContentDescriptorConflictElement(Element):
 
     value = Content()
@@ -1322,3 +1366,263 @@ def test_element_list_length_hint(fx_hinted_doc):
     assert len(doc.multi_attr) == 3
     assert len(doc.sorted_children) == 0
     assert consume_log == ['HINT'] or IRON_PYTHON
+
+
+@fixture
+def fx_indexed_doc():
+    doc = TestDoc(title_attr=TextElement(value=u'Title \xe9'),
+                  content_attr=TextElement(value='Content'))
+    for i in range(10):
+        doc.multi_attr.append(TextElement(value='multi {0}'.format(i)))
+    doc.text_multi_attr.extend(['a', 'b'])
+    return b''.join(write(doc, as_bytes=True, index=True))
+
+
+def test_write_index(fx_indexed_doc):
+    tree = fromstringlist([fx_indexed_doc])
+    hints = dict(
+        ((e.attrib['tag'], e.attrib['id']), e.attrib['value'])
+        for e in tree.findall('{' + SCHEMA_XMLNS + '}hint')
+    )
+    assert ('text-multi', 'offsets') not in hints
+    assert hints['multi', 'length'] == '10'
+    head = int(hints['multi', 'head'])
+    assert fx_indexed_doc[:head].endswith(b'>')
+    assert fx_indexed_doc[head:].lstrip().startswith(b'<l')
+    offsets = [int(offset) for offset in hints['multi', 'offsets'].split()]
+    assert len(offsets) == 10
+    for i, offset in enumerate(offsets):
+        chunk = '<multi>multi {0}</multi>'.format(i).encode('utf-8')
+        assert fx_indexed_doc[offset:offset + len(chunk)] == chunk
+    # Offsets read from the document are no more valid when it's rewritten
+    doc = read(TestDoc, [fx_indexed_doc])
+    doc.multi_attr.append(TextElement(value='multi 10'))
+    tree = fromstringlist(write(doc))
+    ids = [e.attrib['id'] for e in tree.findall('{' + SCHEMA_XMLNS + '}hint')]
+    assert 'offsets' not in ids and 'head' not in ids
+
+
+def test_read_index(fx_indexed_doc):
+    chunks = [fx_indexed_doc[i:i + 64]
+              for i in range(0, len(fx_indexed_doc), 64)]
+    doc = read(TestDoc, chunks)
+    element = doc.multi_attr[7]
+    assert element.value == 'multi 7'
+    assert len(doc._data.get(TestDoc.multi_attr, ())) < 7
+    assert [e.value for e in doc.multi_attr[3:5]] == ['multi 3', 'multi 4']
+    assert doc.multi_attr[7] is element
+    assert doc.title_attr.value == u'Title \xe9'
+    assert [e.value for e in doc.multi_attr] == [
+        'multi {0}'.format(i) for i in range(10)
+    ]
+    assert doc.multi_attr[7] is element
+    assert element._parent() is doc
+    assert list(doc.text_multi_attr) == ['a', 'b']
+
+
+@mark.parametrize('mutate', [
+    lambda l: l.__delitem__(0),
+    lambda l: l.__setitem__(0, TextElement(value='new')),
+    lambda l: l.insert(0, TextElement(value='new')),
+])
+@mark.parametrize('seek_first', [False, True])
+def test_read_index_mutated(mutate, seek_first, fx_indexed_doc):
+    expected = ['multi {0}'.format(i) for i in range(10)]
+    mutate(expected)
+    expected = [getattr(e, 'value', e) for e in expected]
+    chunks = [fx_indexed_doc[i:i + 64]
+              for i in range(0, len(fx_indexed_doc), 64)]
+    doc = read(TestDoc, chunks)
+    if seek_first:
+        element = doc.multi_attr[7]
+    mutate(doc.multi_attr)
+    # Offsets don't match indices of the mutated list anymore
+    assert doc.multi_attr[8].value == expected[8]
+    assert [e.value for e in doc.multi_attr] == expected
+    if seek_first:
+        assert element in doc.multi_attr
+
+
+def test_read_index_file(fx_indexed_doc, tmpdir):
+    path = tmpdir.join('doc.xml')
+    path.write(fx_indexed_doc, mode='wb')
+    doc = read(TestDoc, FileIterator(str(path), 64))
+    assert doc.multi_attr[8].value == 'multi 8'
+    assert len(doc._data.get(TestDoc.multi_attr, ())) < 8
+    assert doc.multi_attr[2].value == 'multi 2'
+    assert [e.value for e in doc.multi_attr][8] == 'multi 8'
+
+
+def test_read_index_not_seekable(fx_indexed_doc):
+    chunks = [fx_indexed_doc[i:i + 64]
+              for i in range(0, len(fx_indexed_doc), 64)]
+    doc = read(TestDoc, iter(chunks))
+    assert doc.multi_attr[7].value == 'multi 7'
+    assert len(doc._data[TestDoc.multi_attr]) >= 8
+    # Falls back to sequential parsing if offsets are broken
+    broken = re.sub(b'(id="offsets" value=")([^"]*)',
+                    lambda m: m.group(1) + m.group(2).replace(b' ', b'1 '),
+                    fx_indexed_doc)
+    doc = read(TestDoc, [broken[i:i + 64] for i in range(0, len(broken), 64)])
+    assert doc.multi_attr[7].value == 'multi 7'
+    assert len(doc._data[TestDoc.multi_attr]) >= 8
+
+
+class VerbatimChild(Element):
+
+    attr = Attribute('attr')
+    value = Text('value')
+    items = Text('item', multiple=True)
+
+
+class VerbatimDoc(DocumentElement):
+
+    __tag__ = 'verbatim'
+    title = Text('title')
+    children = Child('child', VerbatimChild, multiple=True)
+
+
+@fixture
+def fx_verbatim_source():
+    doc = VerbatimDoc(title='Title', children=[
+        VerbatimChild(attr=str(i), value=u'\xe9 {0}'.format(i),
+                      items=['a', 'b'])
+        for i in range(3)
+    ])
+    source = b''.join(write(doc, as_bytes=True))
+    # Serializing it again normalizes the double space
+    return source.replace(b'<child attr', b'<child  attr')
+
+
+def write_bytes(doc, **kwargs):
+    kwargs.setdefault('verbatim', True)
+    return b''.join(write(doc, as_bytes=True, **kwargs))
+
+
+def test_write_verbatim(fx_verbatim_source):
+    doc = read(VerbatimDoc, [fx_verbatim_source], record=True)
+    assert write_bytes(doc) == fx_verbatim_source
+    assert b'<child  attr' not in write_bytes(doc, verbatim=False)
+    doc.title = 'Changed'
+    result = write_bytes(doc)
+    assert b'<title>Changed</title>' in result
+    assert result.count(b'<child  attr') == 3
+
+
+def test_write_verbatim_opt_in(fx_verbatim_source):
+    doc = read(VerbatimDoc, [fx_verbatim_source])
+    assert doc.children[0]._span is None
+    assert b'<child  attr' not in write_bytes(doc)
+    doc = read(VerbatimDoc, [fx_verbatim_source], record=True)
+    assert b'<child  attr' not in b''.join(write(doc, as_bytes=True))
+
+
+@mark.parametrize('mutate', [
+    lambda child: setattr(child, 'attr', 'changed'),
+    lambda child: setattr(child, 'value', 'changed'),
+    lambda child: child.items.append('changed'),
+    lambda child: setattr(child, 'items', ['changed']),
+])
+def test_write_verbatim_changed(mutate, fx_verbatim_source):
+    doc = read(VerbatimDoc, [fx_verbatim_source], record=True)
+    mutate(doc.children[1])
+    result = write_bytes(doc)
+    assert b'changed' in result
+    assert result.count(b'<child  attr') == 2
+    expected = write_bytes(doc, verbatim=False)
+    for i in 0, 2:
+        expected = expected.replace(
+            '<child attr="{0}"'.format(i).encode('ascii'),
+            '<child  attr="{0}"'.format(i).encode('ascii')
+        )
+    assert result == expected
+
+
+def test_write_verbatim_mutate_list(fx_verbatim_source):
+    doc = read(VerbatimDoc, [fx_verbatim_source], record=True)
+    doc.children.insert(0, VerbatimChild(attr='new'))
+    del doc.children[2]
+    result = write_bytes(doc)
+    assert b'<child attr="new"' in result
+    assert result.count(b'<child  attr') == 2
+
+
+def test_write_verbatim_incompatible(fx_verbatim_source):
+    doc = read(VerbatimDoc, [fx_verbatim_source], record=True)
+    assert b'<child  attr' not in write_bytes(doc, indent='    ')
+    assert b'<child  attr' not in write_bytes(doc, hints=False)
+    assert b'<child  attr' in write_bytes(doc)
+
+
+def test_write_verbatim_chunks(fx_verbatim_source):
+    chunks = [fx_verbatim_source[i:i + 16]
+              for i in range(0, len(fx_verbatim_source), 16)]
+    doc = read(VerbatimDoc, chunks, record=True)
+    assert doc.children[0].value == u'\xe9 0'
+    assert write_bytes(doc) == fx_verbatim_source
+    doc = read(VerbatimDoc, [fx_verbatim_source.decode('utf-8')],
+               record=True)
+    assert write_bytes(doc) == fx_verbatim_source
+
+
+def test_write_verbatim_index(fx_indexed_doc):
+    chunks = [fx_indexed_doc[i:i + 64]
+              for i in range(0, len(fx_indexed_doc), 64)]
+    doc = read(TestDoc, chunks, record=True)
+    element = doc.multi_attr[7]
+    assert write_bytes(doc, index=True) == fx_indexed_doc
+    assert element._span[2] is not None
+
+
+def test_element_list_eq(fx_test_doc):
+    doc, _ = fx_test_doc
+    assert doc.text_multi_attr == ['a', 'b']
+    assert doc.text_multi_attr != ['a']
+    assert doc.text_multi_attr != 'ab'
+    assert not (doc.text_multi_attr != ('a', 'b'))
+
+
+def test_read_exclude(fx_verbatim_source):
+    doc = read(VerbatimDoc, [fx_verbatim_source],
+               exclude=[VerbatimChild.value, VerbatimChild.items])
+    assert doc.title == 'Title'
+    assert [child.attr for child in doc.children] == ['0', '1', '2']
+    with raises(ProjectionError):
+        doc.children[0].value
+    with raises(ProjectionError):
+        doc.children[0].items
+    assert not doc.children[0]._data
+    doc.children[1].value = 'assigned'
+    assert doc.children[1].value == 'assigned'
+    doc.children[1].items = ['assigned']
+    assert doc.children[1].items == ['assigned']
+    with raises(ProjectionError):
+        write(doc)
+    with raises(TypeError):
+        read(VerbatimDoc, [fx_verbatim_source], exclude=['value'])
+
+
+def test_read_exclude_lazy(fx_test_doc):
+    doc, _ = fx_test_doc
+    source = b''.join(write(doc, as_bytes=True))
+    chunks = [source[i:i + 16] for i in range(0, len(source), 16)]
+    doc = read(TestDoc, chunks, exclude=[TestDoc.content_attr])
+    with raises(ProjectionError):
+        doc.content_attr
+    # The rest of the document isn't parsed to look for the excluded child
+    assert TestDoc.ns_element_attr not in doc._data
+    assert doc.ns_element_attr.value == 'Namespace test'
+
+
+def test_read_exclude_nested_hints(fx_test_doc):
+    doc, _ = fx_test_doc
+    source = b''.join(write(doc, as_bytes=True))
+    doc = read(TestDoc, [source], exclude=[TestDoc.multi_attr,
+                                           TestDoc.ns_element_attr])
+    assert doc.title_attr.value == u'제목 test'
+    assert doc.content_attr.value == 'Content test'
+    assert doc.text_multi_attr == ['a', 'b']
+    with raises(ProjectionError):
+        len(doc.multi_attr)
+    with raises(ProjectionError):
+        doc.ns_element_attr
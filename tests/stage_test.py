@@ -6,11 +6,12 @@ import threading
 from pytest import fixture, raises
 
 from libearth.compat import IRON_PYTHON, binary_type
+from libearth.feed import Entry, Feed, Text
 from libearth.repository import (FileSystemRepository, Repository,
                                  RepositoryKeyError)
-from libearth.schema import read
+from libearth.schema import read, write
 from libearth.session import MergeableDocumentElement, Session
-from libearth.stage import (BaseStage, Directory, DirtyBuffer, Route,
+from libearth.stage import (BaseStage, Directory, DirtyBuffer, Route, Stage,
                             TransactionError, compile_format_to_pattern)
 from libearth.tz import now
 
@@ -365,3 +366,48 @@ def test_doubly_begun_transaction(fx_stage):
         with raises(TransactionError):
             with fx_stage:
                 pass
+
+
+def test_stage_write_verbatim(fx_session, monkeypatch):
+    copied = []
+    write_source = write.write_source
+
+    def count_copied(self, element, buffer_):
+        result = write_source(self, element, buffer_)
+        copied.append(result)
+        return result
+    monkeypatch.setattr(write, 'write_source', count_copied)
+    stage = Stage(fx_session, MemoryRepository())
+    feed = Feed(id='urn:feed', title=Text(value='Feed'), updated_at=now(),
+                entries=[Entry(id='urn:e{0}'.format(i),
+                               title=Text(value=str(i)), updated_at=now())
+                         for i in range(50)])
+    with stage:
+        stage.feeds['feed'] = feed
+    del copied[:]
+    with stage:
+        feed = stage.feeds['feed']
+        feed.entries[3].read = True
+        stage.feeds['feed'] = feed
+    # Only the changed entry is serialized again; the title and
+    # other 49 entries are copied from the source
+    assert copied.count(True) == 50
+    assert copied.count(False) == 1
+    with stage:
+        assert stage.feeds['feed'].entries[3].read
+
+
+def test_stage_index(fx_session):
+    feed = Feed(id='urn:feed', title=Text(value='Feed'), updated_at=now(),
+                entries=[Entry(id='urn:e{0}'.format(i),
+                               title=Text(value=str(i)), updated_at=now())
+                         for i in range(3)])
+    key = 'feeds/feed/{0}.xml'.format(fx_session.identifier).split('/')
+    for index in False, True:
+        repo = MemoryRepository()
+        stage = Stage(fx_session, repo, index=index)
+        assert stage.index is index
+        with stage:
+            stage.feeds['feed'] = feed
+        xml = b''.join(repo.read(key))
+        assert (b'id="offsets"' in xml) is index
@@ -1,5 +1,5 @@
 from datetime import datetime
-from pytest import fixture, mark
+from pytest import fixture, mark, raises
 
 from libearth.feed import Feed, Link, Person, Text
 from libearth.session import Session
@@ -325,6 +325,51 @@ def fx_headless_subscription_list():
     return read(SubscriptionList, [XML_NO_HEAD])
 
 
+def test_subscription_set_relocate(fx_recursive_subscription_list):
+    subs = fx_recursive_subscription_list
+    riot = subs.categories['Game'].categories['Riot']
+    lol, = riot
+    feed_id = lol.feed_id
+    assert subs.relocate('http://leagueoflegend.com',
+                         'https://leagueoflegends.com/') == 1
+    moved, = riot
+    assert moved.feed_uri == 'https://leagueoflegends.com/'
+    assert moved.feed_id == feed_id
+    assert moved.label == 'LOL'
+    assert lol.deleted
+    assert not subs.contains(lol, recursively=True)
+    assert subs.contains(moved, recursively=True)
+    assert subs.relocate('http://leagueoflegend.com',
+                         'https://leagueoflegends.com/') == 0
+    with raises(TypeError):
+        subs.relocate('https://leagueoflegends.com/', None)
+
+
+def test_subscription_set_relocate_attributes():
+    subs = SubscriptionList()
+    sub = Subscription(label='Feed', _title='Feed title',
+                       feed_uri='http://example.com/feed.xml',
+                       alternate_uri='http://example.com/',
+                       icon_uri='http://example.com/favicon.ico',
+                       _category=['a', 'b'], _breakpoint=True)
+    subs.children.append(sub)  # created_at is missing
+    assert subs.relocate('http://example.com/feed.xml',
+                         'http://example.com/new.xml') == 1
+    assert sub.deleted
+    moved, = subs
+    assert moved.feed_uri == 'http://example.com/new.xml'
+    assert moved.feed_id == sub.feed_id
+    assert moved.label == 'Feed'
+    assert moved._title == 'Feed title'
+    assert moved.alternate_uri == 'http://example.com/'
+    assert moved.icon_uri == 'http://example.com/favicon.ico'
+    assert moved._category == ['a', 'b']
+    assert moved._breakpoint is True
+    assert moved.created_at is not None
+    assert not moved.deleted
+    assert sub.created_at is None
+
+
 def test_no_head(fx_headless_subscription_list):
     subs = fx_headless_subscription_list
     assert subs.owner is None